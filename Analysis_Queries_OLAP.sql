@@ -29,4 +29,100 @@ INNER JOIN DimSite ds ON fj.SiteKey = ds.SiteKey
 INNER JOIN DimDate dd ON fj.DateQueryReceivedKey = dd.DateKey
 WHERE dd.Year = 2024
 GROUP BY ds.SiteLongName
-ORDER BY ds.SiteLongName;
\ No newline at end of file
+ORDER BY ds.SiteLongName;
+
+/**** CUBE-BACKED QUERIES ****/
+-- The same answers read from the aggregate tables the ETL keeps up to date, instead of scanning FactJob or Job.
+-- Each reads a few rows per site, implant or status however many jobs have been logged.
+
+/**** NUMBER OF JOBS PER SITE PER QUARTER (AGGREGATE) ****/
+
+SELECT
+	ds.SiteLongName,
+	a.Year,
+	a.Quarter,
+	a.JobsLogged AS JobCount
+FROM AggJobsBySiteQuarter a
+INNER JOIN DimSite ds ON a.SiteKey = ds.SiteKey
+WHERE a.Year = 2024 AND a.JobsLogged > 0
+ORDER BY ds.SiteLongName, a.Quarter;
+
+/**** PIVOT QUERY FOR JOBS PER SITE PER QUARTER (AGGREGATE) ****/
+
+SELECT
+	ds.SiteLongName AS Site,
+	SUM (CASE WHEN a.Quarter = 1 THEN a.JobsQueryReceived ELSE 0 END) AS Q1,
+	SUM (CASE WHEN a.Quarter = 2 THEN a.JobsQueryReceived ELSE 0 END) AS Q2,
+	SUM (CASE WHEN a.Quarter = 3 THEN a.JobsQueryReceived ELSE 0 END) AS Q3,
+	SUM (CASE WHEN a.Quarter = 4 THEN a.JobsQueryReceived ELSE 0 END) AS Q4,
+	SUM (a.JobsQueryReceived) AS Total
+FROM AggJobsBySiteQuarter a
+INNER JOIN DimSite ds ON a.SiteKey = ds.SiteKey
+WHERE a.Year = 2024
+GROUP BY ds.SiteLongName
+HAVING SUM (a.JobsQueryReceived) > 0
+ORDER BY ds.SiteLongName;
+
+/**** NUMBER OF JOBS PER SITE (AGGREGATE) ****/
+
+SELECT
+	ds.SiteLongName,
+	SUM(a.JobsLogged) AS JobsPerSite
+FROM AggJobsBySiteQuarter a
+INNER JOIN DimSite ds ON a.SiteKey = ds.SiteKey
+GROUP BY ds.SiteLongName
+ORDER BY JobsPerSite DESC;
+
+/**** NUMBER OF OVERDUE JOBS (AGGREGATE) ****/
+-- Overdue means the physics target date is today or earlier. This matches PhysicsTargetDate < GETDATE() in
+-- Analysis_Queries_OLTP.sql, where a target due today (midnight) has already passed.
+
+SELECT SUM(a.JobCount) AS OverdueJobCount
+FROM AggStatusTargetDate a
+INNER JOIN DimJobStatus js ON a.CurrentStatusKey = js.StatusKey
+WHERE a.PhysicsTargetDateKey <= YEAR(GETDATE()) * 10000 + MONTH(GETDATE()) * 100 + DAY(GETDATE())
+	AND js.StatusName IN ('Waiting','Planned','Waiting Others');
+
+/**** TOP 5 IMPLANT TYPES (AGGREGATE) ****/
+
+SELECT TOP 5
+	di.ImplantName,
+	SUM(a.JobCount) AS JobCount
+FROM AggImplantSafety a
+INNER JOIN DimImplant di ON a.ImplantKey = di.ImplantKey
+GROUP BY di.ImplantName
+ORDER BY JobCount DESC;
+
+/**** IMPLANT TYPES BY MR SAFETY CONDITION (AGGREGATE) ****/
+
+SELECT
+	di.ImplantName,
+	SUM (CASE WHEN a.MRSafetyKey = 1 THEN a.JobCount ELSE 0 END) AS Conditional,
+	SUM (CASE WHEN a.MRSafetyKey = 2 THEN a.JobCount ELSE 0 END) AS Safe,
+	SUM (CASE WHEN a.MRSafetyKey = 3 THEN a.JobCount ELSE 0 END) AS Unsafe,
+	SUM (CASE WHEN a.MRSafetyKey = 4 THEN a.JobCount ELSE 0 END) AS OffLabel,
+	SUM (CASE WHEN a.MRSafetyKey = 5 THEN a.JobCount ELSE 0 END) AS RiskAssess
+FROM AggImplantSafety a
+INNER JOIN DimImplant di ON a.ImplantKey = di.ImplantKey
+GROUP BY di.ImplantName
+ORDER BY di.ImplantName;
+
+/**** IMPLANT TYPES BY MR SAFETY CONDITION PERCENTAGE (AGGREGATE) ****/
+-- MRSafetyKey 0 holds jobs with no MR safety category, which are left out of the percentages
+
+SELECT
+	di.ImplantName,
+	ROUND(100 * SUM(CASE WHEN a.MRSafetyKey = 1 THEN a.JobCount ELSE 0 END) /
+			NULLIF(SUM(CASE WHEN a.MRSafetyKey <> 0 THEN a.JobCount ELSE 0 END), 0),0) AS ConditionalPercentage,
+	ROUND(100 * SUM(CASE WHEN a.MRSafetyKey = 2 THEN a.JobCount ELSE 0 END) /
+			NULLIF(SUM(CASE WHEN a.MRSafetyKey <> 0 THEN a.JobCount ELSE 0 END), 0),0) AS SafePercentage,
+	ROUND(100 * SUM(CASE WHEN a.MRSafetyKey = 3 THEN a.JobCount ELSE 0 END) /
+			NULLIF(SUM(CASE WHEN a.MRSafetyKey <> 0 THEN a.JobCount ELSE 0 END), 0),0) AS UnsafePercentage,
+	ROUND(100 * SUM(CASE WHEN a.MRSafetyKey = 4 THEN a.JobCount ELSE 0 END) /
+			NULLIF(SUM(CASE WHEN a.MRSafetyKey <> 0 THEN a.JobCount ELSE 0 END), 0),0) AS OffLabelPercentage,
+	ROUND(100 * SUM(CASE WHEN a.MRSafetyKey = 5 THEN a.JobCount ELSE 0 END) /
+			NULLIF(SUM(CASE WHEN a.MRSafetyKey <> 0 THEN a.JobCount ELSE 0 END), 0),0) AS RiskAssessPercentage
+FROM AggImplantSafety a
+INNER JOIN DimImplant di ON a.ImplantKey = di.ImplantKey
+GROUP BY di.ImplantName
+ORDER BY di.ImplantName;
\ No newline at end of file
@@ -282,6 +282,9 @@ DROP TABLE Status_Temp
 TRUNCATE TABLE Actions_Temp
 DROP TABLE Actions_Temp
 
+TRUNCATE TABLE Quarantine_Temp
+DROP TABLE Quarantine_Temp
+
 -- Add CreatedDate and ModifiedDate to each table
 
 ALTER TABLE ActionLog
@@ -359,3 +362,18 @@ INCLUDE (UrgencyType);
 CREATE NONCLUSTERED INDEX IX_StatusLog_JobId_DateStatusChanged
 ON StatusLog (JobId, ChangedDate DESC);
 
+/**** STORE TARGET DATES ****/
+-- PTL and Physics target dates are calculated from the rules in target_dates.py and stored, so the views
+-- and the OLAP ETL read them instead of working them out for every row.
+-- Kept up to date by target_dates.py, or by the generated UPDATE in Insert_Data_MRSafetyDB.sql.
+
+ALTER TABLE Job
+ADD PTLTargetDate DATETIME;		--Depends on urgency, patient type and MRI requested/planned dates
+
+ALTER TABLE Job
+ADD PhysicsTargetDate DATETIME;	--Depends on urgency, patient type and the date the job's latest query was received (or MRI planned date)
+
+CREATE INDEX IX_Job_PTLTargetDate ON Job (PTLTargetDate);
+
+CREATE INDEX IX_Job_PhysicsTargetDate ON Job (PhysicsTargetDate);
+
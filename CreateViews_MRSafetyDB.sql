@@ -14,33 +14,11 @@ SELECT
     j.DateMRIRequested,
     j.DateMRIPlanned,
     
-    -- PTL TARGET DATE --
-    CASE
-        WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Inpatient' THEN j.DateMRIRequested
-        WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 28, j.DateMRIRequested)
-        WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Inpatient' THEN j.DateMRIRequested
-        WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 14, j.DateMRIRequested)
-        WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Inpatient' THEN j.DateMRIRequested
-        WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 7, j.DateMRIRequested)
-        WHEN u.UrgencyCode = 7 THEN DATEADD(DAY, 2, j.DateMRIRequested)
-        WHEN u.UrgencyCode = 9 THEN DATEADD(DAY, -28, j.DateMRIPlanned)
-        WHEN u.UrgencyCode = 15 THEN DATEADD(DAY, 2, j.DateMRIRequested)
-        ELSE DATEADD(DAY, 14, j.DateMRIRequested)
-    END AS PTLTargetDate,
+    -- PTL TARGET DATE (stored by target_dates.py) --
+    j.PTLTargetDate,
 
-    -- PHYSICS TARGET DATE --
-    CASE
-        WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
-        WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 28, q.DateQueryReceived)
-        WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
-        WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 14, q.DateQueryReceived)
-        WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
-        WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 7, q.DateQueryReceived)
-        WHEN u.UrgencyCode = 7 THEN DATEADD(DAY, 2, q.DateQueryReceived)
-        WHEN u.UrgencyCode = 9 THEN DATEADD(DAY, -28, j.DateMRIPlanned)
-        WHEN u.UrgencyCode = 15 THEN DATEADD(DAY, 2, q.DateQueryReceived)
-        ELSE DATEADD(DAY, 14, q.DateQueryReceived)
-    END AS PhysicsTargetDate,
+    -- PHYSICS TARGET DATE (stored by target_dates.py) --
+    j.PhysicsTargetDate,
 
     i.ImplantName,
     mr.MRSafetyName,
@@ -104,6 +82,8 @@ GROUP BY
     u.UrgencyType, 
 	j.DateMRIRequested,
     j.DateMRIPlanned,
+    j.PTLTargetDate,
+    j.PhysicsTargetDate,
     i.ImplantName, 
     mr.MRSafetyName;
 GO
@@ -125,33 +105,11 @@ SELECT
     j.DateMRIRequested,
     j.DateMRIPlanned,
     
-    -- PTL TARGET DATE --
-    CASE
-        WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Inpatient' THEN j.DateMRIRequested
-        WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 28, j.DateMRIRequested)
-        WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Inpatient' THEN j.DateMRIRequested
-        WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 14, j.DateMRIRequested)
-        WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Inpatient' THEN j.DateMRIRequested
-        WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 7, j.DateMRIRequested)
-        WHEN u.UrgencyCode = 7 THEN DATEADD(DAY, 2, j.DateMRIRequested)
-        WHEN u.UrgencyCode = 9 THEN DATEADD(DAY, -28, j.DateMRIPlanned)
-        WHEN u.UrgencyCode = 15 THEN DATEADD(DAY, 2, j.DateMRIRequested)
-        ELSE DATEADD(DAY, 14, j.DateMRIRequested)
-    END AS PTLTargetDate,
+    -- PTL TARGET DATE (stored by target_dates.py) --
+    j.PTLTargetDate,
 
-    -- PHYSICS TARGET DATE --
-    CASE
-        WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
-        WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 28, q.DateQueryReceived)
-        WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
-        WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 14, q.DateQueryReceived)
-        WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
-        WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 7, q.DateQueryReceived)
-        WHEN u.UrgencyCode = 7 THEN DATEADD(DAY, 2, q.DateQueryReceived)
-        WHEN u.UrgencyCode = 9 THEN DATEADD(DAY, -28, j.DateMRIPlanned)
-        WHEN u.UrgencyCode = 15 THEN DATEADD(DAY, 2, q.DateQueryReceived)
-        ELSE DATEADD(DAY, 14, q.DateQueryReceived)
-    END AS PhysicsTargetDate,
+    -- PHYSICS TARGET DATE (stored by target_dates.py) --
+    j.PhysicsTargetDate,
 	q.QueryText,
 	
 	-- LAST ACTION --
@@ -227,6 +185,8 @@ GROUP BY
     u.UrgencyType, 
 	j.DateMRIRequested,
     j.DateMRIPlanned,
+    j.PTLTargetDate,
+    j.PhysicsTargetDate,
 	q.QueryText,
     i.ImplantName, 
     mr.MRSafetyName,
@@ -260,33 +220,11 @@ SELECT
     j.DateMRIRequested,
     j.DateMRIPlanned,
     
-    -- PTL TARGET DATE --
-    CASE
-        WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Inpatient' THEN j.DateMRIRequested
-        WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 28, j.DateMRIRequested)
-        WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Inpatient' THEN j.DateMRIRequested
-        WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 14, j.DateMRIRequested)
-        WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Inpatient' THEN j.DateMRIRequested
-        WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 7, j.DateMRIRequested)
-        WHEN u.UrgencyCode = 7 THEN DATEADD(DAY, 2, j.DateMRIRequested)
-        WHEN u.UrgencyCode = 9 THEN DATEADD(DAY, -28, j.DateMRIPlanned)
-        WHEN u.UrgencyCode = 15 THEN DATEADD(DAY, 2, j.DateMRIRequested)
-        ELSE DATEADD(DAY, 14, j.DateMRIRequested)
-    END AS PTLTargetDate,
+    -- PTL TARGET DATE (stored by target_dates.py) --
+    j.PTLTargetDate,
 
-    -- PHYSICS TARGET DATE --
-    CASE
-        WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
-        WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 28, q.DateQueryReceived)
-        WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
-        WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 14, q.DateQueryReceived)
-        WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
-        WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 7, q.DateQueryReceived)
-        WHEN u.UrgencyCode = 7 THEN DATEADD(DAY, 2, q.DateQueryReceived)
-        WHEN u.UrgencyCode = 9 THEN DATEADD(DAY, -28, j.DateMRIPlanned)
-        WHEN u.UrgencyCode = 15 THEN DATEADD(DAY, 2, q.DateQueryReceived)
-        ELSE DATEADD(DAY, 14, q.DateQueryReceived)
-    END AS PhysicsTargetDate,
+    -- PHYSICS TARGET DATE (stored by target_dates.py) --
+    j.PhysicsTargetDate,
 
     i.ImplantName,
     mr.MRSafetyName,
@@ -325,6 +263,8 @@ GROUP BY
     u.UrgencyType, 
 	j.DateMRIRequested,
     j.DateMRIPlanned,
+    j.PTLTargetDate,
+    j.PhysicsTargetDate,
     i.ImplantName, 
     mr.MRSafetyName,
 	cs.CurrentStatus,
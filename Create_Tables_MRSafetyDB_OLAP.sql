@@ -198,6 +198,10 @@ CREATE TABLE DimStaff (
 ALTER TABLE DimDate
 ADD Week INT NOT NULL
 
+-- ISO 8601 week number (weeks start on Monday, week 1 holds the first Thursday of the year)
+ALTER TABLE DimDate
+ADD IsoWeek INT
+
 DROP TABLE DimMRSafety
 DROP TABLE DimPatientType
 DROP TABLE DimContactMethod
@@ -219,4 +223,54 @@ FOREIGN KEY (StaffKey) REFERENCES DimStaff(StaffKey)
 ALTER TABLE BridgeStaffAssigned
 WITH NOCHECK
 ADD CONSTRAINT FK_BridgeStaffAssigned_FactJob
-FOREIGN KEY (JobKey) REFERENCES FactJob(JobKey)
\ No newline at end of file
+FOREIGN KEY (JobKey) REFERENCES FactJob(JobKey)
+
+/**** CREATE ETL CONTROL TABLE ****/
+-- Start of the last successful ETL run for each OLAP table, written by olap_etl.py.
+-- Each MERGE in ETL_MRSafetyDB_OLAP.sql only reads OLTP rows modified since then.
+
+CREATE TABLE ETLControl (
+	TableName NVARCHAR(128) PRIMARY KEY,
+	LastETLRunTime DATETIME NOT NULL
+);
+
+/**** CREATE AGGREGATE TABLES ****/
+-- Job counts kept up to date by olap_etl.py after each FactJob load (see update_aggregates), so the analysis
+-- queries read a few rows per site, implant or status instead of scanning FactJob.
+-- A missing date is counted under Year 0, Quarter 0 and a missing MR safety category under MRSafetyKey 0.
+
+CREATE TABLE AggJobsBySiteQuarter (
+	SiteKey INT NOT NULL,
+	Year INT NOT NULL,
+	Quarter INT NOT NULL,
+	JobsLogged INT NOT NULL,			-- Jobs logged in the quarter
+	JobsQueryReceived INT NOT NULL,		-- Jobs whose query was received in the quarter
+	PRIMARY KEY (SiteKey, Year, Quarter)
+);
+
+CREATE TABLE AggImplantSafety (
+	ImplantKey INT NOT NULL,
+	MRSafetyKey INT NOT NULL,
+	JobCount INT NOT NULL,
+	PRIMARY KEY (ImplantKey, MRSafetyKey)
+);
+
+CREATE TABLE AggStatusTargetDate (
+	CurrentStatusKey INT NOT NULL,
+	PhysicsTargetDateKey INT NOT NULL,
+	JobCount INT NOT NULL,
+	PRIMARY KEY (CurrentStatusKey, PhysicsTargetDateKey)
+);
+
+-- FactJob columns each job had when it was last counted in the aggregate tables, so a changed job can be
+-- taken out of its old counts without scanning FactJob
+CREATE TABLE AggJobState (
+	JobId INT PRIMARY KEY,
+	SiteKey INT,
+	DateJobLoggedKey INT,
+	DateQueryReceivedKey INT,
+	ImplantKey INT,
+	MRSafetyKey INT,
+	CurrentStatusKey INT,
+	PhysicsTargetDateKey INT
+);
@@ -190,4 +190,92 @@ BEGIN
     WHERE CheckId IN (SELECT DISTINCT CheckId FROM Inserted);
 END;
 GO
+-- Target date triggers, generated by "python target_dates.py --print-triggers" from the rules in target_dates.py.
+-- Change the rules there and regenerate, rather than editing these triggers.
+-- Target dates for Job
+CREATE TRIGGER trg_Job_TargetDates
+ON Job
+AFTER INSERT, UPDATE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    IF NOT EXISTS (SELECT 1 FROM Inserted) AND NOT EXISTS (SELECT 1 FROM Deleted)
+        RETURN;
+    IF EXISTS (SELECT 1 FROM Inserted) AND NOT (UPDATE(UrgencyId) OR UPDATE(PatientTypeId) OR UPDATE(DateMRIPlanned) OR UPDATE(DateMRIRequested))
+        RETURN;
+    UPDATE j
+    SET PTLTargetDate = t.TargetDate
+    FROM Job j
+    LEFT JOIN Urgency u ON j.UrgencyId = u.UrgencyId
+    LEFT JOIN PatientType pt ON j.PatientTypeId = pt.PatientTypeId
+    CROSS APPLY (SELECT CASE
+    	WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Inpatient' THEN j.DateMRIRequested
+    	WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 28, j.DateMRIRequested)
+    	WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Inpatient' THEN j.DateMRIRequested
+    	WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 14, j.DateMRIRequested)
+    	WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Inpatient' THEN j.DateMRIRequested
+    	WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 7, j.DateMRIRequested)
+    	WHEN u.UrgencyCode = 7 THEN DATEADD(DAY, 2, j.DateMRIRequested)
+    	WHEN u.UrgencyCode = 9 THEN DATEADD(DAY, -28, j.DateMRIPlanned)
+    	WHEN u.UrgencyCode = 15 THEN DATEADD(DAY, 2, j.DateMRIRequested)
+    	ELSE DATEADD(DAY, 14, j.DateMRIRequested)
+    END AS TargetDate) t
+    WHERE EXISTS (SELECT j.PTLTargetDate EXCEPT SELECT t.TargetDate)
+    	AND j.JobId IN (SELECT JobId FROM Inserted);
+
+    UPDATE j
+    SET PhysicsTargetDate = t.TargetDate
+    FROM Job j
+    LEFT JOIN Urgency u ON j.UrgencyId = u.UrgencyId
+    LEFT JOIN PatientType pt ON j.PatientTypeId = pt.PatientTypeId
+    LEFT JOIN Query q ON q.QueryId = (SELECT TOP 1 QueryId FROM Query WHERE JobId = j.JobId ORDER BY DateQueryReceived DESC, QueryId DESC)
+    CROSS APPLY (SELECT CASE
+    	WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
+    	WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 28, q.DateQueryReceived)
+    	WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
+    	WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 14, q.DateQueryReceived)
+    	WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
+    	WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 7, q.DateQueryReceived)
+    	WHEN u.UrgencyCode = 7 THEN DATEADD(DAY, 2, q.DateQueryReceived)
+    	WHEN u.UrgencyCode = 9 THEN DATEADD(DAY, -28, j.DateMRIPlanned)
+    	WHEN u.UrgencyCode = 15 THEN DATEADD(DAY, 2, q.DateQueryReceived)
+    	ELSE DATEADD(DAY, 14, q.DateQueryReceived)
+    END AS TargetDate) t
+    WHERE EXISTS (SELECT j.PhysicsTargetDate EXCEPT SELECT t.TargetDate)
+    	AND j.JobId IN (SELECT JobId FROM Inserted);
+END;
+GO
+-- Target dates for Query
+CREATE TRIGGER trg_Query_TargetDates
+ON Query
+AFTER INSERT, UPDATE, DELETE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    IF NOT EXISTS (SELECT 1 FROM Inserted) AND NOT EXISTS (SELECT 1 FROM Deleted)
+        RETURN;
+    IF EXISTS (SELECT 1 FROM Inserted) AND NOT (UPDATE(JobId) OR UPDATE(DateQueryReceived))
+        RETURN;
+    UPDATE j
+    SET PhysicsTargetDate = t.TargetDate
+    FROM Job j
+    LEFT JOIN Urgency u ON j.UrgencyId = u.UrgencyId
+    LEFT JOIN PatientType pt ON j.PatientTypeId = pt.PatientTypeId
+    LEFT JOIN Query q ON q.QueryId = (SELECT TOP 1 QueryId FROM Query WHERE JobId = j.JobId ORDER BY DateQueryReceived DESC, QueryId DESC)
+    CROSS APPLY (SELECT CASE
+    	WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
+    	WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 28, q.DateQueryReceived)
+    	WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
+    	WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 14, q.DateQueryReceived)
+    	WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
+    	WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 7, q.DateQueryReceived)
+    	WHEN u.UrgencyCode = 7 THEN DATEADD(DAY, 2, q.DateQueryReceived)
+    	WHEN u.UrgencyCode = 9 THEN DATEADD(DAY, -28, j.DateMRIPlanned)
+    	WHEN u.UrgencyCode = 15 THEN DATEADD(DAY, 2, q.DateQueryReceived)
+    	ELSE DATEADD(DAY, 14, q.DateQueryReceived)
+    END AS TargetDate) t
+    WHERE EXISTS (SELECT j.PhysicsTargetDate EXCEPT SELECT t.TargetDate)
+    	AND j.JobId IN (SELECT JobId FROM Inserted UNION SELECT JobId FROM Deleted);
+END;
+GO
 
@@ -1,47 +1,63 @@
 /**** POPULATE DIMDATE ****/
 
+-- olap_etl.py builds the calendar with pandas and loads it in place of this section.
 -- Declare the date range for generating the DimDate table
 DECLARE @StartDate DATE = '2020-01-01'; -- Start date for the range
 DECLARE @EndDate DATE = '2030-12-31';   -- End date for the range
 
--- Iterate through each date in the range
-WHILE @StartDate <= @EndDate
-BEGIN
-	-- Insert a new row into the DimDate table for each date
-    INSERT INTO DimDate (
-        DateKey,		-- A unique integer key for each date (format: YYYYMMDD)
-        FullDate,		-- The full date value
-        Year,			-- The year component of the date
-        Quarter,		-- The quarter of the year (1-4)
-        Month,			-- The month component of the date (1-12)
-		Week,			-- The week number in the year
-        MonthName,		-- The full name of the month
-		DayOfMonth,		-- The day of the month (1-31)
-        DayOfWeek,		-- The day of the week (1=Sunday, 7=Saturday)
-        DayName,		-- The full name of the day
-        IsWeekend		-- A flag indicating if the day is a weekend (1=Yes, 0=No)
-    )
-    SELECT 
-        CONVERT(INT, FORMAT(@StartDate, 'yyyyMMdd')) AS DateKey,	-- Format the date as YYYYMMDD
-        @StartDate AS FullDate,
-        YEAR(@StartDate) AS Year,
-        DATEPART(QUARTER, @StartDate) AS Quarter,
-        MONTH(@StartDate) AS Month,
-		DATEPART(WEEK, @StartDate) AS Week,
-        DATENAME(MONTH, @StartDate) AS MonthName,
-        DAY(@StartDate) AS DayOfMonth,
-        DATEPART(WEEKDAY, @StartDate) AS DayOfWeek,
-        DATENAME(WEEKDAY, @StartDate) AS DayName,
-        CASE WHEN DATEPART(WEEKDAY, @StartDate) IN (1, 7) THEN 1 ELSE 0 END AS IsWeekend;
-
-    -- Increment the date by 1 day
-    SET @StartDate = DATEADD(DAY, 1, @StartDate);
-END;
+-- DateKey is an IDENTITY column, so the YYYYMMDD keys can only be inserted with IDENTITY_INSERT on
+SET IDENTITY_INSERT CMI_MRSafetyDB_OLAP.dbo.DimDate ON;
+
+-- Insert every date in the range in one statement, from a numbers table of day offsets instead of one INSERT per day.
+-- Dates already in DimDate are skipped, so the range can be extended and the section run again.
+WITH Digits AS (
+	SELECT n FROM (VALUES (0), (1), (2), (3), (4), (5), (6), (7), (8), (9)) AS d(n)
+),
+Days AS (
+	SELECT TOP (DATEDIFF(DAY, @StartDate, @EndDate) + 1)
+		DATEADD(DAY, ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) - 1, @StartDate) AS FullDate
+	FROM Digits d1 CROSS JOIN Digits d2 CROSS JOIN Digits d3 CROSS JOIN Digits d4 CROSS JOIN Digits d5
+)
+INSERT INTO CMI_MRSafetyDB_OLAP.dbo.DimDate (
+	DateKey,		-- A unique integer key for each date (format: YYYYMMDD)
+	FullDate,		-- The full date value
+	Year,			-- The year component of the date
+	Quarter,		-- The quarter of the year (1-4)
+	Month,			-- The month component of the date (1-12)
+	Week,			-- The week number in the year
+	IsoWeek,		-- The ISO 8601 week number
+	MonthName,		-- The full name of the month
+	DayOfMonth,		-- The day of the month (1-31)
+	DayOfWeek,		-- The day of the week (1=Sunday, 7=Saturday)
+	DayName,		-- The full name of the day
+	IsWeekend		-- A flag indicating if the day is a weekend (1=Yes, 0=No)
+)
+SELECT
+	YEAR(FullDate) * 10000 + MONTH(FullDate) * 100 + DAY(FullDate) AS DateKey,	-- The date as YYYYMMDD
+	FullDate,
+	YEAR(FullDate) AS Year,
+	DATEPART(QUARTER, FullDate) AS Quarter,
+	MONTH(FullDate) AS Month,
+	DATEPART(WEEK, FullDate) AS Week,
+	DATEPART(ISO_WEEK, FullDate) AS IsoWeek,
+	DATENAME(MONTH, FullDate) AS MonthName,
+	DAY(FullDate) AS DayOfMonth,
+	DATEPART(WEEKDAY, FullDate) AS DayOfWeek,
+	DATENAME(WEEKDAY, FullDate) AS DayName,
+	CASE WHEN DATEPART(WEEKDAY, FullDate) IN (1, 7) THEN 1 ELSE 0 END AS IsWeekend
+FROM Days
+WHERE NOT EXISTS (SELECT 1 FROM CMI_MRSafetyDB_OLAP.dbo.DimDate dd WHERE dd.FullDate = Days.FullDate);
+
+SET IDENTITY_INSERT CMI_MRSafetyDB_OLAP.dbo.DimDate OFF;
 
 /***ETL STAFF TABLE***/
 
--- Declare the last ETL runtime for filtering modified data
-DECLARE @LastETLRunTime DATETIME = DATEADD(DAY, -7, GETDATE()); -- Example start date
+-- Declare the last ETL runtime for filtering modified data: the start of the last successful run for this table,
+-- recorded in ETLControl by olap_etl.py. Every row is loaded if the table has never been loaded.
+DECLARE @LastETLRunTime DATETIME = ISNULL(
+	(SELECT LastETLRunTime FROM CMI_MRSafetyDB_OLAP.dbo.ETLControl WHERE TableName = 'DimStaff'),
+	'1900-01-01'
+);
 
 -- Merge the source data from the OLTP Staff table into the OLAP DimStaff table
 MERGE CMI_MRSafetyDB_OLAP.dbo.DimStaff AS Target
@@ -62,8 +78,12 @@ WHEN NOT MATCHED THEN
 
 /***ETL IMPLANT TABLE***/
 
--- Declare the last ETL runtime for filtering modified data
-DECLARE @LastETLRunTime DATETIME = DATEADD(DAY, -7, GETDATE()); -- Example start date
+-- Declare the last ETL runtime for filtering modified data: the start of the last successful run for this table,
+-- recorded in ETLControl by olap_etl.py. Every row is loaded if the table has never been loaded.
+DECLARE @LastETLRunTime DATETIME = ISNULL(
+	(SELECT LastETLRunTime FROM CMI_MRSafetyDB_OLAP.dbo.ETLControl WHERE TableName = 'DimImplant'),
+	'1900-01-01'
+);
 
 -- Merge the source data from the OLTP ImplantCategory table into the OLAP DimImplant table
 MERGE CMI_MRSafetyDB_OLAP.dbo.DimImplant AS Target
@@ -83,8 +103,12 @@ WHEN NOT MATCHED THEN
 
 /***ETL URGENCY TABLE***/
 
--- Declare the last ETL runtime for filtering modified data
-DECLARE @LastETLRunTime DATETIME = DATEADD(DAY, -7, GETDATE()); -- Example start date
+-- Declare the last ETL runtime for filtering modified data: the start of the last successful run for this table,
+-- recorded in ETLControl by olap_etl.py. Every row is loaded if the table has never been loaded.
+DECLARE @LastETLRunTime DATETIME = ISNULL(
+	(SELECT LastETLRunTime FROM CMI_MRSafetyDB_OLAP.dbo.ETLControl WHERE TableName = 'DimUrgency'),
+	'1900-01-01'
+);
 
 -- Merge the source data from the OLTP Urgency table into the OLAP DimUrgency table
 MERGE CMI_MRSafetyDB_OLAP.dbo.DimUrgency AS Target
@@ -105,8 +129,12 @@ WHEN NOT MATCHED THEN
 
 /***ETL SITE TABLE***/
 
--- Declare the last ETL runtime for filtering modified data
-DECLARE @LastETLRunTime DATETIME = DATEADD(DAY, -7, GETDATE()); -- Example start date
+-- Declare the last ETL runtime for filtering modified data: the start of the last successful run for this table,
+-- recorded in ETLControl by olap_etl.py. Every row is loaded if the table has never been loaded.
+DECLARE @LastETLRunTime DATETIME = ISNULL(
+	(SELECT LastETLRunTime FROM CMI_MRSafetyDB_OLAP.dbo.ETLControl WHERE TableName = 'DimSite'),
+	'1900-01-01'
+);
 
 -- Merge the source data from the OLTP Site table into the OLAP DimSite table
 MERGE CMI_MRSafetyDB_OLAP.dbo.DimSite AS Target
@@ -126,8 +154,12 @@ WHEN NOT MATCHED THEN
 
 /***ETL PATIENT TYPE TABLE***/
 
--- Declare the last ETL runtime for filtering modified data
-DECLARE @LastETLRunTime DATETIME = DATEADD(DAY, -7, GETDATE()); -- Example start date
+-- Declare the last ETL runtime for filtering modified data: the start of the last successful run for this table,
+-- recorded in ETLControl by olap_etl.py. Every row is loaded if the table has never been loaded.
+DECLARE @LastETLRunTime DATETIME = ISNULL(
+	(SELECT LastETLRunTime FROM CMI_MRSafetyDB_OLAP.dbo.ETLControl WHERE TableName = 'DimPatientType'),
+	'1900-01-01'
+);
 
 -- Merge the source data from the OLTP Urgency table into the OLAP DimUrgency table
 MERGE CMI_MRSafetyDB_OLAP.dbo.DimPatientType AS Target
@@ -147,11 +179,12 @@ WHEN NOT MATCHED THEN
 
 /***ETL CONTACT METHOD TABLE ***/
 
--- Declare the last ETL runtime for filtering modified data
-DECLARE @LastETLRunTime DATETIME = DATEADD(DAY, -7, GETDATE()); -- Example start date
-
-DECLARE @LastETLRunTime DATETIME = '2024-01-01 00:00:00'; -- Set to your specific date and time
-
+-- Declare the last ETL runtime for filtering modified data: the start of the last successful run for this table,
+-- recorded in ETLControl by olap_etl.py. Every row is loaded if the table has never been loaded.
+DECLARE @LastETLRunTime DATETIME = ISNULL(
+	(SELECT LastETLRunTime FROM CMI_MRSafetyDB_OLAP.dbo.ETLControl WHERE TableName = 'DimContactMethod'),
+	'1900-01-01'
+);
 
 -- Merge the source data from the OLTP Urgency table into the OLAP DimUrgency table
 MERGE CMI_MRSafetyDB_OLAP.dbo.DimContactMethod AS Target
@@ -170,7 +203,12 @@ WHEN NOT MATCHED THEN
 
 /*** ETL JOB STATUS TABLE ***/
 
-DECLARE @LastETLRunTime DATETIME = DATEADD(DAY, -30, GETDATE()); -- Example start date
+-- Declare the last ETL runtime for filtering modified data: the start of the last successful run for this table,
+-- recorded in ETLControl by olap_etl.py. Every row is loaded if the table has never been loaded.
+DECLARE @LastETLRunTime DATETIME = ISNULL(
+	(SELECT LastETLRunTime FROM CMI_MRSafetyDB_OLAP.dbo.ETLControl WHERE TableName = 'DimJobStatus'),
+	'1900-01-01'
+);
 
 -- Merge the source data from the OLTP Urgency table into the OLAP DimUrgency table
 MERGE CMI_MRSafetyDB_OLAP.dbo.DimJobStatus AS Target
@@ -189,7 +227,13 @@ WHEN NOT MATCHED THEN
 	VALUES (Source.StatusId, Source.StatusName, Source.StatusDescription);
 
 /*** ETL MR SAFETY TABLE ***/
-DECLARE @LastETLRunTime DATETIME = DATEADD(DAY, -30, GETDATE()); -- Example start date
+
+-- Declare the last ETL runtime for filtering modified data: the start of the last successful run for this table,
+-- recorded in ETLControl by olap_etl.py. Every row is loaded if the table has never been loaded.
+DECLARE @LastETLRunTime DATETIME = ISNULL(
+	(SELECT LastETLRunTime FROM CMI_MRSafetyDB_OLAP.dbo.ETLControl WHERE TableName = 'DimMRSafety'),
+	'1900-01-01'
+);
 
 -- Merge the source data from the OLTP Urgency table into the OLAP DimUrgency table
 MERGE CMI_MRSafetyDB_OLAP.dbo.DimMRSafety AS Target
@@ -207,10 +251,76 @@ WHEN NOT MATCHED THEN
 	INSERT (SafetyId, SafetyName, SafetyDescription)	-- Insert new records if not matched
 	VALUES (Source.MRSafetyId, Source.MRSafetyName, Source.MRSafetyDescription);
 
-/*** ETL JOB TABLE ***/
+/*** STAGE FACT JOB KEYS ***/
+
+-- Declare the last ETL runtime for filtering modified data: the start of the last successful run for this table,
+-- recorded in ETLControl by olap_etl.py. Every row is loaded if the table has never been loaded.
+DECLARE @LastETLRunTime DATETIME = ISNULL(
+	(SELECT LastETLRunTime FROM CMI_MRSafetyDB_OLAP.dbo.ETLControl WHERE TableName = 'FactJob'),
+	'1900-01-01'
+);
+
+-- Date keys and current status of each job, and date keys of each query, for the jobs the FactJob MERGE will load.
+-- olap_etl.py works these out in pandas (a date's key is its YYYYMMDD value) and loads the same two tables
+-- in place of this section, so the MERGE needs no joins to DimDate.
+DROP TABLE IF EXISTS CMI_MRSafetyDB_OLAP.dbo.JobKeys_Stage;
+DROP TABLE IF EXISTS CMI_MRSafetyDB_OLAP.dbo.QueryKeys_Stage;
+
+-- Latest status of each job, and the date of its latest status that is in DimDate, in windowed passes over
+-- StatusLog instead of a TOP 1 subquery per job
+WITH ChangedJobs AS (
+	SELECT JobId FROM CMI_MRSafetyDB.dbo.Job WHERE ModifiedDate >= @LastETLRunTime
+	UNION SELECT JobId FROM CMI_MRSafetyDB.dbo.Query WHERE ModifiedDate >= @LastETLRunTime
+	UNION SELECT JobId FROM CMI_MRSafetyDB.dbo.StatusLog WHERE ModifiedDate >= @LastETLRunTime
+),
+CurrentStatus AS (
+	SELECT
+		sl.JobId,
+		sl.StatusId,
+		sl.ChangedDate,
+		ROW_NUMBER() OVER (PARTITION BY sl.JobId ORDER BY sl.ChangedDate DESC, sl.JobStatusId DESC) AS StatusOrder
+	FROM CMI_MRSafetyDB.dbo.StatusLog sl
+	WHERE sl.JobId IN (SELECT JobId FROM ChangedJobs)
+),
+DatedStatus AS (
+	SELECT
+		sl.JobId,
+		dd.DateKey,
+		ROW_NUMBER() OVER (PARTITION BY sl.JobId ORDER BY sl.ChangedDate DESC, sl.JobStatusId DESC) AS StatusOrder
+	FROM CMI_MRSafetyDB.dbo.StatusLog sl
+	INNER JOIN CMI_MRSafetyDB_OLAP.dbo.DimDate dd ON dd.FullDate = CAST(sl.ChangedDate AS DATE)
+	WHERE sl.JobId IN (SELECT JobId FROM ChangedJobs)
+)
+SELECT
+	j.JobId,
+	ddLogged.DateKey AS DateJobLoggedKey,
+	ddMRIRequested.DateKey AS DateMRIRequestedKey,
+	ddMRIPlanned.DateKey AS DateMRIPlannedKey,
+	ddPTLTarget.DateKey AS PTLTargetDateKey,
+	ddPhysicsTarget.DateKey AS PhysicsTargetDateKey,
+	cs.StatusId AS CurrentStatusKey,
+	ds.DateKey AS DateCurrentStatusKey
+INTO CMI_MRSafetyDB_OLAP.dbo.JobKeys_Stage
+FROM CMI_MRSafetyDB.dbo.Job j
+LEFT JOIN CurrentStatus cs ON cs.JobId = j.JobId AND cs.StatusOrder = 1
+LEFT JOIN DatedStatus ds ON ds.JobId = j.JobId AND ds.StatusOrder = 1
+LEFT JOIN CMI_MRSafetyDB_OLAP.dbo.DimDate ddLogged ON ddLogged.FullDate = CAST(j.DateJobLogged AS DATE)
+LEFT JOIN CMI_MRSafetyDB_OLAP.dbo.DimDate ddMRIRequested ON ddMRIRequested.FullDate = CAST(j.DateMRIRequested AS DATE)
+LEFT JOIN CMI_MRSafetyDB_OLAP.dbo.DimDate ddMRIPlanned ON ddMRIPlanned.FullDate = CAST(j.DateMRIPlanned AS DATE)
+-- Target dates are stored on Job by target_dates.py
+LEFT JOIN CMI_MRSafetyDB_OLAP.dbo.DimDate ddPTLTarget ON ddPTLTarget.FullDate = CAST(j.PTLTargetDate AS DATE)
+LEFT JOIN CMI_MRSafetyDB_OLAP.dbo.DimDate ddPhysicsTarget ON ddPhysicsTarget.FullDate = CAST(j.PhysicsTargetDate AS DATE)
+WHERE j.JobId IN (SELECT JobId FROM ChangedJobs);
+
+SELECT
+	q.QueryId,
+	ddQuery.DateKey AS DateQueryReceivedKey
+INTO CMI_MRSafetyDB_OLAP.dbo.QueryKeys_Stage
+FROM CMI_MRSafetyDB.dbo.Query q
+LEFT JOIN CMI_MRSafetyDB_OLAP.dbo.DimDate ddQuery ON ddQuery.FullDate = CAST(q.DateQueryReceived AS DATE)
+WHERE q.JobId IN (SELECT JobId FROM CMI_MRSafetyDB_OLAP.dbo.JobKeys_Stage);
 
--- Declare the last ETL runtime for filtering modified data
-DECLARE @LastETLRunTime DATETIME = DATEADD(DAY, -30, GETDATE());
+/*** ETL JOB TABLE ***/
 
 -- Merge the source data from the OLTP Job table into the OLAP FactJob table
 
@@ -219,40 +329,26 @@ USING (
 	SELECT
 		j.JobId,		-- Primary key for the job
 		j.JobCode,
-		ddLogged.DateKey AS DateJobLoggedKey,
-		ddQuery.DateKey AS DateQueryReceivedKey,
+		jk.DateJobLoggedKey,
+		qk.DateQueryReceivedKey,
 		du.UrgencyId AS UrgencyKey,		-- Foreign key for DimUrgency
 		pt.PatientTypeId AS PatientTypeKey,
 		s.SiteId AS SiteKey,			-- Foreign key for DimSite
-		ddMRIRequested.DateKey AS DateMRIRequestedKey,
-		ddMRIPlanned.DateKey AS DateMRIPlannedKey,
+		jk.DateMRIRequestedKey,
+		jk.DateMRIPlannedKey,
 		j.ImplantId AS ImplantKey,		-- Foreign key for DimImplant
 		j.MRSafetyId AS MRSafetyKey,
 		q.ContactMethodId AS ContactMethodKey,
 
-		-- Current Status Id --
-		( 
-			SELECT TOP 1 sl.StatusId
-			FROM CMI_MRSafetyDB.dbo.StatusLog sl
-			--JOIN CMI_MRSafetyDB.dbo.JobStatus jst ON sl.StatusId = jst.StatusId
-			WHERE sl.JobId = j.JobId
-			ORDER BY sl.ChangedDate DESC, sl.JobStatusId DESC
-		) AS CurrentStatusKey,
-
-		-- Date Current Status Key --
-		(
-			SELECT TOP 1 dd.DateKey
-			FROM CMI_MRSafetyDB.dbo.StatusLog sl
-			JOIN CMI_MRSafetyDB_OLAP.dbo.DimDate dd ON dd.FullDate = CAST(sl.ChangedDate AS DATE)
-			WHERE sl.JobId = j.JobId
-			ORDER BY sl.ChangedDate DESC, sl.JobStatusId DESC
-		) AS DateCurrentStatusKey,
+		-- Current Status Id and Date Current Status Key, from the staged latest status of each job --
+		jk.CurrentStatusKey,
+		jk.DateCurrentStatusKey,
 
 		-- PTL Target Date Mapping --
-		ddPTLTarget.DateKey AS PTLTargetDateKey,
+		jk.PTLTargetDateKey,
 
 		-- Physics Target Date Mapping --
-		ddPhysicsTarget.DateKey AS PhysicsTargetDateKey
+		jk.PhysicsTargetDateKey
 
 	FROM CMI_MRSafetyDB.dbo.Job j
 	LEFT JOIN CMI_MRSafetyDB_OLAP.dbo.DimUrgency du ON j.UrgencyId = du.UrgencyId
@@ -262,38 +358,14 @@ USING (
 	LEFT JOIN CMI_MRSafetyDB.dbo.MRSafetyCategory mr ON j.MRSafetyId = mr.MRSafetyId
 	LEFT JOIN CMI_MRSafetyDB.dbo.Query q ON j.JobId = q.JobId
 	LEFT JOIN CMI_MRSafetyDB.dbo.ContactMethod cm ON cm.ContactMethodId = q.ContactMethodId
-	LEFT JOIN CMI_MRSafetyDB_OLAP.dbo.DimDate ddLogged ON ddLogged.FullDate = CAST(j.DateJobLogged AS DATE)
-	LEFT JOIN CMI_MRSafetyDB_OLAP.dbo.DimDate ddQuery ON ddQuery.FullDate = CAST(q.DateQueryReceived AS DATE)
-	LEFT JOIN CMI_MRSafetyDB_OLAP.dbo.DimDate ddMRIRequested ON ddMRIRequested.FullDate = CAST(j.DateMRIRequested AS DATE)
-	LEFT JOIN CMI_MRSafetyDB_OLAP.dbo.DimDate ddMRIPlanned ON ddMRIPlanned.FullDate = CAST(j.DateMRIPlanned AS DATE)
-
-	-- PTL Target Date Mapping --
-	LEFT JOIN CMI_MRSafetyDB_OLAP.dbo.DimDate ddPTLTarget ON ddPTLTarget.FullDate = CASE
-		WHEN du.UrgencyCode = 1 AND pt.PatientTypeName = 'Inpatient' THEN j.DateMRIRequested
-		WHEN du.UrgencyCode = 1 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 28, j.DateMRIRequested)
-		WHEN du.UrgencyCode = 3 AND pt.PatientTypeName = 'Inpatient' THEN j.DateMRIRequested
-		WHEN du.UrgencyCode = 3 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 14, j.DateMRIRequested)
-		WHEN du.UrgencyCode = 5 AND pt.PatientTypeName = 'Inpatient' THEN j.DateMRIRequested
-		WHEN du.UrgencyCode = 5 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 7, j.DateMRIRequested)
-		WHEN du.UrgencyCode = 7 THEN DATEADD(DAY, 2, j.DateMRIRequested)
-		WHEN du.UrgencyCode = 9 THEN DATEADD(DAY, -28, j.DateMRIPlanned)
-		WHEN du.UrgencyCode = 15 THEN DATEADD(DAY, 2, j.DateMRIRequested)
-		ELSE DATEADD(DAY, 14, j.DateMRIRequested)
-	END
-
-	-- Physics Target Date Mapping --
-	LEFT JOIN CMI_MRSafetyDB_OLAP.dbo.DimDate ddPhysicsTarget ON ddPhysicsTarget.FullDate = CASE
-		WHEN du.UrgencyCode = 1 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
-		WHEN du.UrgencyCode = 1 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 28, q.DateQueryReceived)
-		WHEN du.UrgencyCode = 3 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
-		WHEN du.UrgencyCode = 3 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 14, q.DateQueryReceived)
-		WHEN du.UrgencyCode = 5 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
-		WHEN du.UrgencyCode = 5 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 7, q.DateQueryReceived)
-		WHEN du.UrgencyCode = 7 THEN DATEADD(DAY, 2, q.DateQueryReceived)
-		WHEN du.UrgencyCode = 9 THEN DATEADD(DAY, -28, j.DateMRIPlanned)
-		WHEN du.UrgencyCode = 15 THEN DATEADD(DAY, 2, q.DateQueryReceived)
-		ELSE DATEADD(DAY, 14, q.DateQueryReceived)
-	END
+
+	-- Date keys and current status (see STAGE FACT JOB KEYS) --
+	LEFT JOIN CMI_MRSafetyDB_OLAP.dbo.JobKeys_Stage jk ON jk.JobId = j.JobId
+	LEFT JOIN CMI_MRSafetyDB_OLAP.dbo.QueryKeys_Stage qk ON qk.QueryId = q.QueryId
+
+	-- Only the jobs staged in JobKeys_Stage, the jobs whose Job, Query or StatusLog rows changed since the last run.
+	-- A job that changes after it was staged is picked up by the next run, so no job is merged without its keys --
+	WHERE j.JobId IN (SELECT JobId FROM CMI_MRSafetyDB_OLAP.dbo.JobKeys_Stage)
 ) AS Source
 ON Target.JobId = Source.JobId
 
@@ -353,7 +425,14 @@ WHEN NOT MATCHED THEN
 		Source.PhysicsTargetDateKey
 	);
 
-DECLARE @LastETLRunTime DATETIME = DATEADD(DAY, -7, GETDATE());
+/*** ETL STAFF ASSIGNED BRIDGE TABLE ***/
+
+-- Declare the last ETL runtime for filtering modified data: the start of the last successful run for this table,
+-- recorded in ETLControl by olap_etl.py. Every row is loaded if the table has never been loaded.
+DECLARE @LastETLRunTime DATETIME = ISNULL(
+	(SELECT LastETLRunTime FROM CMI_MRSafetyDB_OLAP.dbo.ETLControl WHERE TableName = 'BridgeStaffAssigned'),
+	'1900-01-01'
+);
 
 MERGE INTO CMI_MRSafetyDB_OLAP.dbo.BridgeStaffAssigned AS Target
 USING (
@@ -158,6 +158,49 @@ LEFT JOIN Job ON Job_Temp.JobId = Job.JobCode
 LEFT JOIN ContactMethod ON Job_Temp.ContactMethod = ContactMethod.ContactMethodName
 ;
 
+/****CALCULATE TARGET DATES****/
+-- Generated by "python target_dates.py --print-sql" from the rules in target_dates.py. Change the rules there and
+-- regenerate, rather than editing these statements.
+
+UPDATE j
+SET PTLTargetDate = t.TargetDate
+FROM Job j
+LEFT JOIN Urgency u ON j.UrgencyId = u.UrgencyId
+LEFT JOIN PatientType pt ON j.PatientTypeId = pt.PatientTypeId
+CROSS APPLY (SELECT CASE
+	WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Inpatient' THEN j.DateMRIRequested
+	WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 28, j.DateMRIRequested)
+	WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Inpatient' THEN j.DateMRIRequested
+	WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 14, j.DateMRIRequested)
+	WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Inpatient' THEN j.DateMRIRequested
+	WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 7, j.DateMRIRequested)
+	WHEN u.UrgencyCode = 7 THEN DATEADD(DAY, 2, j.DateMRIRequested)
+	WHEN u.UrgencyCode = 9 THEN DATEADD(DAY, -28, j.DateMRIPlanned)
+	WHEN u.UrgencyCode = 15 THEN DATEADD(DAY, 2, j.DateMRIRequested)
+	ELSE DATEADD(DAY, 14, j.DateMRIRequested)
+END AS TargetDate) t
+WHERE EXISTS (SELECT j.PTLTargetDate EXCEPT SELECT t.TargetDate);
+
+UPDATE j
+SET PhysicsTargetDate = t.TargetDate
+FROM Job j
+LEFT JOIN Urgency u ON j.UrgencyId = u.UrgencyId
+LEFT JOIN PatientType pt ON j.PatientTypeId = pt.PatientTypeId
+LEFT JOIN Query q ON q.QueryId = (SELECT TOP 1 QueryId FROM Query WHERE JobId = j.JobId ORDER BY DateQueryReceived DESC, QueryId DESC)
+CROSS APPLY (SELECT CASE
+	WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
+	WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 28, q.DateQueryReceived)
+	WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
+	WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 14, q.DateQueryReceived)
+	WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
+	WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 7, q.DateQueryReceived)
+	WHEN u.UrgencyCode = 7 THEN DATEADD(DAY, 2, q.DateQueryReceived)
+	WHEN u.UrgencyCode = 9 THEN DATEADD(DAY, -28, j.DateMRIPlanned)
+	WHEN u.UrgencyCode = 15 THEN DATEADD(DAY, 2, q.DateQueryReceived)
+	ELSE DATEADD(DAY, 14, q.DateQueryReceived)
+END AS TargetDate) t
+WHERE EXISTS (SELECT j.PhysicsTargetDate EXCEPT SELECT t.TargetDate);
+
 /****INSERT DATA INTO XRAY CHECK TABLE****/
 
 INSERT INTO XRayCheck (JobId, StaffId)
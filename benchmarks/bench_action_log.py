@@ -0,0 +1,39 @@
+#%% ACTION LOG PARSING BENCHMARK
+# Time parse_next_actions against the per-row NextAction loop it replaced on a synthetic frame of NextAction
+# text, and check both give the same action log.
+#   python benchmarks/bench_action_log.py --rows 200000
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from mrsafetydb_data_cleaning import parse_next_actions
+from tests.test_data_cleaning import baseline_parse_next_actions, next_action_frame
+
+# Run a parser on df, returning (result, seconds)
+def timed(function, df):
+    start = time.perf_counter()
+    result = function(df)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the NextAction parser against the per-row loop")
+    parser.add_argument("--rows", type=int, default=200000, help="Number of synthetic job rows")
+    args = parser.parse_args()
+
+    df = next_action_frame(args.rows)
+    result, seconds = timed(parse_next_actions, df)
+    expected, baseline_seconds = timed(baseline_parse_next_actions, df)
+    pd.testing.assert_frame_equal(result, expected)
+    print(
+        f"parse_next_actions: {args.rows / baseline_seconds:,.0f} rows/s per-row loop, {args.rows / seconds:,.0f} rows/s vectorised "
+        f"({baseline_seconds / seconds:.0f}x), {args.rows:,} jobs -> {len(result):,} actions"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+#%% STAGING TABLE LOAD BENCHMARK
+# Load rate of bulk_load's "executemany" and "multi" methods into a SQLite staging database, on a synthetic
+# frame with the column types the cleaning script loads.
+#   python benchmarks/bench_bulk_load.py --rows 200000
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from db_connection import bulk_load, connect_to_db
+from tests.test_db_connection import staging_frame
+
+def main():
+    parser = argparse.ArgumentParser(description="Time bulk_load's executemany and multi methods on SQLite")
+    parser.add_argument("--rows", type=int, default=200000, help="Number of synthetic rows")
+    parser.add_argument("--chunksize", type=int, default=10000, help="Rows bound per executemany call")
+    args = parser.parse_args()
+
+    df = staging_frame(args.rows)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = connect_to_db(None, os.path.join(tmp_dir, "staging.sqlite"), dialect="sqlite")
+        for method in ("executemany", "multi"):
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                bulk_load(df, f"Job_{method}", engine, method=method, chunksize=args.chunksize)
+            seconds = time.perf_counter() - start
+            print(f"{method}: {seconds:.2f}s, {args.rows / seconds:,.0f} rows/s ({args.rows:,} rows, {len(df.columns)} columns)")
+        engine.dispose()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#%% JOB DOCUMENT SYNC BENCHMARK
+# Job documents built per second by mongodb_etl.py against the row-wise builder it replaced, on a synthetic
+# SQLite OLTP database and mongomock. Both read the same tables and resolve patient/staff ObjectIds against
+# mongomock, but the writes are left out: mongomock scans the whole collection for every upsert, which would
+# swamp both. On a real server each find_one of the row-wise builder is also a network round trip.
+#   python benchmarks/bench_mongodb_etl.py --jobs 5000
+import argparse
+import os
+import runpy
+import sqlite3
+import sys
+import tempfile
+import time
+
+import mongomock
+import pymongo
+from sqlalchemy import create_engine
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import db_connection
+from tests.conftest import populate_oltp
+from tests.test_mongodb_etl_parity import baseline_job_sync
+
+# Stands in for the job collection so only the document building is timed
+class DiscardWrites:
+    def update_one(self, query, update, upsert=False):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Time building the MongoDB job documents against the row-wise baseline")
+    parser.add_argument("--jobs", type=int, default=5000, help="Number of synthetic jobs")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Stream the jobs in chunks of this size")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        engine = create_engine(f"sqlite:///{os.path.join(temp_dir, 'oltp.sqlite')}", connect_args={"detect_types": sqlite3.PARSE_DECLTYPES})
+        populate_oltp(engine, args.jobs)
+        client = mongomock.MongoClient()
+        db_connection.connect_to_db = lambda *a, **k: engine
+        pymongo.MongoClient = lambda *a, **k: client
+        etl = runpy.run_path(os.path.join(repo_dir, "mongodb_etl.py"), run_name="mongodb_etl")
+
+        start = time.perf_counter()
+        baseline_job_sync(etl, DiscardWrites())
+        baseline_seconds = time.perf_counter() - start
+
+        # Start with empty ObjectId caches, as a new run would
+        for resolver in (etl["patient_ids"], etl["staff_ids"]):
+            resolver.object_ids.clear()
+        start = time.perf_counter()
+        built = 0
+        job_chunks = etl["read_filtered"](etl["job_query"], [], {}, order_by="j.JobId", chunksize=args.chunk_size)
+        for job_df in [job_chunks] if args.chunk_size is None else job_chunks:
+            job_df = job_df.where(job_df.notna(), None)
+            conditions, params = [], {}
+            if args.chunk_size:
+                conditions = ["{job_id} BETWEEN :first_job AND :last_job"]
+                params = {"first_job": int(job_df["JobId"].min()), "last_job": int(job_df["JobId"].max())}
+            children = etl["read_job_children"](conditions, params)
+            etl["patient_ids"].prefetch(job_df["PatientId"].dropna().tolist())
+            built += sum(1 for _ in etl["job_updates"](job_df, *children))
+        batched_seconds = time.perf_counter() - start
+        engine.dispose()
+
+    print(f"Row-wise: {args.jobs / baseline_seconds:,.0f} jobs/s ({baseline_seconds:.2f}s)")
+    print(f"Batched:  {built / batched_seconds:,.0f} jobs/s ({batched_seconds:.2f}s), {baseline_seconds / batched_seconds:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#%% TEXT COLUMN NORMALIZATION BENCHMARK
+# Throughput and peak memory of the normalize_column cleaners against the str/apply chains they replaced, on a
+# synthetic frame of raw text columns, followed by the memory_report of the cleaned frame.
+#   python benchmarks/bench_normalize.py --rows 1000000
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from mrsafetydb_data_cleaning import memory_report
+from tests.test_data_cleaning import raw_text_frame, text_cleaners
+
+# Run a cleaner on a copy of df, returning (result, seconds, peak bytes allocated while it ran).
+# The peak is measured in a second run, as tracing allocations slows the row-by-row chains far more.
+def measured(function, df):
+    start = time.perf_counter()
+    result = function(df.copy())
+    seconds = time.perf_counter() - start
+    df = df.copy()
+    tracemalloc.start()
+    function(df)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the text column cleaners against the str/apply chains")
+    parser.add_argument("--rows", type=int, default=1000000, help="Number of synthetic rows")
+    args = parser.parse_args()
+
+    raw = raw_text_frame(args.rows)
+    cleaned = raw.copy()
+    for clean, baseline_clean, columns in text_cleaners:
+        expected, baseline_seconds, baseline_peak = measured(baseline_clean, raw)
+        result, seconds, peak = measured(clean, raw)
+        for col in columns:
+            pd.testing.assert_series_equal(result[col].astype(object), expected[col].astype(object))
+            cleaned[col] = result[col]
+        print(
+            f"{'/'.join(columns)}: {args.rows / baseline_seconds:,.0f} rows/s -> {args.rows / seconds:,.0f} rows/s "
+            f"({baseline_seconds / seconds:.0f}x), peak {baseline_peak / 2**20:.0f} MiB -> {peak / 2**20:.0f} MiB"
+        )
+    with contextlib.redirect_stdout(io.StringIO()):
+        report = memory_report(cleaned)
+    total = report.loc["Total"]
+    print(f"Cleaned frame: {total['BytesBefore'] / 2**20:.0f} MiB as object columns, {total['BytesAfter'] / 2**20:.0f} MiB as category")
+
+if __name__ == "__main__":
+    main()
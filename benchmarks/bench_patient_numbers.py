@@ -0,0 +1,47 @@
+#%% PATIENT NUMBER CLEANING BENCHMARK
+# Time clean_hospital_number and clean_patient against the row-wise versions they replaced on a synthetic frame
+# of hospital/NHS numbers, and check both give the same frame.
+#   python benchmarks/bench_patient_numbers.py --rows 1000000
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import pandas as pd
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from mrsafetydb_data_cleaning import clean_hospital_number, clean_patient
+from tests.test_data_cleaning import baseline_clean_hospital_number, baseline_clean_patient, random_patient_numbers
+
+# Run a cleaning step on a copy of df without its printed output, returning (result, seconds)
+def timed(function, df):
+    df = df.copy()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function(df)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the patient number cleaning against the row-wise baseline")
+    parser.add_argument("--rows", type=int, default=1000000, help="Number of synthetic rows")
+    args = parser.parse_args()
+
+    df = random_patient_numbers(args.rows)
+    steps = [
+        ("clean_hospital_number", clean_hospital_number, baseline_clean_hospital_number),
+        ("clean_patient", clean_patient, baseline_clean_patient),
+    ]
+    for name, function, baseline in steps:
+        result, seconds = timed(function, df)
+        expected, baseline_seconds = timed(baseline, df)
+        pd.testing.assert_frame_equal(result, expected)
+        print(f"{name}: {baseline_seconds:.2f}s row-wise, {seconds:.2f}s vectorised ({baseline_seconds / seconds:.0f}x), {args.rows:,} rows")
+        # The next step cleans the output of this one
+        df = result
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#%% IDENTIFIER VALIDATION BENCHMARK
+# Throughput of validate_identifiers on a synthetic frame of cleaned hospital/NHS numbers, against the old hospital
+# number pattern match plus an NHS number check written out one number at a time, and check both agree.
+#   python benchmarks/bench_validation.py --rows 1000000
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import pandas as pd
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from mrsafetydb_data_cleaning import clean_hospital_number, validate_identifiers
+from tests.test_data_cleaning import baseline_hospital_number_valid, baseline_nhs_number_error, random_patient_numbers
+
+# Rows the row-wise checks reject, with their reason codes
+def baseline_validate_identifiers(df):
+    hospital_errors = (~baseline_hospital_number_valid(df["HospitalNumber"])).map({True: "HOSPITAL_NUMBER_FORMAT", False: None})
+    nhs_errors = df["NHSNumber"].map(baseline_nhs_number_error)
+    reasons = pd.Series([",".join(code for code in codes if code is not None) for codes in zip(hospital_errors, nhs_errors)], index=df.index)
+    return reasons[reasons != ""]
+
+def main():
+    parser = argparse.ArgumentParser(description="Time validate_identifiers against the row-wise checks")
+    parser.add_argument("--rows", type=int, default=1000000, help="Number of synthetic rows")
+    args = parser.parse_args()
+
+    df = random_patient_numbers(args.rows)
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = clean_hospital_number(df)
+    df["JobId"] = range(len(df))
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        valid, quarantine = validate_identifiers(df)
+    seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    expected = baseline_validate_identifiers(df)
+    baseline_seconds = time.perf_counter() - start
+
+    pd.testing.assert_series_equal(quarantine["ReasonCode"], expected, check_names=False)
+    print(f"validate_identifiers: {seconds:.2f}s, {args.rows / seconds:,.0f} rows/s ({len(quarantine):,} of {args.rows:,} rows quarantined)")
+    print(f"row-wise checks: {baseline_seconds:.2f}s, {args.rows / baseline_seconds:,.0f} rows/s ({baseline_seconds / seconds:.0f}x slower)")
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,108 @@
-from sqlalchemy import create_engine
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-def connect_to_db(server_name, database_name):
+import pandas as pd
+from sqlalchemy import create_engine, inspect, text
+
+# Engines created so far in this process, keyed by the database and the engine options it was created with.
+# Reusing an engine reuses its connection pool instead of paying ODBC connection setup again.
+_engines = {}
+
+# Return a pooled engine for a database, creating it on first use.
+# dialect="sqlite" runs against a local SQLite file instead of SQL Server (database_name is the file path).
+def connect_to_db(server_name, database_name, dialect="mssql", pool_size=5, max_overflow=10, pool_pre_ping=True, fast_executemany=True):
+    # A call with different pool or driver options gets its own engine rather than one built with other settings
+    key = (dialect, server_name, database_name, pool_size, max_overflow, pool_pre_ping, fast_executemany)
+    if key in _engines:
+        return _engines[key]
     try:
-        connection_string = f"mssql+pyodbc://{server_name}/{database_name}?driver=ODBC+Driver+17+for+SQL+Server&trusted_connection=yes"
-        engine = create_engine(connection_string)
+        if dialect == "sqlite":
+            connection_string = f"sqlite:///{database_name}"
+            engine_options = {}
+            # An in-memory SQLite database lives on a single connection, so it cannot be given a sized pool
+            if database_name != ":memory:":
+                engine_options.update(pool_size=pool_size, max_overflow=max_overflow)
+        else:
+            connection_string = f"mssql+pyodbc://{server_name}/{database_name}?driver=ODBC+Driver+17+for+SQL+Server&trusted_connection=yes"
+            # fast_executemany sends all parameter rows of an executemany in one round trip instead of one per row
+            engine_options = {"pool_size": pool_size, "max_overflow": max_overflow, "fast_executemany": fast_executemany}
+        # pool_pre_ping checks a pooled connection is still alive before handing it out
+        engine = create_engine(connection_string, pool_pre_ping=pool_pre_ping, **engine_options)
+        _engines[key] = engine
         print(f"Connection to database {database_name} successful")
         return engine
     except Exception as e:
         print(f"Error connecting to database {database_name} on server {server_name}: {e}")
+
+# Run independent read queries at the same time, each on its own connection from the engine's pool.
+# queries maps a name to (sql, params); returns {name: DataFrame} in the same order.
+def read_sql_concurrently(engine, queries, max_workers=4):
+    def run_query(name, sql, params):
+        start = time.perf_counter()
+        df = pd.read_sql(text(sql), engine, params=params)
+        print(f"Extracted {len(df)} rows for {name} in {time.perf_counter() - start:.2f}s")
+        return df
+
+    start = time.perf_counter()
+    # Most of the time is spent waiting on the database, so threads are enough to overlap the queries
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {name: executor.submit(run_query, name, sql, params) for name, (sql, params) in queries.items()}
+        results = {name: future.result() for name, future in futures.items()}
+    print(f"Extracted {len(queries)} queries in {time.perf_counter() - start:.2f}s using {max_workers} workers")
+    return results
+
+# Most bound parameters and most rows allowed in one INSERT ... VALUES statement by each backend
+_max_parameters = {"mssql": 2100, "sqlite": 999}
+_max_values_rows = {"mssql": 1000}
+
+# Load a DataFrame into a table, appending to it (the table is created from the frame if it does not exist).
+# method:
+#   "executemany" - one prepared INSERT with the rows bound in chunks. The default: fastest on SQL Server when the
+#                   engine has fast_executemany (see connect_to_db) and on SQLite.
+#   "multi"       - multi-row INSERT ... VALUES statements, sized to stay under the backend's parameter limit.
+#                   Faster than executemany for drivers without fast_executemany.
+#   "bulk"        - BCP-style: write a CSV file and load it with BULK INSERT (SQL Server only). bulk_dir must be
+#                   a folder the SQL Server service can read, e.g. a local temp folder or a network share.
+# Every chunk of a table is loaded in one transaction, so a failed load leaves the table unchanged.
+def bulk_load(df, table_name, engine, method="executemany", chunksize=10000, bulk_dir=None):
+    dialect = engine.dialect.name
+
+    start = time.perf_counter()
+    if method == "bulk":
+        _bulk_insert_csv(df, table_name, engine, chunksize, bulk_dir or tempfile.gettempdir())
+    elif method in ("executemany", "multi"):
+        if method == "multi":
+            # Each row uses one parameter per column
+            max_rows = (_max_parameters.get(dialect, 999) - 1) // max(len(df.columns), 1)
+            chunksize = max(1, min(chunksize, max_rows, _max_values_rows.get(dialect, chunksize)))
+        with engine.begin() as connection:
+            df.to_sql(
+                table_name, con=connection, if_exists="append", index=False,
+                chunksize=chunksize, method="multi" if method == "multi" else None
+            )
+    else:
+        raise ValueError(f"Unknown load method {method!r}")
+    elapsed = time.perf_counter() - start
+    rate = len(df) / elapsed if elapsed else float("inf")
+    print(f"Loaded {len(df)} rows into {table_name} in {elapsed:.2f}s ({method}, {rate:,.0f} rows/s)")
+
+# Write the frame to a CSV file and load it server-side with BULK INSERT
+def _bulk_insert_csv(df, table_name, engine, batch_size, bulk_dir):
+    if engine.dialect.name != "mssql":
+        raise ValueError("The bulk load method needs SQL Server")
+    # Create the table from the frame's columns if it does not exist yet
+    df.head(0).to_sql(table_name, con=engine, if_exists="append", index=False)
+    # BULK INSERT matches fields by position, so write the columns in the table's order
+    table_columns = [column["name"] for column in inspect(engine).get_columns(table_name)]
+    path = os.path.join(bulk_dir, f"{table_name}_{os.getpid()}.csv")
+    df.reindex(columns=table_columns).to_csv(path, index=False, date_format="%Y-%m-%d %H:%M:%S")
+    try:
+        with engine.begin() as connection:
+            connection.execute(text(
+                f"BULK INSERT [{table_name}] FROM '{path}' "
+                f"WITH (FORMAT = 'CSV', FIRSTROW = 2, KEEPNULLS, TABLOCK, BATCHSIZE = {int(batch_size)})"
+            ))
+    finally:
+        os.remove(path)
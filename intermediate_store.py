@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+# Parquet support is optional: without pyarrow the store is switched off and every run cleans from the CSV
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+# SHA-256 of a file's contents, read in blocks so large exports are not loaded into memory
+def file_hash(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Cleaned DataFrames saved as Parquet, keyed by a hash of the source file and the settings used to clean it.
+# Each key is a folder under cache_dir holding one <name>.parquet file per frame.
+class IntermediateStore:
+    def __init__(self, cache_dir, max_age_days=7, max_size_mb=1024):
+        self.cache_dir = cache_dir
+        # Entries not used for longer than this are removed by evict()
+        self.max_age_days = max_age_days
+        # Once the store is bigger than this, evict() removes the least recently used entries
+        self.max_size_mb = max_size_mb
+        self.enabled = pq is not None
+        if not self.enabled:
+            print("pyarrow is not installed, cleaned frames will not be cached.")
+
+    # Key for a source file (or list of files) cleaned with the given settings (any JSON-serialisable dict)
+    def key(self, source_paths, config):
+        if isinstance(source_paths, str):
+            source_paths = [source_paths]
+        digest = hashlib.sha256()
+        for source_path in source_paths:
+            digest.update(file_hash(source_path).encode())
+        digest.update(json.dumps(config, sort_keys=True, default=str).encode())
+        return digest.hexdigest()[:32]
+
+    def path(self, key, name):
+        return os.path.join(self.cache_dir, key, f"{name}.parquet")
+
+    def has(self, key, name):
+        return self.enabled and os.path.exists(self.path(key, name))
+
+    def save(self, key, name, df):
+        if not self.enabled:
+            return
+        os.makedirs(os.path.join(self.cache_dir, key), exist_ok=True)
+        # Write to a temporary file first so an interrupted run never leaves a half-written frame behind
+        path = self.path(key, name)
+        df.to_parquet(path + ".tmp", engine="pyarrow", index=False)
+        os.replace(path + ".tmp", path)
+        print(f"Saved {len(df)} rows of {name} to {path}")
+
+    # Read a cached frame, memory-mapping the Parquet file instead of reading it into a buffer first.
+    # Returns None if there is no such frame.
+    def load(self, key, name):
+        if not self.has(key, name):
+            return None
+        path = self.path(key, name)
+        start = time.perf_counter()
+        df = pq.read_table(path, memory_map=True).to_pandas()
+        # Mark the entry as recently used for eviction
+        os.utime(os.path.join(self.cache_dir, key))
+        print(f"Loaded {len(df)} rows of {name} from {path} in {time.perf_counter() - start:.2f}s")
+        return df
+
+    # Remove entries older than max_age_days, then the least recently used entries until the store fits in max_size_mb.
+    # keep is a key that is never removed, e.g. the entry the current run has just written.
+    def evict(self, keep=None):
+        if not self.enabled or not os.path.isdir(self.cache_dir):
+            return
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry = os.path.join(self.cache_dir, key)
+            if not os.path.isdir(entry):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            entries.append((os.path.getmtime(entry), size, key))
+
+        # Least recently used first
+        entries.sort()
+        now = time.time()
+        total_size = sum(size for _, size, _ in entries)
+        for last_used, size, key in entries:
+            too_old = now - last_used > self.max_age_days * 86400
+            too_big = total_size > self.max_size_mb * 1024 * 1024
+            if key == keep or not (too_old or too_big):
+                continue
+            entry = os.path.join(self.cache_dir, key)
+            shutil.rmtree(entry, ignore_errors=True)
+            total_size -= size
+            print(f"Evicted {entry} ({size / 1e6:.1f}MB, {'too old' if too_old else 'store over size limit'})")
@@ -1,8 +1,12 @@
 #%% CONNECT TO DATABASES
-from sqlalchemy import create_engine
-from db_connection import connect_to_db
+from sqlalchemy import text
+from db_connection import connect_to_db, read_sql_concurrently
 import pandas as pd
 from pymongo import MongoClient
+from mongodb_sync import (
+    bulk_upsert, ObjectIdResolver, to_python_datetimes, group_records, group_values,
+    get_high_water_mark, set_high_water_mark
+)
 
 #Connect to SQL server database
 server_name ="[REDACTED]"
@@ -13,89 +17,145 @@ engine = connect_to_db(server_name, database_name)
 client = MongoClient("mongodb://localhost:27017/")  # MongoDB connection string
 db = client["MRSafetyDB"]  # MongoDB database name
 
+# Number of upserts sent to MongoDB per bulk_write call
+batch_size = 1000
+
+# Set to True to sync only rows whose ModifiedDate has changed since the last successful run.
+# ModifiedDate is kept current by the triggers in Create_Triggers_MRSafetyDB.sql. Deleted rows and changes to
+# lookup tables (e.g. Site, Urgency) are not picked up, so run a full sync after those.
+incremental = False
+
+# High-water mark per collection, saved after each collection syncs without errors
+sync_state_collection = db["syncState"]
+
+# Server time at the start of this run, saved as the new high-water mark. Rows changed while the sync
+# is running are picked up again on the next run.
+run_started = pd.to_datetime(pd.read_sql("SELECT CURRENT_TIMESTAMP AS RunStarted", engine)["RunStarted"][0]).to_pydatetime()
+
+# Number of jobs read, built and written at a time. None reads every job in one go; a number streams the
+# jobs in JobId order and only holds one chunk of jobs (and their child rows) in memory at once.
+chunk_size = None
+
+# Number of child-table queries (StatusLog, ActionLog, JobStaff, XRayCheck) run at the same time
+extract_workers = 4
+
+# Add a WHERE clause to a query when there are conditions (e.g. "ModifiedDate >= :since"), and an optional ORDER BY
+def filter_query(query, conditions, order_by=None):
+    if conditions:
+        query = query + " WHERE " + " AND ".join(conditions)
+    if order_by:
+        query = query + " ORDER BY " + order_by
+    return query
+
+# Read a filtered query. With chunksize an iterator of DataFrames is returned instead of a single DataFrame.
+def read_filtered(query, conditions, params, order_by=None, connection=engine, chunksize=None):
+    return pd.read_sql(text(filter_query(query, conditions, order_by)), connection, params=params, chunksize=chunksize)
+
 # %% PATIENT COLLECTION
 
 patient_collection = db["patient"]
 
+# High-water mark from the last successful sync (None means sync every patient)
+patient_since = get_high_water_mark(sync_state_collection, "patient") if incremental else None
+
 # Select columns from patient table in SQL server DB
-patient_df = pd.read_sql("SELECT PatientId,HospitalNumber,NHSNumber,Initials,PatientCode FROM Patient",engine)
+patient_df = read_filtered(
+    "SELECT PatientId,HospitalNumber,NHSNumber,Initials,PatientCode FROM Patient",
+    ["ModifiedDate >= :since"] if patient_since else [],
+    {"since": patient_since}
+)
 
 # Convert data frame to dictionary for pymongo
 patient_data = patient_df.to_dict(orient="records")
 
-# Initialise counter for number of documents upserted
-patient_document_count = 0
-
-for record in patient_data:
-    # Match records in MongoDB and SQL server DB based on PatientId (primary key)
-    query = {"patientKey": record["PatientId"]}
-
-    # Fields to be inserted or updated 
-    update_data = {
-        "$set": {
-            "patientKey": record["PatientId"],         
-            "hospitalNumber": record.get("HospitalNumber"),
-            "nhsNumber": record.get("NHSNumber"),
-            "patientCode": record.get("PatientCode"),
-            "initials": record.get("Initials")         
+# Build one upsert per patient, matched in MongoDB on PatientId (primary key)
+patient_updates = (
+    (
+        record["PatientId"],
+        {
+            "$set": {
+                "patientKey": record["PatientId"],
+                "hospitalNumber": record.get("HospitalNumber"),
+                "nhsNumber": record.get("NHSNumber"),
+                "patientCode": record.get("PatientCode"),
+                "initials": record.get("Initials")
+            }
         }
-    }
+    )
+    for record in patient_data
+)
 
-    try:
-        # Attempt to update a single document in the collection matching the query.
-        # If no document matches and upsert=True, a new document will be created.
-        result = patient_collection.update_one(query, update_data, upsert=True)
-        patient_document_count+=1
-    except Exception as e:
-        # Handle any exceptions during the update operation and log the error 
-        print(f"Error processing record {record}: {e}")
+# Send the upserts to MongoDB in batches. If no document matches, a new document will be created.
+patient_summary = bulk_upsert(patient_collection, patient_updates, "patientKey", batch_size)
+patient_document_count = len(patient_data) - patient_summary["errors"]
 # Print summary
 print(f'{patient_document_count} of {len(patient_data)} records successfully upserted into collection.')
+# Move the high-water mark on only if every record was written
+if not patient_summary["errors"]:
+    set_high_water_mark(sync_state_collection, "patient", run_started)
 # %% STAFF COLLECTION
 staff_collection = db["staff"]
 
+# High-water mark from the last successful sync (None means sync every staff member)
+staff_since = get_high_water_mark(sync_state_collection, "staff") if incremental else None
+
 # Select columns from patient table in SQL server DB
-staff_df = pd.read_sql("SELECT StaffId, FirstName, LastName, Initials FROM Staff",engine)
+staff_df = read_filtered(
+    "SELECT StaffId, FirstName, LastName, Initials FROM Staff",
+    ["ModifiedDate >= :since"] if staff_since else [],
+    {"since": staff_since}
+)
 
 # Convert data frame to dictionary for pymongo
 staff_data = staff_df.to_dict(orient="records")
 
-# Initialise counter for number of documents upserted
-staff_document_count = 0
-
-for record in staff_data:
-    # Match records in MongoDB and SQL server DB based on PatientId (PK)
-    query = {"staffKey": record["StaffId"]}
-
-    # Fields to be inserted or updated 
-    update_data = {
-        "$set": {
-            "staffKey": record["StaffId"],    
-            "staffInitials": record.get("Initials"),        
-            "firstName": record.get("FirstName"),
-            "lastName": record.get("LastName")
-      
+# Build one upsert per staff member, matched in MongoDB on StaffId (PK)
+staff_updates = (
+    (
+        record["StaffId"],
+        {
+            "$set": {
+                "staffKey": record["StaffId"],
+                "staffInitials": record.get("Initials"),
+                "firstName": record.get("FirstName"),
+                "lastName": record.get("LastName")
+            }
         }
-    }
+    )
+    for record in staff_data
+)
 
-    try:
-        # Attempt to update a single document in the collection matching the query.
-        # If no document matches and upsert=True, a new document will be created.
-        result = staff_collection.update_one(query, update_data, upsert=True)
-        staff_document_count+=1
-    except Exception as e:
-        # Handle any exceptions during the update operation and log the error 
-        print(f"Error processing record {record}: {e}")
+# Send the upserts to MongoDB in batches. If no document matches, a new document will be created.
+staff_summary = bulk_upsert(staff_collection, staff_updates, "staffKey", batch_size)
+staff_document_count = len(staff_data) - staff_summary["errors"]
 # Print summary
 print(f'{staff_document_count} of {len(staff_data)} records successfully upserted into collection.')
+# Move the high-water mark on only if every record was written
+if not staff_summary["errors"]:
+    set_high_water_mark(sync_state_collection, "staff", run_started)
 
 # %% JOB COLLECTION
 
 # Reference job collection on MongoDB database
 job_collection = db["job"]      
 
-# Initialise counter for number of documents upserted
-job_document_count = 0
+# The PTL and Physics target dates stored on Job are copied as they are: this sync only reads the OLTP database.
+# They are kept current by the target date triggers in Create_Triggers_MRSafetyDB.sql and by the OLAP ETL run.
+
+# High-water mark from the last successful sync (None means rebuild every job)
+job_since = get_high_water_mark(sync_state_collection, "job") if incremental else None
+
+# Jobs whose own row or any child row changed since the high-water mark. Each of these job documents is
+# rebuilt in full, so the child queries below read every child row of a changed job, not just the changed ones.
+changed_jobs_query = """
+    SELECT JobId FROM Job WHERE ModifiedDate >= :since
+    UNION SELECT JobId FROM Query WHERE ModifiedDate >= :since
+    UNION SELECT JobId FROM CRISComment WHERE ModifiedDate >= :since
+    UNION SELECT JobId FROM StatusLog WHERE ModifiedDate >= :since
+    UNION SELECT JobId FROM ActionLog WHERE ModifiedDate >= :since
+    UNION SELECT JobId FROM JobStaff WHERE ModifiedDate >= :since
+    UNION SELECT JobId FROM XRayCheck WHERE ModifiedDate >= :since
+    """
 
 # SQL query to retrieve job-related data from OLTP database
 job_query = """
@@ -113,30 +173,8 @@ job_query = """
         u.UrgencyType,
         j.DateMRIRequested,
         j.DateMRIPlanned,
-        CASE
-            WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Inpatient' THEN j.DateMRIRequested
-            WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 28, j.DateMRIRequested)
-            WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Inpatient' THEN j.DateMRIRequested
-            WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 14, j.DateMRIRequested)
-            WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Inpatient' THEN j.DateMRIRequested
-            WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 7, j.DateMRIRequested)
-            WHEN u.UrgencyCode = 7 THEN DATEADD(DAY, 2, j.DateMRIRequested)
-            WHEN u.UrgencyCode = 9 THEN DATEADD(DAY, -28, j.DateMRIPlanned)
-            WHEN u.UrgencyCode = 15 THEN DATEADD(DAY, 2, j.DateMRIRequested)
-            ELSE DATEADD(DAY, 14, j.DateMRIRequested)
-        END AS PTLTargetDate,
-        CASE
-            WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
-            WHEN u.UrgencyCode = 1 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 28, q.DateQueryReceived)
-            WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
-            WHEN u.UrgencyCode = 3 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 14, q.DateQueryReceived)
-            WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Inpatient' THEN q.DateQueryReceived
-            WHEN u.UrgencyCode = 5 AND pt.PatientTypeName = 'Outpatient' THEN DATEADD(DAY, 7, q.DateQueryReceived)
-            WHEN u.UrgencyCode = 7 THEN DATEADD(DAY, 2, q.DateQueryReceived)
-            WHEN u.UrgencyCode = 9 THEN DATEADD(DAY, -28, j.DateMRIPlanned)
-            WHEN u.UrgencyCode = 15 THEN DATEADD(DAY, 2, q.DateQueryReceived)
-            ELSE DATEADD(DAY, 14, q.DateQueryReceived)
-        END AS PhysicsTargetDate,
+        j.PTLTargetDate,
+        j.PhysicsTargetDate,
         i.ImplantName,
         mr.MRSafetyName,
         cris.Comment AS CRISComment,
@@ -152,15 +190,7 @@ job_query = """
     LEFT JOIN CRISComment cris ON j.JobId = cris.JobId
     """
 
-# Extract job data and load into a DataFrame
-job_df = pd.read_sql(job_query,engine)
-# Replace null values with None
-job_df = job_df.where(pd.notnull(job_df), None)
-
-# Convert the DataFrame to a list of dictionaries for MongoDB insertion
-job_data = job_df.to_dict(orient="records")
-
-# Extract data from StatusLog table and transform it into a dictionary grouped by JobId
+# Extract data from StatusLog table
 status_query = """
     SELECT
         sl.JobId, 
@@ -171,22 +201,7 @@ status_query = """
 
     """
 
-status_df = pd.read_sql(status_query,engine)
-
-status_df["ChangedDate"] = status_df["ChangedDate"].where(pd.notnull(status_df["ChangedDate"]), None)
-status_data = status_df.groupby("JobId").apply(
-    lambda x: [
-        {
-            "StatusName": row["StatusName"],
-            "ChangedDate": row["ChangedDate"].to_pydatetime() if pd.notnull(row["ChangedDate"]) else None
-        }
-        for _, row in x.iterrows()
-    ]
-).to_dict()
-# Verify transformation by printing first 5 rows
-print(status_df.head())
-
-# Extract data from ActionLog table and transform it into a dictionary grouped by JobId
+# Extract data from ActionLog table
 action_query = """
     SELECT
         JobId,
@@ -196,145 +211,218 @@ action_query = """
     FROM ActionLog
     """
 
-action_df = pd.read_sql(action_query,engine)
-action_df = action_df.where(pd.notnull(action_df), None)
-action_df["PerformedBy"]= action_df["PerformedBy"].astype("Int64")
-action_data = action_df.groupby("JobId").apply(
-    lambda x: [
-        {
-            "comment": row["ActionDescription"],
-            "staffMember":row["PerformedBy"],
-            "date": row["PerformedDate"].to_pydatetime() if pd.notnull(row["PerformedDate"]) else None
-        }
-        for _, row in x.iterrows()
-    ]
-).to_dict()
-# Verify transformation by printing first 5 rows
-print(action_df.head())
-
-# Extract and transform staff data
+# Extract staff data
 job_staff_query = """
     SELECT
         JobId, 
         StaffId
     FROM JobStaff
     """
-job_staff_df = pd.read_sql(job_staff_query,engine)
-job_staff_df = job_staff_df.where(pd.notnull(job_staff_df),None)
-job_staff_data = (
-    job_staff_df.groupby("JobId")["StaffId"]
-    .apply(list)
-    .to_dict()
-    )
 
-# Extract and transform xray check data
+# Extract xray check data
 xray_check_query = """
     SELECT
         JobId, 
         StaffId
     FROM XRayCheck
     """
-xray_check_df = pd.read_sql(xray_check_query,engine)
-xray_check_df = xray_check_df.where(pd.notnull(xray_check_df),None)
-xray_check_data = (
-    xray_check_df.groupby("JobId")["StaffId"]
-    .apply(list)
-    .to_dict()
+
+# Cache patientKey/staffKey -> ObjectId in memory so each job does not need its own find_one lookups.
+# ObjectIds of newly inserted documents come from the bulk upsert results. Documents that already existed
+# are loaded with one projected find per collection.
+# On an incremental sync only the patients/staff referenced by the changed jobs are looked up (see prefetch below).
+patient_ids = ObjectIdResolver(patient_collection, "patientKey").add_upserted(patient_summary)
+if patient_summary["matched"] and not incremental:
+    patient_ids.preload()
+staff_ids = ObjectIdResolver(staff_collection, "staffKey").add_upserted(staff_summary)
+if staff_summary["matched"] and not incremental:
+    staff_ids.preload()
+
+# Read the child rows of the jobs selected by conditions and group them into dictionaries keyed by JobId.
+# {job_id} in a condition is replaced with the JobId column of each child query.
+def read_job_children(conditions, params):
+    # The four child tables do not depend on each other, so they are extracted concurrently
+    child_frames = read_sql_concurrently(
+        engine,
+        {
+            "StatusLog": (filter_query(status_query, [c.format(job_id="sl.JobId") for c in conditions]), params),
+            "ActionLog": (filter_query(action_query, [c.format(job_id="JobId") for c in conditions]), params),
+            "JobStaff": (filter_query(job_staff_query, [c.format(job_id="JobId") for c in conditions]), params),
+            "XRayCheck": (filter_query(xray_check_query, [c.format(job_id="JobId") for c in conditions]), params),
+        },
+        max_workers=extract_workers
+    )
+
+    status_df = child_frames["StatusLog"]
+    # Sort by JobId once and build each job's status list from a contiguous slice (nulls become None)
+    status_data = group_records(status_df, "JobId", {"StatusName": "StatusName", "ChangedDate": "ChangedDate"})
+    # Verify transformation by printing first 5 rows
+    print(status_df.head())
+
+    action_df = child_frames["ActionLog"]
+    action_df["PerformedBy"]= action_df["PerformedBy"].astype("Int64")
+    # Sort by JobId once and build each job's action list from a contiguous slice (nulls become None)
+    action_data = group_records(action_df, "JobId", {"comment": "ActionDescription", "staffMember": "PerformedBy", "date": "PerformedDate"})
+    # Verify transformation by printing first 5 rows
+    print(action_df.head())
+
+    job_staff_df = child_frames["JobStaff"]
+    job_staff_data = group_values(job_staff_df, "JobId", "StaffId")
+
+    xray_check_df = child_frames["XRayCheck"]
+    xray_check_data = group_values(xray_check_df, "JobId", "StaffId")
+    print(xray_check_df.head())
+
+    # Look up every staff member referenced by these jobs that is not cached yet, with one $in query
+    staff_ids.prefetch(
+        set(job_staff_df["StaffId"].dropna().tolist())
+        | set(xray_check_df["StaffId"].dropna().tolist())
+        | set(action_df["PerformedBy"].dropna().tolist())
     )
+    return status_data, action_data, job_staff_data, xray_check_data
+
+# Build the upsert for each job, matched in MongoDB by its JobId
+def job_updates(job_df, status_data, action_data, job_staff_data, xray_check_data):
+    # Convert each column once for the whole frame instead of once per cell.
+    # Datetime columns become native datetimes (None for NaT), the rest plain Python values.
+    datetime_columns = ["DateQueryReceived", "DateJobLogged", "DateMRIRequested", "DateMRIPlanned", "PTLTargetDate", "PhysicsTargetDate"]
+    columns = {
+        col: to_python_datetimes(job_df[col]) if col in datetime_columns else job_df[col].tolist()
+        for col in job_df.columns
+    }
+    has_patient = job_df["PatientId"].notna().tolist()
+
+    for (
+        job_id, job_code, patient_present, patient_id, patient_type, date_mri_requested, date_mri_planned,
+        urgency_code, urgency_type, site, date_query_received, contact_method, query_text, date_job_logged,
+        implant_name, mr_safety_name, cris_comment, cris_written_by, ptl_target_date, physics_target_date,
+    ) in zip(
+        columns["JobId"], columns["JobCode"], has_patient, columns["PatientId"], columns["PatientTypeName"],
+        columns["DateMRIRequested"], columns["DateMRIPlanned"], columns["UrgencyCode"], columns["UrgencyType"],
+        columns["SiteShortName"], columns["DateQueryReceived"], columns["ContactMethodName"], columns["QueryText"],
+        columns["DateJobLogged"], columns["ImplantName"], columns["MRSafetyName"], columns["CRISComment"],
+        columns["CRISCommentWrittenBy"], columns["PTLTargetDate"], columns["PhysicsTargetDate"],
+    ):
+        xray_checks = xray_check_data.get(job_id)
+        actions = action_data.get(job_id)
+
+        # Construct update_data for MongoDB
+        update_data = {
+            "$set": {
+                "jobKey": job_id,
+                "jobCode": job_code,
+                "patientDetails": {
+                    "patientId": patient_ids.resolve(patient_id) if patient_present else None,
+                    "patientType": patient_type if patient_type else None,
+                },
+                "scanDetails": {
+                    **({"dateMRIRequested": date_mri_requested} if date_mri_requested is not None else {}),
+                    **({"dateMRIScheduled": date_mri_planned} if date_mri_planned is not None else {}),
+                    "urgency": {
+                        "urgencyCode": urgency_code if urgency_code else None,
+                        "urgencyType": urgency_type if urgency_type else None,
+                    },
+                    "site": site if site else None,
+                },
+                "queryDetails": {
+                    "dateReceived": date_query_received if date_query_received is not None else [],
+                    "receivedBy": contact_method,
+                    "message": query_text
+                },
 
-print(xray_check_df.head())
-
-# Function to get ObjectID for a patient already in MongoDB
-def get_patient_object_id(patient_id):
-    patient = patient_collection.find_one({"patientKey": patient_id})
-    return patient["_id"] if patient else None
-
-# Function to get ObjectID for staff members already in MongoDB
-def get_staff_object_ids(ids, field_name, collection):
-
-    staff_object_ids = []
-    for id_ in ids:
-        doc = collection.find_one({field_name: id_}, {"_id": 1})
-        if doc:
-            staff_object_ids.append(doc["_id"])
-    return staff_object_ids
-
-# Iterate over the job data
-for _, job in job_df.iterrows():
-    # Match the job by JobId
-    query = {"jobKey": job["JobId"]}        # Match job by its JobId
-    
-    # Construct update_data for MongoDB
-    update_data = {
-        "$set": {
-            "jobKey": job["JobId"],
-            "jobCode": job["JobCode"],
-            "patientDetails": {
-                "patientId": get_patient_object_id(job["PatientId"]) if pd.notnull(job["PatientId"]) else None,
-                "patientType": job["PatientTypeName"] if job["PatientTypeName"] else None,
-            },
-            "scanDetails": {
-                **({"dateMRIRequested": job["DateMRIRequested"]} if pd.notnull(job["DateMRIRequested"]) else {}),
-                **({"dateMRIScheduled": job["DateMRIPlanned"]} if pd.notnull(job["DateMRIPlanned"]) else {}),
-                "urgency": {
-                    "urgencyCode": job["UrgencyCode"] if job["UrgencyCode"] else None,
-                    "urgencyType": job["UrgencyType"] if job["UrgencyType"] else None,
+                "safetyInvestigation": {
+                    "dateJobLogged": date_job_logged,
+                    "staffAssigned": staff_ids.resolve_many(job_staff_data.get(job_id, [])),
+                    "implantCategory": implant_name,
+                    "mrSafety": mr_safety_name,
+                    # ** Optional field
+                    **({"xrayCheckedBy": staff_ids.resolve_many(xray_checks)} if xray_checks else {}),
+                    # ** Optional field
+                    **({"actionLog": [
+                        {
+                            **action,  # Include all existing fields in the action
+                            "staffMember": (
+                                staff_ids.resolve(action["staffMember"])
+                                if action["staffMember"] is not None
+                                else None  # Set to None if staffMember is null
+                            )
+                        }
+                        for action in actions
+                    ]} if actions else {}),
+                    # ** Optional field
+                    **({"CRIS": {
+                        "comment": cris_comment,
+                        "writtenBy": cris_written_by
+                    }} if cris_comment else {})
                 },
-                "site": job["SiteShortName"] if job["SiteShortName"] else None,
-            } ,
-            "queryDetails": {
-                "dateReceived": job["DateQueryReceived"].to_pydatetime() if pd.notnull(job["DateQueryReceived"]) else [],
-                "receivedBy": job.get("ContactMethodName"),
-                "message": job.get("QueryText")
-            },
-            
-            "safetyInvestigation": {
-                "dateJobLogged": job.get("DateJobLogged"),
-                "staffAssigned": get_staff_object_ids(
-                    job_staff_data.get(job["JobId"], []),  # List of staff IDs
-                    "staffKey",                            # Field to match on
-                    staff_collection                       # MongoDB collection
-                ),
-
-                "implantCategory": job.get("ImplantName"),
-                "mrSafety": job.get("MRSafetyName"),
-                **({"xrayCheckedBy" :get_staff_object_ids(xray_check_data.get(job["JobId"],[]),"staffKey",staff_collection)}if xray_check_data.get(job["JobId"]) else {}),
-            # ** Optional field
-                **({"actionLog": [
-                    {
-                        **action,  # Include all existing fields in the action
-                        "staffMember": (
-                            get_staff_object_ids(
-                                [int(action["staffMember"])], "staffKey", staff_collection
-                            )[0]  # Get the first (and only) ObjectId
-                            if pd.notnull(action["staffMember"]) and action["staffMember"] is not None
-                            else None  # Set to None if staffMember is null
-                        )
-                    }
-                    for action in action_data.get(job["JobId"], [])
-                ]
-            } if action_data.get(job["JobId"]) else {}),
-            # ** Optional field
-                **({"CRIS": {
-                    "comment": job.get("CRISComment"),
-                    "writtenBy": job.get("CRISCommentWrittenBy")
-                }} if job.get("CRISComment") else {})
-            },
-
-            "statusLog": status_data.get(job["JobId"], []),
-
-            "kpiPerformance": {
-                "ptlTargetDate": job["PTLTargetDate"].to_pydatetime() if pd.notnull(job["PTLTargetDate"]) else None,
-                "physicsTargetDate": job["PhysicsTargetDate"].to_pydatetime() if pd.notnull(job["PhysicsTargetDate"]) else None,
+
+                "statusLog": status_data.get(job_id, []),
+
+                "kpiPerformance": {
+                    "ptlTargetDate": ptl_target_date,
+                    "physicsTargetDate": physics_target_date,
+                }
             }
         }
-    }
-    # Perform the upsert operation in MongoDB
-    try:
-        result = job_collection.update_one(query, update_data, upsert=True)
-        job_document_count+=1
-    except Exception as e:
-        print(f"Error processing JobId {job['JobId']}: {e}")
-print(f'{job_document_count} of {len(job_data)} records successfully upserted into collection.')
+        yield job_id, update_data
+
+# Sync the jobs changed since the high-water mark (every job when since is None), reading them in one DataFrame
+# or as a stream of JobId-ordered chunks of chunk_size jobs. Returns (jobs read, jobs that failed to write).
+def sync_jobs(since=None, chunk_size=None):
+    # Only jobs changed since the high-water mark on an incremental sync, otherwise every job
+    job_conditions = ["{job_id} IN (" + changed_jobs_query + ")"] if since else []
+    job_params = {"since": since}
+
+    # Running totals across chunks
+    job_record_count = 0
+    job_error_count = 0
+
+    # stream_results asks the driver to fetch rows as they are needed instead of buffering the whole result.
+    # The connection is closed however the loop ends, so a failed chunk does not leave the server-side cursor open.
+    with engine.connect() as job_connection:
+        if chunk_size:
+            job_chunks = read_filtered(
+                job_query, [c.format(job_id="j.JobId") for c in job_conditions], job_params, order_by="j.JobId",
+                connection=job_connection.execution_options(stream_results=True), chunksize=chunk_size
+            )
+        else:
+            job_chunks = [read_filtered(job_query, [c.format(job_id="j.JobId") for c in job_conditions], job_params, connection=job_connection)]
+
+        for job_df in job_chunks:
+            # Replace null values with None
+            job_df = job_df.where(pd.notnull(job_df), None)
+
+            # When streaming, read only the child rows for this chunk's JobId range
+            chunk_conditions = list(job_conditions)
+            chunk_params = dict(job_params)
+            if chunk_size:
+                chunk_conditions.append("{job_id} BETWEEN :first_job AND :last_job")
+                chunk_params.update(first_job=int(job_df["JobId"].min()), last_job=int(job_df["JobId"].max()))
+                print(f"Syncing JobId {chunk_params['first_job']} to {chunk_params['last_job']}")
+            status_data, action_data, job_staff_data, xray_check_data = read_job_children(chunk_conditions, chunk_params)
+
+            # Look up every patient referenced by these jobs that is not cached yet, with one $in query
+            patient_ids.prefetch(job_df["PatientId"].dropna().tolist())
+
+            # Send the job upserts to MongoDB in batches
+            job_summary = bulk_upsert(
+                job_collection,
+                job_updates(job_df, status_data, action_data, job_staff_data, xray_check_data),
+                "jobKey",
+                batch_size
+            )
+            job_record_count += len(job_df)
+            job_error_count += job_summary["errors"]
+    return job_record_count, job_error_count
+
+job_record_count, job_error_count = sync_jobs(job_since, chunk_size)
+
+job_document_count = job_record_count - job_error_count
+print(f'{job_document_count} of {job_record_count} records successfully upserted into collection.')
+# Move the high-water mark on only if every job was written
+if not job_error_count:
+    set_high_water_mark(sync_state_collection, "job", run_started)
+patient_ids.report()
+staff_ids.report()
 
 # %%
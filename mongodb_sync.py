@@ -0,0 +1,187 @@
+import numpy as np
+import pandas as pd
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+# Number of UpdateOne operations sent to MongoDB in a single bulk_write call
+DEFAULT_BATCH_SIZE = 1000
+
+# Upsert documents into a collection in batches using unordered bulk writes
+def bulk_upsert(collection, updates, key_field, batch_size=DEFAULT_BATCH_SIZE):
+    # updates is an iterable of (key, update_data) pairs, e.g. (PatientId, {"$set": {...}})
+    # Documents are matched on key_field, so each pair becomes UpdateOne({key_field: key}, update_data, upsert=True)
+
+    # Running totals across all batches
+    summary = {"upserted": 0, "modified": 0, "matched": 0, "errors": 0, "upserted_ids": {}}
+
+    batch_keys = []
+    batch_operations = []
+    batch_number = 0
+
+    def flush():
+        # Send the current batch to MongoDB and add its counts to the summary
+        nonlocal batch_number
+        batch_number += 1
+        try:
+            # ordered=False lets MongoDB carry on past a failed document and apply the rest of the batch
+            result = collection.bulk_write(batch_operations, ordered=False)
+            details = result.bulk_api_result
+        except BulkWriteError as e:
+            details = e.details
+            # Report each failed record individually, mapping the operation index back to its key
+            for error in details.get("writeErrors", []):
+                print(f"Error processing record {key_field}={batch_keys[error['index']]}: {error.get('errmsg')}")
+        except Exception as e:
+            # Whole batch failed (e.g. lost connection) - count every record in it as an error
+            print(f"Error processing batch {batch_number} ({len(batch_operations)} records): {e}")
+            summary["errors"] += len(batch_operations)
+            return
+
+        upserted = details.get("upserted", [])
+        errors = len(details.get("writeErrors", []))
+        summary["upserted"] += len(upserted)
+        summary["modified"] += details.get("nModified", 0)
+        summary["matched"] += details.get("nMatched", 0)
+        summary["errors"] += errors
+        # Keep the ObjectIds of newly inserted documents so later phases can reference them without a lookup
+        for item in upserted:
+            summary["upserted_ids"][batch_keys[item["index"]]] = item["_id"]
+        print(f"Batch {batch_number}: {len(upserted)} upserted, {details.get('nModified', 0)} modified, {errors} errors")
+
+    for key, update_data in updates:
+        batch_keys.append(key)
+        batch_operations.append(UpdateOne({key_field: key}, update_data, upsert=True))
+        if len(batch_operations) >= batch_size:
+            flush()
+            batch_keys = []
+            batch_operations = []
+
+    # Send any remaining operations
+    if batch_operations:
+        flush()
+
+    return summary
+
+# In-memory cache of key -> ObjectId for a collection, e.g. patientKey -> _id
+class ObjectIdResolver:
+    def __init__(self, collection, key_field):
+        self.collection = collection
+        self.key_field = key_field
+        self.object_ids = {}
+        # Keys already looked up in MongoDB and not found, so they are not queried again
+        self.not_found = set()
+        # Counters for keys served from memory (hits), keys that needed a query (misses) and lookups of keys
+        # with no document (not_found_lookups). A key repeated within one resolve_many call is counted once.
+        self.hits = 0
+        self.misses = 0
+        self.not_found_lookups = 0
+
+    # Load every key -> _id pair with a single projected find
+    def preload(self):
+        for doc in self.collection.find({}, {self.key_field: 1, "_id": 1}):
+            if self.key_field in doc:
+                self.object_ids[doc[self.key_field]] = doc["_id"]
+        print(f"Preloaded {len(self.object_ids)} {self.key_field} ObjectIds from {self.collection.name}")
+        return self
+
+    # Seed the cache from a bulk_upsert summary so newly inserted documents need no lookup
+    def add_upserted(self, summary):
+        self.object_ids.update(summary["upserted_ids"])
+        self.not_found.difference_update(summary["upserted_ids"])
+        return self
+
+    # Fetch all keys that are not cached yet with one $in query
+    def prefetch(self, keys):
+        missing = {
+            key for key in keys
+            if key is not None and key not in self.object_ids and key not in self.not_found
+        }
+        if not missing:
+            return
+        self.misses += len(missing)
+        # Convert numpy scalars (e.g. from a DataFrame column) to Python values so they can be encoded as BSON
+        query_keys = [key.item() if hasattr(key, "item") else key for key in missing]
+        for doc in self.collection.find({self.key_field: {"$in": query_keys}}, {self.key_field: 1, "_id": 1}):
+            self.object_ids[doc[self.key_field]] = doc["_id"]
+        self.not_found.update(key for key in missing if key not in self.object_ids)
+
+    # Return the ObjectId for a single key, or None if there is no matching document
+    def resolve(self, key):
+        if key in self.object_ids:
+            self.hits += 1
+            return self.object_ids[key]
+        self.prefetch([key])
+        if key not in self.object_ids:
+            self.not_found_lookups += 1
+        return self.object_ids.get(key)
+
+    # Return the ObjectIds for a list of keys, leaving out keys with no matching document
+    def resolve_many(self, keys):
+        unique_keys = set(keys)
+        self.hits += sum(1 for key in unique_keys if key in self.object_ids)
+        self.prefetch(unique_keys)
+        self.not_found_lookups += sum(1 for key in unique_keys if key not in self.object_ids)
+        return [self.object_ids[key] for key in keys if key in self.object_ids]
+
+    # Print cache statistics
+    def report(self):
+        print(
+            f"{self.key_field} lookups: {self.hits} from cache, {self.misses} queried, "
+            f"{self.not_found_lookups} not found ({len(self.not_found)} distinct keys)"
+        )
+
+# Convert a datetime column to native Python datetimes in one pass, with None in place of NaT
+def to_python_datetimes(series):
+    # datetime64[us] -> object gives datetime.datetime values (and None for NaT) without boxing each cell as a Timestamp
+    return pd.to_datetime(series).to_numpy(dtype="datetime64[us]").astype(object).tolist()
+
+# Convert any column to a list of plain Python values in one pass, with None in place of NaN/NaT/NA
+def to_python_values(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return to_python_datetimes(series)
+    return series.astype(object).where(series.notna(), None).tolist()
+
+# Sort the rows of a frame by key_column once and return (keys, offsets, order).
+# Rows for keys[i] are order[offsets[i]:offsets[i + 1]], in their original order.
+def _split_by_key(df, key_column):
+    key_values = df[key_column].to_numpy()
+    # Rows without a key are left out, as groupby does by default
+    present = np.flatnonzero(df[key_column].notna().to_numpy())
+    # Stable sort keeps the original row order within each key
+    order = present[np.argsort(key_values[present], kind="stable")]
+    # No keyed rows (e.g. a chunk of jobs without any x-ray checks): no groups, and nothing to index below
+    if len(order) == 0:
+        return [], np.array([0]), order
+    sorted_keys = key_values[order]
+    boundaries = np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1
+    offsets = np.concatenate(([0], boundaries, [len(order)]))
+    keys = sorted_keys[offsets[:-1]].tolist()
+    return keys, offsets, order
+
+# Build {key: [{field: value, ...}, ...]} from contiguous slices of the key-sorted frame.
+# fields maps the output field name to the source column, e.g. {"StatusName": "StatusName"}
+def group_records(df, key_column, fields):
+    keys, offsets, order = _split_by_key(df, key_column)
+    names = list(fields)
+    columns = [np.asarray(to_python_values(df[column]), dtype=object)[order] for column in fields.values()]
+    records = [dict(zip(names, row)) for row in zip(*columns)]
+    return {key: records[start:end] for key, start, end in zip(keys, offsets[:-1], offsets[1:])}
+
+# Build {key: [value, ...]} for a single column, e.g. JobId -> list of StaffId
+def group_values(df, key_column, column):
+    keys, offsets, order = _split_by_key(df, key_column)
+    values = np.asarray(to_python_values(df[column]), dtype=object)[order].tolist()
+    return {key: values[start:end] for key, start, end in zip(keys, offsets[:-1], offsets[1:])}
+
+# Read the high-water mark saved by the last successful sync of a collection (None if it has never synced)
+def get_high_water_mark(state_collection, name):
+    state = state_collection.find_one({"collection": name})
+    return state["highWaterMark"] if state else None
+
+# Save the high-water mark for a collection once it has synced without errors
+def set_high_water_mark(state_collection, name, value):
+    state_collection.update_one(
+        {"collection": name},
+        {"$set": {"collection": name, "highWaterMark": value}},
+        upsert=True
+    )
@@ -1,43 +1,100 @@
 #%% 
+import argparse
+import glob
+import os
+import re
+import time
+import tracemalloc
 import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine
-
-#Connect to database on server
-def connect_to_db(server_name, database_name):
-    try:
-        connection_string = f"mssql+pyodbc://{server_name}/{database_name}?driver=ODBC+Driver+17+for+SQL+Server&trusted_connection=yes"
-        engine = create_engine(connection_string)
-        print(f"Connection to database {database_name} successful")
-        return engine
-    except Exception as e:
-        print(f"Error connecting to database {database_name} on server {server_name}: {e}")
+from concurrent.futures import ProcessPoolExecutor
+from db_connection import connect_to_db, bulk_load
+from intermediate_store import IntermediateStore, file_hash
 
+# Default database the staging tables are loaded into (override with --server / --database)
 server_name ="[]"
 database_name = "CMI_MRSafetyDB"
-engine = connect_to_db(server_name, database_name)
+
+# How staging tables are loaded: "executemany", "multi" or "bulk" (CSV + BULK INSERT), see db_connection.bulk_load
+load_method = "executemany"
+
+# Define new column names in dictionary
+new_column_names = {                                # Most column names in spreadsheet do not match up with columns in database. To simplify loading, will rename those columns now
+    "Date Job Logged":"DateJobLogged",              
+    "PtId":"HospitalNumber",
+    "Jobid":"JobId",
+    "DateQueryRaised":"DateQueryReceived",
+    "PtId(NhsNumber)":"NHSNumber",
+    "PtInitials":"Initials",
+    "RequestDate":"MRIRequestDate",
+    "QueryType":"ContactMethod",
+    "Planned/AppDate":"DateMRIPlanned",
+    "Query":"QueryFreeText",
+    "CrisComment":"CRISComment",
+    "Intitals(WorkedOn)":"StaffAssigned",
+    "MrCond":"MRSafetyName",
+    "XrayCheck":"XRayCheckStaff",
+    "Status":"MidStatus",
+    "RespondedOn":"DateMidStatusChanged",
+    "Status.1":"Status",
+    "ReadyToBookOrCancelled":"DateJobCompleted"
+}
+
+# Input schema, keyed by the column names used in the database (see new_column_names above)
+# Low-cardinality text columns are read as category so each distinct value is stored once
+category_columns = ["Site","ContactMethod","PatientType","ImplantCategory","MRSafetyName","Status","MidStatus","Urgency","StaffAssigned","XRayCheckStaff"]
+# Identifiers are kept as strings so leading zeros and spacing survive until they are cleaned
+string_columns = ["HospitalNumber","NHSNumber","Initials"]
+# Free text is read as str too: a column left blank in a whole chunk of the export would otherwise be read as float
+free_text_columns = ["QueryFreeText","CRISComment","NextAction"]
+# List all date columns in df to be converted to datetime format, all written as dd/mm/yyyy in the spreadsheet
+date_columns = ["DateJobLogged","DateQueryReceived","MRIRequestDate","DateMRIPlanned","DateMidStatusChanged","PhysicsDone","DateJobCompleted"]
+date_format = "%d/%m/%Y"
+
+# Change a spreadsheet column name to PascalCase for consistency
+def standardise_column_name(col):
+    return col.strip().title().replace(" ","") #strip() removes leading/trailing spaces, title() capitalises first letter & rest lowercase
+
+# Column name a spreadsheet column ends up with once renamed to match the database
+def database_column_name(col):
+    col = standardise_column_name(col)
+    return new_column_names.get(col, col)
+
+# Make integer columns as small as their values allow, e.g. int64 -> int16
+def downcast_numerics(df):
+    for col in df.select_dtypes(include="integer").columns:
+        df[col] = pd.to_numeric(df[col], downcast="integer")
+    return df
+
+# dtype and parse_dates arguments for read_csv, given {csv column: database column name}
+def read_options(column_names):
+    dtypes = {}
+    for col, name in column_names.items():
+        if name in category_columns:
+            dtypes[col] = "category"
+        elif name in string_columns or name in free_text_columns:
+            dtypes[col] = str
+    parse_dates = [col for col, name in column_names.items() if name in date_columns]
+    return dtypes, parse_dates
 
 #Extract: Read the CSV file
 def extract_data(file_path):
     try:
-        df=pd.read_csv(file_path)
+        # Read the header only, to find which spreadsheet column holds each schema column
+        raw_columns = pd.read_csv(file_path, nrows=0).columns
+        dtypes, parse_dates = read_options({col: database_column_name(col) for col in raw_columns})
+
+        # Dates that do not match date_format are left as text here and coerced to NaT by convert_dates
+        df=pd.read_csv(file_path, dtype=dtypes, parse_dates=parse_dates, date_format=date_format)
+        df = downcast_numerics(df)
         print(f"Data extracted successfully from {file_path}.")
         return df
     except Exception as e:
         print(f"Error extracting data from CSV file: {e}")
         return None
 
-file_path = []
-
-# Display first 5 rows
-print(df.head())
-
 #%% RENAME COLUMNS
 
-# Change column names to PascalCase for consistency
-df.columns = [col.strip().title().replace(" ","") for col in df.columns] #strip() removes leading/trailing spaces, title() capitalises first letter & rest lowercase
-print(df.columns)
-
 # Drop unwanted columns from df
 unwanted_columns = ['PtId(Rk9,Nhs)','PtlTargetDate','PhysicsTargetDate','PtlOverDue','OverDue/DaysLeft','OverDue/WeeksLeft','Complex?','Comment'] 
 
@@ -50,54 +107,44 @@ def drop_unwanted_columns(df,unwanted_columns):
             print(f"Column {col} not found in DataFrame.")
     return df
 
-df = drop_unwanted_columns(df,unwanted_columns)
-# Print output
-print(df.columns)   
+def rename_columns(df):
+    # Change column names to PascalCase for consistency
+    df.columns = [standardise_column_name(col) for col in df.columns]
+    print(df.columns)
+
+    df = drop_unwanted_columns(df,unwanted_columns)
+    # Print output
+    print(df.columns)   
+
+    # Rename columns using new_column_names, defined with the input schema at the top
+    df = df.rename(columns=new_column_names)
+    # Print output
+    print(df.columns)
+    return df
 
-# Define new column names in dictionary
-new_column_names = {                                # Most column names in spreadsheet do not match up with columns in database. To simplify loading, will rename those columns now
-    "Date Job Logged":"DateJobLogged",              
-    "PtId":"HospitalNumber",
-    "Jobid":"JobId",
-    "DateQueryRaised":"DateQueryReceived",
-    "PtId(NhsNumber)":"NHSNumber",
-    "PtInitials":"Initials",
-    "RequestDate":"MRIRequestDate",
-    "QueryType":"ContactMethod",
-    "Planned/AppDate":"DateMRIPlanned",
-    "Query":"QueryFreeText",
-    "CrisComment":"CRISComment",
-    "Intitals(WorkedOn)":"StaffAssigned",
-    "MrCond":"MRSafetyName",
-    "XrayCheck":"XRayCheckStaff",
-    "Status":"MidStatus",
-    "RespondedOn":"DateMidStatusChanged",
-    "Status.1":"Status",
-    "ReadyToBookOrCancelled":"DateJobCompleted"
-}
-df = df.rename(columns=new_column_names)
-# Print output
-print(df.columns)
 #%% DATA QUALITY CHECKS
 
-# Find number of records in df
-num_records = len(df.index)
-print(f"Number of records extracted from CSV: {num_records}")
+def data_quality_report(df):
+    # Find number of records in df
+    print(f"Number of records extracted from CSV: {len(df.index)}")
 
-# Find number of null values in each column
-print(df.isnull().sum())
+    # Find number of null values in each column
+    print(df.isnull().sum())
 
-# Find data type of each column
-print(df.dtypes)
+    # Find data type of each column
+    print(df.dtypes)
 
 # Check for duplicate and blank jobs 
-def check_jobid(df):
+# key_columns identify a job and its patient as written in the spreadsheet
+def check_jobid(df, key_columns=None):
+    key_columns = key_columns or ["JobId","HospitalNumber","NHSNumber"]
+    num_records = len(df.index)
 
     # Drop duplicate jobs with same JobId & same patient
-    duplicate_jobs = df.duplicated(subset=["JobId","HospitalNumber","NHSNumber"], keep=False)
+    duplicate_jobs = df.duplicated(subset=key_columns, keep=False)
     if not duplicate_jobs.empty:
         # Drop duplicate jobs
-        df = df.drop_duplicates(subset=["JobId","HospitalNumber","NHSNumber"],keep="first")
+        df = df.drop_duplicates(subset=key_columns,keep="first")
         # Calculate number of duplicate drops dropped
         num_duplicate_jobs_dropped = num_records - len(df.index)
         # Print output
@@ -117,15 +164,55 @@ def check_jobid(df):
   
     return df
 
-df = check_jobid(df)
-
 #%% DATA CLEANING
 # This section defines a function to clean the data in each column of the df
 
+# Identifier validation
+# Reason codes given to rows whose identifiers fail validation
+hospital_number_format_error = "HOSPITAL_NUMBER_FORMAT"
+nhs_number_format_error = "NHS_NUMBER_FORMAT"
+nhs_number_check_digit_error = "NHS_NUMBER_CHECK_DIGIT"
+
+# Weights for the NHS number modulus 11 check: the first nine digits are multiplied by 10 down to 2
+nhs_check_weights = np.arange(10, 1, -1)
+
+# Character codes of each value as a matrix with one row per value and one column per character,
+# along with each value's length and whether it is present. Only the first width + 1 characters are
+# kept, so any value longer than width has length width + 1.
+def character_matrix(values, width):
+    present = values.notna().to_numpy()
+    text = np.where(present, values.to_numpy(dtype=object), "")
+    chars = text.astype(f"U{width + 1}").view(np.uint32).reshape(-1, width + 1)
+    # Shorter values are padded with code 0
+    lengths = (chars != 0).sum(axis=1)
+    return chars, lengths, present
+
+# Reason code for each hospital number, or None if it is valid or missing.
+# To be valid, hospital number must be in format of 1 letter & 6 numbers or 6 numbers only
+def hospital_number_errors(values):
+    chars, lengths, present = character_matrix(values, 7)
+    is_digit = (chars >= ord("0")) & (chars <= ord("9"))
+    is_letter = ((chars >= ord("A")) & (chars <= ord("Z"))) | ((chars >= ord("a")) & (chars <= ord("z")))
+    valid = ((lengths == 6) & is_digit[:, :6].all(axis=1)) | ((lengths == 7) & is_letter[:, 0] & is_digit[:, 1:7].all(axis=1))
+    return np.where(present & ~valid, hospital_number_format_error, None)
+
+# Reason code for each NHS number, or None if it is valid or missing.
+# A valid NHS number is 10 digits where the last digit is the modulus 11 check digit of the first nine.
+def nhs_number_errors(values):
+    chars, lengths, present = character_matrix(values, 10)
+    digits = chars[:, :10].astype(np.int64) - ord("0")
+    well_formed = (lengths == 10) & ((digits >= 0) & (digits <= 9)).all(axis=1)
+    # Check digit is 11 minus the remainder of the weighted sum; 11 means 0 and 10 means the number is invalid
+    check_digit = 11 - (digits[:, :9] @ nhs_check_weights) % 11
+    check_digit[check_digit == 11] = 0
+    valid_check_digit = check_digit == digits[:, 9]
+    return np.where(
+        ~present, None,
+        np.where(~well_formed, nhs_number_format_error, np.where(valid_check_digit, None, nhs_number_check_digit_error))
+    )
+
 # Hospital Number
 def clean_hospital_number(df):
-    # To be valid, hospital number must be in format of 1 letter & 6 numbers or 6 numbers only
-    valid_pattern = r"^[A-Za-z]{1}\d{6}$|^\d{6}$"   
     # Removes any non-digit or non-letter characters from string including spaces
     df["HospitalNumber"] = df["HospitalNumber"].str.replace(r"[^A-Za-z0-9]","",regex=True) 
     # Replaces empty strings as a result of previous step with NaN so they are ignored     
@@ -135,24 +222,21 @@ def clean_hospital_number(df):
     #RK9 is the hospital ODS code. If added to string, it is too long. Drop the "RK9" prefix from any row.   
     df["HospitalNumber"] = df["HospitalNumber"].str.removeprefix("RK9")     
     
-    # If NHS number is entered as hospital number
-    for index, row in df.iterrows():
-        if isinstance(row["HospitalNumber"], str) and row["HospitalNumber"].isdigit() and len(row["HospitalNumber"]) == 10:
-            # Assign the 10-digit hospital number to NHSNumber
-            df.at[index, "NHSNumber"] = row["HospitalNumber"]
-            # Replace the hospital number with NaN
-            df.at[index, "HospitalNumber"] = np.nan
+    # If NHS number is entered as hospital number (10 digits), find all such rows with one mask
+    nhs_entered_as_hospital_number = df["HospitalNumber"].str.fullmatch(r"\d{10}", na=False).to_numpy(dtype=bool)
+    # Assign the 10-digit hospital number to NHSNumber
+    df.loc[nhs_entered_as_hospital_number, "NHSNumber"] = df.loc[nhs_entered_as_hospital_number, "HospitalNumber"].to_numpy()
+    # Replace the hospital number with NaN
+    df.loc[nhs_entered_as_hospital_number, "HospitalNumber"] = np.nan
 
     #Verify if format of hospital number is valid. Creates new column in df. 
-    df["HospitalNumber_valid"]=df["HospitalNumber"].str.match(valid_pattern,na=True)   
+    df["HospitalNumber_valid"] = pd.isna(hospital_number_errors(df["HospitalNumber"]))
     # Filters df to find invalid hospital numbers
     invalid_hospital_numbers = df[df["HospitalNumber_valid"] == False]
     # Prints invalid hospital numbers
     print(invalid_hospital_numbers)
     return df
 
-df = clean_hospital_number(df)
-
 # NHS Number
 def clean_nhs_number(df):
     # Valid format of NHS number is 10 digits, usually presented as 123 456 7890
@@ -169,8 +253,6 @@ def clean_nhs_number(df):
     print(invalid_nhs_numbers.tolist())
     return df
 
-df = clean_nhs_number(df)
-
 # Patient initials
 def clean_patient_initials(df):
     # Remove any non-letter characters, including spaces
@@ -183,50 +265,56 @@ def clean_patient_initials(df):
     df["Initials"] = df["Initials"].str.slice(0,5)
     return df
 
-df = clean_patient_initials(df)
-
-# Prints rows that have no patient identifier 
-print(df[df["HospitalNumber"].isnull() & df["NHSNumber"].isnull()])
-
 # Patient identifiers
-def clean_patient(df):
-    # Create a mapping between 'HospitalNumber' and 'NHSNumber' by dropping rows where either is NULL
+# Create a mapping between 'HospitalNumber' and 'NHSNumber' by dropping rows where either is NULL
+def patient_mappings(df):
+    known_patients = df.dropna(subset=['HospitalNumber','NHSNumber'])
     # Forward mapping: create dictionary of HospitalNumber -> NHSNumber
-    patient_mapping = df.dropna(subset=['HospitalNumber','NHSNumber']).set_index('HospitalNumber')['NHSNumber'].to_dict()
+    patient_mapping = known_patients.set_index('HospitalNumber')['NHSNumber'].to_dict()
     # Reverse mapping: create dictionary of NHSNumber -> HospitalNumber
-    patient_mapping_reverse = df.dropna(subset=['HospitalNumber','NHSNumber']).set_index('NHSNumber')['HospitalNumber'].to_dict()
-    # Combine forward and reverse mappings into a single dictionary
-    patient_mapping.update(patient_mapping_reverse)
-
-    # Initialise counter to track the number of updates made
-    updated_patient = 0
-
-    # Iterate through each row in the df to fill missing patient data
-    for idx, row in df.iterrows():
-        # If hospital number is missing but NHS number exists, look up the mapping and update it
-        if pd.isna(row['HospitalNumber']) and pd.notna(row['NHSNumber']):
-            nhs_number = row['NHSNumber']
-            if nhs_number in patient_mapping:
-                df.at[idx, 'HospitalNumber'] = patient_mapping[nhs_number]
-                updated_patient +=1
-        # If NHS number is missing but hospital number exists, look up the mapping and update it
-        elif pd.isna(row['NHSNumber']) and pd.notna(row['HospitalNumber']):
-            hospital_number = row['HospitalNumber']
-            if hospital_number in patient_mapping:
-                df.at[idx, 'NHSNumber'] = patient_mapping[hospital_number]
-                updated_patient += 1
+    patient_mapping_reverse = known_patients.set_index('NHSNumber')['HospitalNumber'].to_dict()
+    return patient_mapping, patient_mapping_reverse
+
+# Fill in whichever of 'HospitalNumber' and 'NHSNumber' is missing using the mapping
+def fill_patient_numbers(df, patient_mapping):
+    # Rows where hospital number is missing but NHS number exists, and the other way round
+    hospital_number_missing = (df['HospitalNumber'].isna() & df['NHSNumber'].notna()).to_numpy()
+    nhs_number_missing = (df['NHSNumber'].isna() & df['HospitalNumber'].notna()).to_numpy()
+
+    # Look up the missing identifier for every such row at once (NaN where there is no mapping)
+    hospital_number_lookup = df.loc[hospital_number_missing, 'NHSNumber'].map(patient_mapping)
+    nhs_number_lookup = df.loc[nhs_number_missing, 'HospitalNumber'].map(patient_mapping)
+
+    # Only fill rows where the mapping found a value
+    hospital_number_found = hospital_number_missing.copy()
+    hospital_number_found[hospital_number_missing] = hospital_number_lookup.notna().to_numpy()
+    nhs_number_found = nhs_number_missing.copy()
+    nhs_number_found[nhs_number_missing] = nhs_number_lookup.notna().to_numpy()
+
+    df.loc[hospital_number_found, 'HospitalNumber'] = hospital_number_lookup.dropna().to_numpy()
+    df.loc[nhs_number_found, 'NHSNumber'] = nhs_number_lookup.dropna().to_numpy()
+
+    # Count the number of updates made
+    updated_patient = int(hospital_number_found.sum() + nhs_number_found.sum())
     # Print the total number of updates made to the df
     print(f"Number of patients updated: {updated_patient}")
     return df       # Return cleaned df
 
-df = clean_patient(df)
+def clean_patient(df):
+    # Prints rows that have no patient identifier 
+    print(df[df["HospitalNumber"].isnull() & df["NHSNumber"].isnull()])
+
+    patient_mapping, patient_mapping_reverse = patient_mappings(df)
+    # Combine forward and reverse mappings into a single dictionary
+    patient_mapping.update(patient_mapping_reverse)
+    return fill_patient_numbers(df, patient_mapping)
 
 # Date columns
 def convert_dates(df,date_columns):
     # Convert each column in 'date_columns' to datetime format with a specified date format
     # Use "coerce" to handle invalid formats by converting them to NaT (Not a Time)
     for col in date_columns:
-        df[col] = pd.to_datetime(df[col],format="%d/%m/%Y",errors="coerce")
+        df[col] = pd.to_datetime(df[col],format=date_format,errors="coerce")
     return df # Return the DataFrame with converted date columns.
 
     # Define a nested function to check the sequence of dates in each row
@@ -245,12 +333,12 @@ def convert_dates(df,date_columns):
     return df
     '''
 
-# List all date columns in df to be converted to datetime format
-date_columns = ["DateJobLogged","DateQueryReceived","MRIRequestDate","DateMRIPlanned","DateMidStatusChanged","PhysicsDone","DateJobCompleted"]
-df = convert_dates(df,date_columns)
-
-# Fills in NULL values in DateJobLogged with corresponding value in DateQueryReceived
-df['DateJobLogged'] = df['DateJobLogged'].fillna(df['DateQueryReceived'])
+# Convert the date columns (listed in date_columns at the top) that were not already parsed at read time
+def clean_dates(df):
+    df = convert_dates(df,date_columns)
+    # Fills in NULL values in DateJobLogged with corresponding value in DateQueryReceived
+    df['DateJobLogged'] = df['DateJobLogged'].fillna(df['DateQueryReceived'])
+    return df
 
 # Urgency
 def clean_urgency(df):
@@ -264,69 +352,76 @@ def clean_urgency(df):
     df["Urgency"] = df["Urgency"].astype(int)
     return df       # Return cleaned df
 
-df = clean_urgency(df)
-# Verify that cleaning is sufficient by printing unique values in column
-print(df["Urgency"].unique())
+
+# Normalize a text column by working out the canonical value of each distinct raw value once,
+# then recoding every row at once. Returns a category column.
+def normalize_column(series, normalizer):
+    # codes[i] is the position of row i's raw value in raw_values; NaN rows get code -1
+    codes, raw_values = pd.factorize(series)
+    # Normalize each distinct raw value once, plus NaN as the last entry so it can be given a default
+    canonical = [normalizer(value) for value in raw_values] + [normalizer(np.nan)]
+    codes = np.where(codes == -1, len(raw_values), codes)
+    # Several raw values can share a canonical value, so factorize the canonical values into the categories
+    canonical_codes, categories = pd.factorize(pd.Series(canonical, dtype=object))
+    return pd.Series(
+        pd.Categorical.from_codes(canonical_codes[codes], categories=categories),
+        index=series.index,
+        name=series.name
+    )
 
 # Site
-def clean_site(df):
-    # Strip white space for consistency
-    df["Site"] = df["Site"].str.strip()
-    # Make all letters uppercase for consistency
-    df["Site"] = df["Site"].str.upper()
+def normalize_site(value):
     # Replace NaN values with 'not specified'
-    df["Site"] = df["Site"].fillna("NOT SPECIFIED")
+    if not isinstance(value, str):
+        return "NOT SPECIFIED"
+    # Strip white space and make all letters uppercase for consistency
+    value = value.strip().upper()
     # Change all variations of Truro/RCHT to TRURO
-    df["Site"] = df["Site"].apply(
-        lambda x: "TRURO" if "TRURO" in x else x
-    )
+    if "TRURO" in value:
+        value = "TRURO"
     # Change all variations of Inhealth to INHEALTH
-    df["Site"] = df["Site"].apply(
-        lambda x: "INHEALTH" if "INHEALTH" in x else x
-    )
+    if "INHEALTH" in value:
+        value = "INHEALTH"
+    return value
+
+def clean_site(df):
+    df["Site"] = normalize_column(df["Site"], normalize_site)
     return df       # Return cleaned df
 
-df = clean_site(df)
-# Verify that cleaning is sufficient by printing unique values in column
-print(df["Site"].unique())
 
 # Contact method
-def clean_contact_method(df):
-    # Strip white space for consistency
-    df["ContactMethod"] = df["ContactMethod"].str.strip()
-    # Make all letters lowercase for consistency
-    df["ContactMethod"] = df["ContactMethod"].str.lower()
+def normalize_contact_method(value):
     # Replace NaN values with 'not specified'
-    df["ContactMethod"] = df["ContactMethod"].fillna("not specified")
+    if not isinstance(value, str):
+        value = "not specified"
+    # Strip white space and make all letters lowercase for consistency
+    value = value.strip().lower()
     # Change all variations of team/teams/MS teams to 'microsoft teams'
-    df["ContactMethod"] = df["ContactMethod"].apply(
-        lambda x: "microsoft teams" if "team" in x else x
-    )
+    if "team" in value:
+        value = "microsoft teams"
     # Change all rows containing 'cris' to 'cris'
-    df["ContactMethod"] = df["ContactMethod"].apply(
-        lambda x: "cris" if "cris" in x else x
-    )
+    if "cris" in value:
+        value = "cris"
     # Make the first letter of each word in string capitalised
-    df["ContactMethod"] = df["ContactMethod"].str.title()
+    return value.title()
+
+def clean_contact_method(df):
+    df["ContactMethod"] = normalize_column(df["ContactMethod"], normalize_contact_method)
     return df       # Return cleaned df
 
-df = clean_contact_method(df)
-# Verify that cleaning is sufficient by printing unique values in column
-print(df["ContactMethod"].unique())
 
 # Patient type
-def clean_patient_type(df):
-    # Strip white space for consistency
-    df["PatientType"] = df["PatientType"].str.strip()
+def normalize_patient_type(value):
     # Replace NaN values with 'not specified'
-    df["PatientType"] = df["PatientType"].fillna("ns")
-    # Capitalise for consistency
-    df["PatientType"] = df["PatientType"].str.upper()
+    if not isinstance(value, str):
+        return "NS"
+    # Strip white space and capitalise for consistency
+    return value.strip().upper()
+
+def clean_patient_type(df):
+    df["PatientType"] = normalize_column(df["PatientType"], normalize_patient_type)
     return df       # Return cleaned df
 
-df = clean_patient_type(df)
-# Verify that cleaning is sufficient by printing unique values in column
-print(df["PatientType"].unique())
 
 # Query
 def clean_query_free_text(df):
@@ -338,196 +433,236 @@ def clean_query_free_text(df):
     print(f"Maximum string length is: {max_query_length}")
     return df       # Return cleaned df
 
-df = clean_query_free_text(df)
-
 # Implant category
-def clean_implant_category(df):
-    # Strip white space for consistency
-    df["ImplantCategory"] = df["ImplantCategory"].str.strip()
+def normalize_implant_category(value):
     # Replace NaN values with 'not stated'
-    df["ImplantCategory"] = df["ImplantCategory"].fillna("Not Stated")
-    # Capitalise for consistency
-    df["ImplantCategory"] = df["ImplantCategory"].str.upper()
+    if not isinstance(value, str):
+        return "NOT STATED"
+    # Strip white space and capitalise for consistency
+    return value.strip().upper()
+
+def clean_implant_category(df):
+    df["ImplantCategory"] = normalize_column(df["ImplantCategory"], normalize_implant_category)
     return df       # Return cleaned df
 
-df = clean_implant_category(df)
-# Verify that cleaning is sufficient by printing unique values in column
-print(df["ImplantCategory"].unique())
 
 # Staff initials
+staff_delimiter_pattern = re.compile(r"[,& \\]")
+
+def normalize_staff(value):
+    # Leave missing staff as NaN
+    if not isinstance(value, str):
+        return np.nan
+    # Strip white space and capitalise for consistency
+    value = value.strip().upper()
+    # Make sure delimiter between staff assigned is '/', replace other delimiters like , & \
+    return staff_delimiter_pattern.sub("/", value)
+
 def clean_staff(df,staff_columns):
     for col in staff_columns:
-        # Strip white space for consistency
-        df[col] = df[col].str.strip()
-        # Capitalise for consistency
-        df[col] = df[col].str.upper()
-        # Make sure delimiter between staff assigned is '/', replace other delimiters like , & \
-        df[col] = df[col].str.replace(r"[,& \\]", "/", regex=True)
+        df[col] = normalize_column(df[col], normalize_staff)
     return df       # Return cleaned df
 
 # Define columns that contain staff initials
 staff_columns = ["StaffAssigned","XRayCheckStaff"]
 
-df = clean_staff(df,staff_columns)
+# MR safety category
+# Abbreviations in data and the safety category name they stand for
+mr_safety_abbreviations = {
+    "MR COND": "MR CONDITIONAL",
+    "RA": "RISK ASSESSMENT"
+}
 
-# Verify that cleaning is sufficient by printing unique values in columns
-print(df["StaffAssigned"].unique())
-print(df["XRayCheckStaff"].unique())
+def normalize_mr_safety_category(value):
+    # Leave missing categories as NaN
+    if not isinstance(value, str):
+        return np.nan
+    # Strip white space and capitalise for consistency
+    value = value.strip().upper()
+    # Replace abbreviations in data with safety category name
+    return mr_safety_abbreviations.get(value, value)
 
-# MR safety category
 def clean_mr_safety_category(df):
-    # Strip white space for consistency
-    df["MRSafetyName"] = df["MRSafetyName"].str.strip()
-    # Capitalise for consistency
-    df["MRSafetyName"] = df["MRSafetyName"].str.upper()
-    # Replace abbreviations in data with safety category name
-    df["MRSafetyName"] = df["MRSafetyName"].apply(
-        lambda x: 'MR CONDITIONAL' if x == 'MR COND' else x
-    )
-    df["MRSafetyName"] = df["MRSafetyName"].apply(
-        lambda x: 'RISK ASSESSMENT' if x == 'RA' else x
-    )
+    df["MRSafetyName"] = normalize_column(df["MRSafetyName"], normalize_mr_safety_category)
     return df       # Return cleaned df
 
-df = clean_mr_safety_category(df)
-# Verify that cleaning is sufficient by printing unique values in column
-print(df["MRSafetyName"].unique())
 
-#%% LOAD STATUS
+#%% IDENTIFIER VALIDATION
 
-# Create new dataframe which contains only relevant columns to status
-df_status = df[['JobId','MidStatus','DateMidStatusChanged','PhysicsDone','Status','DateJobCompleted','DateQueryReceived']]
-# Create empty array
-job_status_data = []
-
-# Iterate through each row of the df_status DataFrame
-for idx, row in df_status.iterrows():
-    # Extract relevant data from the current row
-    job_id = row['JobId']  
-    mid_status = row['MidStatus']
-    status = row['Status']
-    date_status = row['DateJobCompleted']
-    date_physics_done = row['PhysicsDone']
-    date_mid_status = row['DateMidStatusChanged']
-    date_query_received = row['DateQueryReceived']
+# Split off rows whose hospital or NHS number is invalid, so they are quarantined instead of loaded.
+# Returns (valid rows, quarantined rows with a comma-separated ReasonCode).
+def validate_identifiers(df):
+    hospital_errors = hospital_number_errors(df["HospitalNumber"])
+    nhs_errors = nhs_number_errors(df["NHSNumber"])
+    rejected = ~(pd.isna(hospital_errors) & pd.isna(nhs_errors))
 
-    # If 'PhysicsDone' date is present, add a "Physics Done" status entry
-    if pd.notna(date_physics_done):
-        job_status_data.append({'JobId':job_id, 'Status':"Physics Done",'DateStatusChanged':date_physics_done})
+    reasons = [
+        ",".join(code for code in codes if code is not None)
+        for codes in zip(hospital_errors[rejected], nhs_errors[rejected])
+    ]
+    df_quarantine = df.loc[rejected, ["JobId","HospitalNumber","NHSNumber","Initials"]].assign(ReasonCode=reasons)
+
+    # Print how many rows were quarantined for each reason
+    print(f"{len(df_quarantine)} rows quarantined for invalid identifiers.")
+    if len(df_quarantine):
+        print(df_quarantine["ReasonCode"].value_counts())
+    return df[~rejected], df_quarantine
+
+def load_quarantine(df_quarantine, engine, load_method=load_method):
+    # Save the quarantined rows to a CSV file for further inspection
+    df_quarantine.to_csv('quarantine.csv', index=False)
+
+    # Load the quarantined rows into a temporary staging table in the database
+    bulk_load(df_quarantine, 'Quarantine_Temp', engine, method=load_method)
+    return df_quarantine
+
+#%% MEMORY REPORT
+
+# Compare memory used by each column against the same frame with the object/int64 columns read_csv gives by default
+def memory_report(df):
+    baseline_dtypes = {}
+    for col, dtype in df.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            baseline_dtypes[col] = object
+        elif pd.api.types.is_integer_dtype(dtype):
+            baseline_dtypes[col] = "int64"
+    baseline = df.astype(baseline_dtypes)
+
+    report = pd.DataFrame({
+        "Dtype": df.dtypes.astype(str),
+        "BytesBefore": baseline.memory_usage(deep=True, index=False),
+        "BytesAfter": df.memory_usage(deep=True, index=False)
+    })
+    report.loc["Total"] = ["", report["BytesBefore"].sum(), report["BytesAfter"].sum()]
+    print(report)
+    return report
+
+# Make integer columns as small as their values allow now cleaning is finished, then report memory use
+def finish_cleaning(df):
+    df = downcast_numerics(df)
+    memory_report(df)
+    return df
+
+#%% LOAD STATUS
 
+# Rules that turn each job row into status history events, applied in this order for every job.
+# Each rule is (condition, status, date column): condition selects the rows the event applies to,
+# status is either a fixed status name or a function returning the status from the row's columns,
+# and the date column gives the date the status changed.
+# A new status event only needs a new entry here.
+status_rules = [
+    # If 'PhysicsDone' date is present, add a "Physics Done" status entry
+    (lambda df: df['PhysicsDone'].notna(), "Physics Done", 'PhysicsDone'),
     # Handle the "Planned" and "Waiting" statuses, using 'DateQueryReceived' as the status change date
-    if status == "Planned":
-        job_status_data.append({'JobId': job_id, 'Status': "Planned", 'DateStatusChanged': date_query_received})
-    if status == "Waiting":
-        job_status_data.append({'JobId': job_id, 'Status': "Waiting", 'DateStatusChanged': date_query_received})
+    (lambda df: df['Status'] == "Planned", "Planned", 'DateQueryReceived'),
+    (lambda df: df['Status'] == "Waiting", "Waiting", 'DateQueryReceived'),
     # For other statuses, use 'DateJobCompleted' as the status change date
-    else:
-        job_status_data.append({'JobId':job_id, 'Status':status,'DateStatusChanged':date_status})
+    (lambda df: df['Status'] != "Waiting", lambda df: df['Status'], 'DateJobCompleted'),
     # Add an entry for the "Waiting Others" status if applicable
-    if mid_status == "Waiting Others":
-        job_status_data.append({'JobId':job_id, 'Status':mid_status,'DateStatusChanged':date_mid_status})
+    (lambda df: df['MidStatus'] == "Waiting Others", lambda df: df['MidStatus'], 'DateMidStatusChanged'),
+]
+
+def derive_status_events(df, rules):
+    events = []
+    for rule_order, (condition, status, date_column) in enumerate(rules):
+        mask = condition(df).to_numpy(dtype=bool)
+        rule_rows = df[mask]
+        events.append(pd.DataFrame({
+            'JobId': rule_rows['JobId'].to_numpy(),
+            'Status': (status(rule_rows) if callable(status) else pd.Series(status, index=rule_rows.index)).to_numpy(dtype=object),
+            'DateStatusChanged': rule_rows[date_column].to_numpy(),
+            # Source row and rule position, used to put the events back in per-job order
+            'SourceRow': np.flatnonzero(mask),
+            'RuleOrder': rule_order
+        }))
+
+    # Concatenate every rule's events at once and order them job by job, then by rule
+    df_events = pd.concat(events, ignore_index=True)
+    df_events = df_events.sort_values(['SourceRow', 'RuleOrder'], kind='stable', ignore_index=True)
+    return df_events.drop(columns=['SourceRow', 'RuleOrder'])
+
+# Columns relevant to status
+status_columns = ['JobId','MidStatus','DateMidStatusChanged','PhysicsDone','Status','DateJobCompleted','DateQueryReceived']
+
+def load_status(df, engine, load_method=load_method):
+    # Create new dataframe which contains only relevant columns to status
+    df_status = df[status_columns]
+    df_status_new = derive_status_events(df_status, status_rules)
+
+    # Print the number of records in the new DataFrame
+    print(len(df_status_new))
+    # Remove duplicate entries based on the combination of 'JobId' and 'Status'
+    df_status_new = df_status_new.drop_duplicates(subset=['JobId', 'Status'])
+    # Print the number of records after removing duplicates
+    print(len(df_status_new))
+
+    # Save the cleaned DataFrame to a CSV file named 'jobstatushistorytable.csv' for further inspection
+    df_status_new.to_csv('jobstatushistorytable.csv', index=False)
+
+    # Load the data into a temporary staging table in the database
+    bulk_load(df_status_new, 'Status_Temp', engine, method=load_method)
+    return df_status_new
 
-# Create a new DataFrame from the collected data
-df_status_new = pd.DataFrame(job_status_data)
+# %% LOAD ACTION LOG
 
-# Print the number of records in the new DataFrame
-print(len(df_status_new))
-# Remove duplicate entries based on the combination of 'JobId' and 'Status'
-df_status_new = df_status_new.drop_duplicates(subset=['JobId', 'Status'])
-# Print the number of records after removing duplicates
-print(len(df_status_new))
+# Patterns are compiled once and reused for every row
+update_keyword_pattern = re.compile(r'\bupdate\b', re.IGNORECASE)
+# Split point before each "UPDATE" so a NextAction holding several updates becomes one action per update
+update_split_pattern = re.compile(r'(?=UPDATE\b)')
+# "UPDATE {StaffInitials} {Date}: {Description}", anchored to the start of the action
+action_pattern = re.compile(r'^UPDATE\s*([A-Z]{2,3})?\s*(\d{2}/\d{2}(?:/\d{4})?)?\s*:\s*(.*)')
+# Dates written as dd/mm with no year
+short_date_pattern = re.compile(r'^\d{2}/\d{2}$')
+
+def parse_next_actions(df):
+    # Keep only jobs that have a NextAction
+    df_actions = df.loc[df['NextAction'].notna(), ['JobId', 'NextAction']]
+
+    # Prepend 'UPDATE' to ensure uniformity in processing
+    actions = df_actions['NextAction'].where(
+        df_actions['NextAction'].str.contains(update_keyword_pattern),
+        "UPDATE: " + df_actions['NextAction']
+    )
 
-# Save the cleaned DataFrame to a CSV file named 'jobstatushistorytable.csv' for further inspection
-df_status_new.to_csv('jobstatushistorytable.csv', index=False)
+    # Split each NextAction into separate updates and give each update its own row, keeping the JobId
+    df_actions = df_actions.assign(Action=actions.str.split(update_split_pattern)).explode('Action')
+    df_actions['Action'] = df_actions['Action'].str.strip()     # Remove extra whitespace
+    df_actions = df_actions[df_actions['Action'] != ""]         # Skip empty splits
+
+    # Extract staff initials, action date and description from every action in one pass
+    parts = df_actions['Action'].str.extract(action_pattern)
+    matched = parts[2].notna()
+
+    # Convert dates in dd/mm format to include the year 2024, then convert all dates at once
+    action_dates = parts[1].where(~parts[1].str.match(short_date_pattern, na=False), parts[1] + "/2024")
+    action_dates = pd.to_datetime(action_dates, format='%d/%m/%Y', errors='coerce')
+
+    # Improperly formatted "UPDATE" entries are stored with the whole action as the description
+    return pd.DataFrame({
+        'JobId': df_actions['JobId'].to_numpy(),
+        'StaffInitials': parts[0].astype(object).where(parts[0].notna(), None).to_numpy(),
+        'ActionDate': action_dates.to_numpy(),
+        'ActionDescription': parts[2].str.strip().where(matched, df_actions['Action']).to_numpy()
+    })
 
-# Load the data into a temporary staging table in the database
-df_status_new.to_sql('Status_Temp', con=engine, if_exists='append', index=False)
+def load_action_log(df, engine, load_method=load_method):
+    df_actions_new = parse_next_actions(df)
 
-# %% LOAD ACTION LOG
-import re
-import pandas as pd
+    # Save the action log data to a CSV file for further inspection
+    df_actions_new.to_csv('actionlog.csv', index=False)
 
-# Create new DataFrame with columns relevant to actions
-df_comments = df[['JobId', 'NextAction', 'CRISComment', 'StaffAssigned']]
-
-# Prepend 'UPDATE' to ensure uniformity in processing
-df_comments['NextAction'] = df_comments['NextAction'].apply(
-    lambda x: f"UPDATE: {x}" if pd.notna(x) and not re.search(r'\bupdate\b', x, re.IGNORECASE) else x
-)
-
-# Create empty array
-action_table_data = []
-
-# Iterate through each row of the df_comments DataFrame
-for idx, row in df_comments.iterrows():
-    # Extract the Job ID and the NextAction column value
-    job_id = row['JobId']
-    actions = row['NextAction']
-
-    # Skip rows where NextAction is empty or NaN
-    if pd.isna(actions):
-        continue
-
-    # Use regex to split actions into separate updates based on the keyword "UPDATE"
-    action_list = re.split(r'(?=UPDATE\b)', actions)
-
-    # Process each individual action in the split list
-    for action in action_list:
-        action = action.strip()     # Remove extra whitespace
-        if not action:  # Skip empty splits
-            continue
-
-        # Match the pattern "UPDATE {StaffInitials} {Date}: {Description}" using regex
-        action_match = re.match(
-            r'UPDATE\s*([A-Z]{2,3})?\s*(\d{2}/\d{2}(?:/\d{4})?)?\s*:\s*(.*)', action
-        )
-
-        if action_match:
-            # Extract staff initials, action date, and description from the matched groups
-            staff_initials = action_match.group(1)
-            action_date = action_match.group(2)
-            action_description = action_match.group(3).strip()
-
-            # Convert dates in dd/mm format to include the year 2024
-            if action_date:
-                if re.match(r'^\d{2}/\d{2}$', action_date):  # If year is missing
-                    action_date = f"{action_date}/2024"
-                # Convert the action date to a pandas datetime object
-                action_date = pd.to_datetime(action_date, format='%d/%m/%Y', errors='coerce')
-            
-            #Append the parsed data to the action_table_data list
-            action_table_data.append({
-                'JobId': job_id,
-                'StaffInitials': staff_initials,
-                'ActionDate': action_date,
-                'ActionDescription': action_description
-            })
-        else:
-            # Handle improperly formatted "UPDATE" entries by storing them with limited details
-            action_table_data.append({
-                'JobId': job_id,
-                'StaffInitials': None,
-                'ActionDate': None,
-                'ActionDescription': action
-            })
-
-# Convert the collected action log data into a DataFrame
-df_actions_new = pd.DataFrame(action_table_data)
-# Save the action log data to a CSV file for further inspection
-df_actions_new.to_csv('actionlog.csv', index=False)
-
-# Load the data into a temporary staging table in the database
-df_actions_new.to_sql('Actions_Temp', con=engine, if_exists='append', index=False)
+    # Load the data into a temporary staging table in the database
+    bulk_load(df_actions_new, 'Actions_Temp', engine, method=load_method)
+    return df_actions_new
 
 # %% LOAD PATIENT
 
-def load_patient(df):
+def patient_table(df):
     # Create new patient dataframe with relevant columns for patient table
     df_patient = df[["HospitalNumber", "NHSNumber", "Initials"]]
 
     # Remove any completely blank rows
     df_patient = df_patient.dropna(how="all",subset=["HospitalNumber","NHSNumber"])
-    print(len(df_patient))      # Print number of records in df
 
     # Make a copy of the DataFrame to avoid modifying the original
     df_patient = df_patient.copy()
@@ -535,11 +670,15 @@ def load_patient(df):
     # Add a new column, 'PatientCode', which uniquely identifies a patient.
     # - Use 'NHSNumber' if 'HospitalNumber' is missing.
     # - Otherwise, use 'HospitalNumber' prefixed with "RK9".
-    df_patient.loc[:, 'PatientCode'] = df_patient.apply(
-    lambda row: row['NHSNumber'] if pd.notnull(row['NHSNumber']) and pd.isnull(row['HospitalNumber'])
-    else (f"RK9{row['HospitalNumber']}" if pd.notnull(row['HospitalNumber']) else None),
-    axis=1
+    df_patient['PatientCode'] = ("RK9" + df_patient['HospitalNumber']).where(
+        df_patient['HospitalNumber'].notna(), df_patient['NHSNumber']
     )
+    return df_patient
+
+def load_patient(df, engine, load_method=load_method):
+    df_patient = patient_table(df)
+    print(len(df_patient))      # Print number of records in df
+
     # Remove duplicate patients based on 'PatientCode', keeping only the first occurrence
     df_patient = df_patient.drop_duplicates(subset=["PatientCode"],keep = "first")
     print(len(df_patient))      # Print number of records in df
@@ -550,71 +689,500 @@ def load_patient(df):
     df_patient = df_patient.drop(columns=['PatientCode'], errors='ignore')
 
     # Load the remaining data into the 'Patient' table in the database
-    df_patient.to_sql('Patient', con=engine, if_exists='append', index=False)
+    bulk_load(df_patient, 'Patient', engine, method=load_method)
 
     return df_patient
 
-df_patient = load_patient(df)
-
 # %% LOAD JOB
 
-# Create a new DataFrame with only relevant columns for job table
-df_job = df.drop(columns=['Initials','NextAction','CRISComment','HospitalNumber_valid'])
+# Columns that are not part of the job table
+non_job_columns = ['Initials','NextAction','CRISComment','HospitalNumber_valid']
 
-# Save the job data to a CSV file for further inspection
-df_job.to_csv('jobdata.csv',index=False)
+def load_job(df, engine, load_method=load_method):
+    # Create a new DataFrame with only relevant columns for job table
+    df_job = df.drop(columns=non_job_columns)
 
-# Load the job data into a temporary staging table in the database
-df_job.to_sql('Job_Temp', con=engine, if_exists='append', index=False)
-# %% LOAD CRIS COMMENT
+    # Save the job data to a CSV file for further inspection
+    df_job.to_csv('jobdata.csv',index=False)
 
-# Create a new DataFrame with only relevant columns
-df_cris = df[['JobId','CRISComment', 'StaffAssigned','DateJobCompleted']]
+    # Load the job data into a temporary staging table in the database
+    bulk_load(df_job, 'Job_Temp', engine, method=load_method)
+    return df_job
 
-# Create empty array
-cris_table_data = []
-
-# Iterate through each row of the df_cris DataFrame
-for idx, row in df_cris.iterrows():
-    # Extract relevant fields from df
-    job_id = row['JobId']
-    cris_comment = row['CRISComment']
-    staff_assigned = row['StaffAssigned']
-    date_job_completed = row['DateJobCompleted']
-    
-    # Skip rows where CRISComment is NaN or empty
-    if pd.isna(cris_comment):
-        continue
+# %% LOAD CRIS COMMENT
 
+def extract_cris_comments(df):
     # Strip leading/trailing spaces and new lines from CRISComment
-    cris_comment = cris_comment.strip()
+    cris_comment = df['CRISComment'].str.strip()
 
-    # Skip if CRISComment is still empty after stripping
-    if cris_comment == "":
-        continue
+    # Skip rows where CRISComment is NaN or empty after stripping
+    has_comment = (cris_comment.notna() & (cris_comment != "")).to_numpy(dtype=bool)
+    cris_comment = cris_comment[has_comment]
+    df_cris = df[has_comment]
 
-    # Determine cris_staff based on CRISComment content
-    if pd.notna(cris_comment) and "JR (MRSE)" in cris_comment:
-        cris_staff = "JR"
-    else:
-        cris_staff = staff_assigned  # Use StaffAssigned if condition not met
-    
-    # Use DateJobCompleted for date_cris
-    date_cris = date_job_completed
+    # Comments written by "JR (MRSE)" are attributed to JR, otherwise use StaffAssigned
+    is_jr = cris_comment.str.contains("JR (MRSE)", regex=False).to_numpy(dtype=bool)
+    cris_staff = np.where(is_jr, "JR", df_cris['StaffAssigned'].to_numpy(dtype=object))
 
-    # Append to CRIS log data
-    cris_table_data.append({
-        'JobId': job_id,
-        'CRISComment': cris_comment,
+    # Use DateJobCompleted for DateCRIS
+    return pd.DataFrame({
+        'JobId': df_cris['JobId'].to_numpy(),
+        'CRISComment': cris_comment.to_numpy(dtype=object),
         'CRISStaff': cris_staff,
-        'DateCRIS': date_cris
+        'DateCRIS': df_cris['DateJobCompleted'].to_numpy()
     })
 
-# Convert to a DataFrame
-df_cris_log = pd.DataFrame(cris_table_data)
+# Columns relevant to CRIS comments
+cris_columns = ['JobId','CRISComment', 'StaffAssigned','DateJobCompleted']
+
+def load_cris_comment(df, engine, load_method=load_method):
+    # Create a new DataFrame with only relevant columns
+    df_cris = df[cris_columns]
+    df_cris_log = extract_cris_comments(df_cris)
+
+    # Save the CRIS comment data to a CSV file for further inspection
+    df_cris_log.to_csv('cris_log.csv', index=False)
+
+    # Load the CRIS comment data into a temporary staging table in database
+    bulk_load(df_cris_log, 'CRIS_Temp', engine, method=load_method)
+    return df_cris_log
+
+# %% STREAMING MODE
+# Cleans and loads the export chunk by chunk instead of all at once, so peak memory depends on
+# chunk_size rather than the size of the export (--chunk-size on the command line).
+# Steps that need every row (duplicate jobs, the
+# HospitalNumber <-> NHSNumber mapping and duplicate statuses/patients) use sets and
+# dicts that are built up as the chunks go by.
+
+#Extract: Read the CSV file in chunks of chunk_size rows, with columns already renamed to match the database
+def extract_chunks(file_path, chunk_size, columns=None):
+    names = [database_column_name(col) for col in pd.read_csv(file_path, nrows=0).columns]
+    # Optionally read only some of the columns
+    usecols = names if columns is None else [name for name in names if name in columns]
+    dtypes, parse_dates = read_options({name: name for name in usecols})
+    for chunk in pd.read_csv(file_path, header=0, names=names, usecols=usecols, dtype=dtypes,
+                             parse_dates=parse_dates, date_format=date_format, chunksize=chunk_size):
+        chunk = chunk.drop(columns=unwanted_columns, errors="ignore")
+        yield downcast_numerics(chunk)
+
+# Keep the first row for each combination of subset columns, across every chunk seen so far
+def drop_seen_rows(df, subset, seen):
+    keys = zip(*(df[col].astype(object).where(df[col].notna(), None) for col in subset))
+    keep = np.zeros(len(df), dtype=bool)
+    for i, key in enumerate(keys):
+        if key not in seen:
+            seen.add(key)
+            keep[i] = True
+    return df[keep]
+
+# Job rows that check_jobid keeps: first occurrence of each job and patient, and not blank
+def drop_duplicate_and_blank_jobs(df, seen_jobs):
+    df = drop_seen_rows(df, ["JobId","HospitalNumber","NHSNumber"], seen_jobs)
+    return df.dropna(subset=['Status'])
+
+# Write a chunk of a stage's output to its inspection CSV, starting a new file on the first chunk
+def append_csv(df, path, first_chunk):
+    df.to_csv(path, mode="w" if first_chunk else "a", header=first_chunk, index=False)
+
+# The DATA CLEANING steps that only look at one row at a time, in the same order.
+# clean_patient is left out as its mapping needs every row.
+def clean_row_local(df):
+    df = clean_hospital_number(df)
+    df = clean_nhs_number(df)
+    df = clean_patient_initials(df)
+    df = clean_dates(df)
+    df = clean_urgency(df)
+    df = clean_site(df)
+    df = clean_contact_method(df)
+    df = clean_patient_type(df)
+    df = clean_query_free_text(df)
+    df = clean_implant_category(df)
+    df = clean_staff(df,staff_columns)
+    df = clean_mr_safety_category(df)
+    return df
+
+# Row-local cleaning followed by filling in patient numbers from a mapping built beforehand.
+# fill_patient_numbers only changes HospitalNumber/NHSNumber, which no later step reads, so it can run last.
+def clean_rows(df, patient_mapping):
+    df = clean_row_local(df)
+    df = fill_patient_numbers(df, patient_mapping)
+    return downcast_numerics(df)
+
+def stream_clean_and_load(file_path, chunk_size, engine, load_method=load_method):
+    # First pass: build the HospitalNumber <-> NHSNumber mapping from the identifier columns only
+    seen_jobs = set()
+    patient_mapping = {}
+    patient_mapping_reverse = {}
+    for chunk in extract_chunks(file_path, chunk_size, columns=["JobId","HospitalNumber","NHSNumber","Status"]):
+        chunk = drop_duplicate_and_blank_jobs(chunk, seen_jobs).copy()
+        chunk = clean_hospital_number(chunk)
+        chunk = clean_nhs_number(chunk)
+        forward, reverse = patient_mappings(chunk)
+        # Later rows overwrite earlier ones, as they do when the mapping is built from the whole frame
+        patient_mapping.update(forward)
+        patient_mapping_reverse.update(reverse)
+    # Combine forward and reverse mappings into a single dictionary
+    patient_mapping.update(patient_mapping_reverse)
+    print(f"Patient mapping built with {len(patient_mapping)} entries from {len(seen_jobs)} job rows.")
+
+    # Second pass: clean and load each chunk
+    seen_jobs = set()
+    seen_statuses = set()
+    seen_patients = set()
+    rows_loaded = 0
+    for chunk_number, chunk in enumerate(extract_chunks(file_path, chunk_size)):
+        first_chunk = chunk_number == 0
+        chunk = drop_duplicate_and_blank_jobs(chunk, seen_jobs).copy()
+        chunk = clean_rows(chunk, patient_mapping)
+        chunk, df_quarantine = validate_identifiers(chunk)
+        append_csv(df_quarantine, 'quarantine.csv', first_chunk)
+        bulk_load(df_quarantine, 'Quarantine_Temp', engine, method=load_method)
+
+        # Status history, with statuses already loaded from earlier chunks removed
+        df_status_new = derive_status_events(chunk[status_columns], status_rules)
+        df_status_new = drop_seen_rows(df_status_new, ['JobId','Status'], seen_statuses)
+        append_csv(df_status_new, 'jobstatushistorytable.csv', first_chunk)
+        bulk_load(df_status_new, 'Status_Temp', engine, method=load_method)
+
+        # Action log
+        df_actions_new = parse_next_actions(chunk)
+        append_csv(df_actions_new, 'actionlog.csv', first_chunk)
+        bulk_load(df_actions_new, 'Actions_Temp', engine, method=load_method)
+
+        # Patients, with patients already loaded from earlier chunks removed
+        df_patient = drop_seen_rows(patient_table(chunk), ['PatientCode'], seen_patients)
+        append_csv(df_patient, 'patienttable.csv', first_chunk)
+        bulk_load(df_patient.drop(columns=['PatientCode']), 'Patient', engine, method=load_method)
+
+        # Jobs
+        df_job = chunk.drop(columns=non_job_columns)
+        append_csv(df_job, 'jobdata.csv', first_chunk)
+        bulk_load(df_job, 'Job_Temp', engine, method=load_method)
+
+        # CRIS comments
+        df_cris_log = extract_cris_comments(chunk[cris_columns])
+        append_csv(df_cris_log, 'cris_log.csv', first_chunk)
+        bulk_load(df_cris_log, 'CRIS_Temp', engine, method=load_method)
+
+        rows_loaded += len(chunk)
+        print(f"Chunk {chunk_number + 1}: {len(chunk)} jobs cleaned and loaded ({rows_loaded} in total).")
+
+    return rows_loaded
+
+# %% PIPELINE
+# Runs the cells above as named stages, timing each one. Import CleaningPipeline to run it
+# from other code, or run this file with a CSV path (see --help).
+
+# Run a cleaning step, then verify that cleaning is sufficient by printing unique values in its columns
+def verify_unique(clean, *columns):
+    def run(df):
+        df = clean(df)
+        for col in columns:
+            print(df[col].unique())
+        return df
+    return run
+
+# Settings that decide what the cleaned frame looks like. A cached cleaned frame is only reused when these,
+# the source CSV and this file (which holds the cleaning code) are all unchanged.
+def cleaning_config():
+    return {
+        "code": file_hash(__file__),
+        "new_column_names": new_column_names,
+        "unwanted_columns": unwanted_columns,
+        "category_columns": category_columns,
+        "string_columns": string_columns,
+        "free_text_columns": free_text_columns,
+        "date_columns": date_columns,
+        "date_format": date_format,
+        "staff_columns": staff_columns,
+        "mr_safety_abbreviations": mr_safety_abbreviations
+    }
+
+class CleaningPipeline:
+    def __init__(self, file_path, engine, load_method=load_method, checkpoint_dir=None, trace_memory=True, store=None):
+        self.file_path = file_path
+        self.engine = engine
+        self.load_method = load_method
+        # Folder the cleaned frame is saved to after each stage, so a later run can resume part way
+        self.checkpoint_dir = checkpoint_dir
+        # Peak memory is measured with tracemalloc, which slows pandas string work down noticeably
+        self.trace_memory = trace_memory
+        # Optional IntermediateStore: the cleaned frame is saved there, and later runs on the same CSV
+        # with the same cleaning config go straight to the load stages
+        self.store = store
+        # Rows split off by the validate_identifiers stage, loaded by the load_quarantine stage
+        self.quarantine = None
+        # Stages in the order they run, as (name, kind, function). "transform" stages return the next
+        # version of the frame; "load" stages load a staging table from it and return what was loaded.
+        self.stages = [
+            ("extract", "transform", self.extract),
+            ("rename", "transform", rename_columns),
+            ("dedupe", "transform", self.dedupe),
+            ("clean_hospital_number", "transform", clean_hospital_number),
+            ("clean_nhs_number", "transform", clean_nhs_number),
+            ("clean_patient_initials", "transform", clean_patient_initials),
+            ("clean_patient", "transform", clean_patient),
+            ("validate_identifiers", "transform", self.validate_identifiers),
+            ("clean_dates", "transform", clean_dates),
+            ("clean_urgency", "transform", verify_unique(clean_urgency, "Urgency")),
+            ("clean_site", "transform", verify_unique(clean_site, "Site")),
+            ("clean_contact_method", "transform", verify_unique(clean_contact_method, "ContactMethod")),
+            ("clean_patient_type", "transform", verify_unique(clean_patient_type, "PatientType")),
+            ("clean_query_free_text", "transform", clean_query_free_text),
+            ("clean_implant_category", "transform", verify_unique(clean_implant_category, "ImplantCategory")),
+            ("clean_staff", "transform", verify_unique(lambda df: clean_staff(df, staff_columns), *staff_columns)),
+            ("clean_mr_safety_category", "transform", verify_unique(clean_mr_safety_category, "MRSafetyName")),
+            ("memory_report", "transform", finish_cleaning),
+            ("load_status", "load", load_status),
+            ("load_action_log", "load", load_action_log),
+            ("load_patient", "load", load_patient),
+            ("load_job", "load", load_job),
+            ("load_cris_comment", "load", load_cris_comment),
+            ("load_quarantine", "load", self.load_quarantine),
+        ]
+        # One entry per stage run: wall time, rows in and out, and peak traced memory
+        self.stats = []
+
+    def stage_names(self):
+        return [name for name, kind, function in self.stages]
+
+    def extract(self, df):
+        df = extract_data(self.file_path)
+        if df is not None:
+            # Display first 5 rows
+            print(df.head())
+        return df
+
+    def dedupe(self, df):
+        data_quality_report(df)
+        return check_jobid(df)
 
-# Save the CRIS comment data to a CSV file for further inspection
-df_cris_log.to_csv('cris_log.csv', index=False)
+    # Key of this run's cleaned frame in the store
+    def cache_key(self):
+        return self.store.key(self.file_path, cleaning_config())
+
+    def validate_identifiers(self, df):
+        df, self.quarantine = validate_identifiers(df)
+        if self.checkpoint_dir is not None:
+            self.quarantine.to_pickle(self.checkpoint_path("load_quarantine"))
+        return df
 
-# Load the CRIS comment data into a temporary staging table in database
-df_cris_log.to_sql('CRIS_Temp', con=engine, if_exists='append', index=False)
+    def load_quarantine(self, df, engine, load_method):
+        # A resumed run picks up the quarantined rows saved by the run that validated them
+        if self.quarantine is None and self.checkpoint_dir is not None and os.path.exists(self.checkpoint_path("load_quarantine")):
+            self.quarantine = pd.read_pickle(self.checkpoint_path("load_quarantine"))
+        if self.quarantine is None:
+            print("No quarantined rows from this run to load.")
+            return []
+        return load_quarantine(self.quarantine, engine, load_method)
+
+    def checkpoint_path(self, name):
+        return os.path.join(self.checkpoint_dir, f"{self.stage_names().index(name):02d}_{name}.pkl")
+
+    # Frame saved by the last transform stage before stage_index that has a checkpoint
+    def load_checkpoint(self, stage_index):
+        for name, kind, function in reversed(self.stages[:stage_index]):
+            if kind == "transform" and os.path.exists(self.checkpoint_path(name)):
+                print(f"Resuming with the frame saved after stage {name}.")
+                return pd.read_pickle(self.checkpoint_path(name))
+        raise FileNotFoundError(f"No checkpoint found in {self.checkpoint_dir} to resume stage {self.stages[stage_index][0]} from")
+
+    # Run the stages in order. skip leaves stages out, resume_from starts at a stage using the frame
+    # checkpointed by an earlier run, and stop_after ends the run once that stage has finished.
+    def run(self, skip=(), resume_from=None, stop_after=None):
+        names = self.stage_names()
+        for name in [*skip, resume_from, stop_after]:
+            if name is not None and name not in names:
+                raise ValueError(f"Unknown stage {name!r}, expected one of {names}")
+
+        start = 0
+        df = None
+        # Index of the last transform stage, after which the frame is fully cleaned
+        last_transform = max(i for i, (name, kind, function) in enumerate(self.stages) if kind == "transform")
+        cache_key = None
+        # The key only covers the CSV and the cleaning settings, so a frame is only cached (or read from the cache)
+        # when this run cleans it from the CSV with every transform stage
+        skipped_transforms = [name for name, kind, function in self.stages if kind == "transform" and name in skip]
+        if self.store is not None and self.store.enabled:
+            if skipped_transforms or resume_from is not None:
+                print("Not using the cleaned frame cache, as not every cleaning stage runs from the CSV.")
+            else:
+                cache_key = self.cache_key()
+
+        if cache_key is not None and self.store.has(cache_key, "cleaned"):
+            print("Using the cached cleaned frame, skipping the extract and cleaning stages.")
+            df = self.store.load(cache_key, "cleaned")
+            self.quarantine = self.store.load(cache_key, "quarantine")
+            start = last_transform + 1
+        elif resume_from is not None:
+            if self.checkpoint_dir is None:
+                raise ValueError("resume_from needs a checkpoint_dir")
+            start = names.index(resume_from)
+            if start > 0:
+                df = self.load_checkpoint(start)
+        if self.checkpoint_dir is not None:
+            os.makedirs(self.checkpoint_dir, exist_ok=True)
+
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        try:
+            for name, kind, function in self.stages[start:]:
+                if name in skip:
+                    print(f"Skipping stage {name}.")
+                    continue
+                print(f"Running stage {name}.")
+                rows_in = 0 if df is None else len(df)
+                if self.trace_memory:
+                    tracemalloc.reset_peak()
+                started = time.perf_counter()
+
+                if kind == "load":
+                    rows_out = len(function(df, self.engine, self.load_method))
+                else:
+                    df = function(df)
+                    if df is None:
+                        print(f"Stage {name} returned no data, stopping.")
+                        break
+                    rows_out = len(df)
+                    if self.checkpoint_dir is not None:
+                        df.to_pickle(self.checkpoint_path(name))
+                    if cache_key is not None and names.index(name) == last_transform:
+                        self.store.save(cache_key, "cleaned", df)
+                        if self.quarantine is not None:
+                            self.store.save(cache_key, "quarantine", self.quarantine)
+                        self.store.evict(keep=cache_key)
+
+                self.stats.append({
+                    "Stage": name,
+                    "Seconds": round(time.perf_counter() - started, 3),
+                    "RowsIn": rows_in,
+                    "RowsOut": rows_out,
+                    "PeakMB": round(tracemalloc.get_traced_memory()[1] / 1e6, 1) if self.trace_memory else None
+                })
+                if name == stop_after:
+                    break
+        finally:
+            if tracing:
+                tracemalloc.stop()
+
+        self.report()
+        return df
+
+    # Print the per-stage timings
+    def report(self):
+        stats = pd.DataFrame(self.stats)
+        if not stats.empty:
+            print(stats.to_string(index=False))
+            print(f"Total: {stats['Seconds'].sum():.2f}s")
+        return stats
+
+# %% MULTI-FILE MODE
+# Cleans a folder of exports (e.g. one CSV per year and site) in parallel and loads them once.
+# Each file is extracted and cleaned row by row in its own process. The results are then combined
+# in file name order, so duplicate jobs and patient numbers are resolved exactly as if the files had
+# been joined into one CSV in that order before cleaning.
+
+# Copies of the identifier columns as written in the spreadsheet, kept for the duplicate job check
+raw_key_columns = {"HospitalNumber": "RawHospitalNumber", "NHSNumber": "RawNHSNumber"}
+
+# Extract one file and run the steps that only look at one row at a time. Runs in a worker process.
+def clean_file(file_path):
+    df = extract_data(file_path)
+    if df is None:
+        return None
+    df = rename_columns(df)
+    for col, raw_col in raw_key_columns.items():
+        df[raw_col] = df[col]
+    return clean_row_local(df)
+
+# Concatenate frames in order, keeping category columns as category by giving each one the union of the categories
+def concat_frames(frames):
+    frames = [frame.copy() for frame in frames]
+    for col in frames[0].columns:
+        if all(isinstance(frame[col].dtype, pd.CategoricalDtype) for frame in frames if col in frame):
+            categories = pd.api.types.union_categoricals([frame[col] for frame in frames if col in frame]).categories
+            for frame in frames:
+                if col in frame:
+                    frame[col] = frame[col].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+class MultiFileCleaningPipeline(CleaningPipeline):
+    def __init__(self, directory, engine, pattern="*.csv", max_workers=None, **kwargs):
+        # Sorted so files are always combined in the same order, whatever order the file system lists them in
+        file_paths = sorted(glob.glob(os.path.join(directory, pattern)))
+        super().__init__(file_paths, engine, **kwargs)
+        self.max_workers = max_workers
+        # Extract and row-local cleaning happen per file in "extract"; the steps that need every row
+        # run on the combined frame, followed by the same load stages as a single-file run
+        self.stages = [
+            ("extract", "transform", self.extract_files),
+            ("dedupe", "transform", self.dedupe),
+            ("clean_patient", "transform", clean_patient),
+            ("validate_identifiers", "transform", self.validate_identifiers),
+            ("memory_report", "transform", finish_cleaning),
+        ] + [stage for stage in self.stages if stage[1] == "load"]
+
+    def cache_key(self):
+        return self.store.key(self.file_path, {**cleaning_config(), "mode": "multi-file"})
+
+    def extract_files(self, df):
+        if not self.file_path:
+            print("No files found to clean.")
+            return None
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            # map returns results in the order of file_path, not the order the workers finish in
+            frames = list(pool.map(clean_file, self.file_path))
+        for file_path, frame in zip(self.file_path, frames):
+            print(f"{file_path}: {'failed' if frame is None else f'{len(frame)} rows'}")
+        if any(frame is None for frame in frames):
+            return None
+        return concat_frames(frames)
+
+    def dedupe(self, df):
+        data_quality_report(df)
+        # Duplicates are found on the identifiers as written in the spreadsheet, as in a single-file run
+        df = check_jobid(df, key_columns=["JobId", *raw_key_columns.values()])
+        return df.drop(columns=list(raw_key_columns.values()))
+
+def main():
+    parser = argparse.ArgumentParser(description="Clean the MR safety spreadsheet export and load it into the staging tables.")
+    parser.add_argument("file_path", help="CSV export to clean, or a folder of exports to clean in parallel")
+    parser.add_argument("--pattern", default="*.csv", help="file name pattern used when file_path is a folder")
+    parser.add_argument("--workers", type=int, help="number of worker processes used when file_path is a folder")
+    parser.add_argument("--server", default=server_name)
+    parser.add_argument("--database", default=database_name, help="database name, or the file path for --dialect sqlite")
+    parser.add_argument("--dialect", default="mssql", choices=["mssql", "sqlite"])
+    parser.add_argument("--load-method", default=load_method, choices=["executemany", "multi", "bulk"])
+    parser.add_argument("--skip", nargs="+", default=[], metavar="STAGE", help="stages to leave out")
+    parser.add_argument("--resume-from", metavar="STAGE", help="start at this stage using the frame saved in --checkpoint-dir")
+    parser.add_argument("--stop-after", metavar="STAGE", help="stop once this stage has finished")
+    parser.add_argument("--checkpoint-dir", help="save the frame after each stage to this folder")
+    parser.add_argument("--no-memory-trace", action="store_true", help="do not measure peak memory per stage")
+    parser.add_argument("--cache-dir", help="cache the cleaned frame as Parquet in this folder and reuse it on later runs")
+    parser.add_argument("--cache-max-age-days", type=float, default=7, help="remove cached frames not used for this long")
+    parser.add_argument("--cache-max-size-mb", type=float, default=1024, help="keep the cache under this size")
+    parser.add_argument("--chunk-size", type=int, help="clean and load the export in chunks of this many rows (streaming mode)")
+    parser.add_argument("--list-stages", action="store_true", help="print the stage names and exit")
+    args = parser.parse_args()
+
+    engine = connect_to_db(args.server, args.database, dialect=args.dialect)
+    if args.chunk_size:
+        stream_clean_and_load(args.file_path, args.chunk_size, engine, args.load_method)
+        return
+
+    store = None
+    if args.cache_dir:
+        store = IntermediateStore(args.cache_dir, max_age_days=args.cache_max_age_days, max_size_mb=args.cache_max_size_mb)
+    options = dict(load_method=args.load_method, checkpoint_dir=args.checkpoint_dir, trace_memory=not args.no_memory_trace, store=store)
+    if os.path.isdir(args.file_path):
+        pipeline = MultiFileCleaningPipeline(args.file_path, engine, pattern=args.pattern, max_workers=args.workers, **options)
+    else:
+        pipeline = CleaningPipeline(args.file_path, engine, **options)
+    if args.list_stages:
+        print("\n".join(pipeline.stage_names()))
+        return
+    pipeline.run(skip=args.skip, resume_from=args.resume_from, stop_after=args.stop_after)
+
+if __name__ == "__main__":
+    main()
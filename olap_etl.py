@@ -0,0 +1,470 @@
+import argparse
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import inspect, text
+
+from db_connection import connect_to_db, bulk_load
+from target_dates import update_target_dates
+
+server_name = "[REDACTED]"
+oltp_database_name = "CMI_MRSafetyDB"
+olap_database_name = "CMI_MRSafetyDB_OLAP"
+
+# The OLAP ETL script. Each section starts with a /*** TITLE ***/ comment and is run as its own batch.
+etl_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ETL_MRSafetyDB_OLAP.sql")
+section_marker = re.compile(r"^/\*{3,}\s*(.*?)\s*\*{3,}/[ \t]*$", re.M)
+
+# Section of the ETL script that loads each OLAP table. The table name is also the key of its watermark in ETLControl.
+# The dimensions do not depend on each other, so they are loaded at the same time.
+dimension_sections = {
+    "DimStaff": "ETL STAFF TABLE",
+    "DimImplant": "ETL IMPLANT TABLE",
+    "DimUrgency": "ETL URGENCY TABLE",
+    "DimSite": "ETL SITE TABLE",
+    "DimPatientType": "ETL PATIENT TYPE TABLE",
+    "DimContactMethod": "ETL CONTACT METHOD TABLE",
+    "DimJobStatus": "ETL JOB STATUS TABLE",
+    "DimMRSafety": "ETL MR SAFETY TABLE",
+}
+fact_section = "ETL JOB TABLE"
+# The bridge looks jobs up by their FactJob key, so it is loaded after FactJob
+bridge_section = "ETL STAFF ASSIGNED BRIDGE TABLE"
+
+# Read the ETL script into {section title: SQL}, in the order the sections appear
+def read_sql_sections(path=etl_script):
+    with open(path, encoding="utf-8") as f:
+        script = f.read()
+    markers = list(section_marker.finditer(script))
+    sections = {}
+    for marker, next_marker in zip(markers, markers[1:] + [None]):
+        end = next_marker.start() if next_marker else len(script)
+        sections[marker.group(1)] = script[marker.end():end].strip()
+    return sections
+
+# Run one section of the ETL script as a single batch
+def run_section(engine, sections, name):
+    start = time.perf_counter()
+    with engine.begin() as connection:
+        connection.execute(text(sections[name]))
+    print(f"Ran {name} in {time.perf_counter() - start:.2f}s")
+
+# %% WATERMARKS
+
+def create_control_table(olap_engine):
+    if not inspect(olap_engine).has_table("ETLControl"):
+        with olap_engine.begin() as connection:
+            connection.execute(text("CREATE TABLE ETLControl (TableName NVARCHAR(128) PRIMARY KEY, LastETLRunTime DATETIME NOT NULL)"))
+
+# Start of the last successful run for a table (None if it has never been loaded)
+def get_watermark(olap_engine, table_name):
+    with olap_engine.connect() as connection:
+        value = connection.execute(
+            text("SELECT LastETLRunTime FROM ETLControl WHERE TableName = :table_name"), {"table_name": table_name}
+        ).scalar()
+    return None if value is None else pd.Timestamp(value).to_pydatetime()
+
+# Save the watermark for a table once it has loaded without errors
+def set_watermark(olap_engine, table_name, value):
+    params = {"table_name": table_name, "value": value}
+    with olap_engine.begin() as connection:
+        updated = connection.execute(
+            text("UPDATE ETLControl SET LastETLRunTime = :value WHERE TableName = :table_name"), params
+        ).rowcount
+        if not updated:
+            connection.execute(text("INSERT INTO ETLControl (TableName, LastETLRunTime) VALUES (:table_name, :value)"), params)
+
+# %% DATE DIMENSION
+
+# Dates covered by DimDate
+calendar_start = "2020-01-01"
+calendar_end = "2030-12-31"
+
+# YYYYMMDD integer key of each date, the same value as DimDate.DateKey, worked out from the date itself so fact rows
+# need no join to DimDate. valid_keys is the DateKeys in DimDate (see read_date_keys): dates outside it, and missing
+# dates, get <NA> as they would from a LEFT JOIN to DimDate.
+def date_keys(values, valid_keys=None):
+    dates = pd.to_datetime(values).to_numpy(dtype="datetime64[D]")
+    years = dates.astype("datetime64[Y]")
+    months = dates.astype("datetime64[M]")
+    keys = (
+        (years.astype("int64") + 1970) * 10000
+        + ((months - years).astype("int64") + 1) * 100
+        + (dates - months).astype("int64") + 1
+    )
+    missing = np.isnat(dates)
+    if valid_keys is not None:
+        missing |= ~np.isin(keys, valid_keys)
+    index = values.index if isinstance(values, pd.Series) else None
+    return pd.Series(pd.arrays.IntegerArray(keys, missing), index=index)
+
+# Every column of DimDate for each day from start_date to end_date, built in one go
+def date_dimension(start_date=calendar_start, end_date=calendar_end):
+    dates = pd.date_range(start_date, end_date, freq="D")
+    day_of_year = dates.dayofyear.to_numpy()
+    # DATEPART(WEEKDAY) with SQL Server's default DATEFIRST 7: 1 = Sunday ... 7 = Saturday
+    day_of_week = (dates.dayofweek.to_numpy() + 1) % 7 + 1
+    # DATEPART(WEEK): week 1 is the week holding 1 January, and a new week starts every Sunday
+    first_day_offset = (day_of_week - day_of_year) % 7
+    return pd.DataFrame({
+        "DateKey": date_keys(dates).to_numpy(dtype="int64"),
+        "FullDate": dates,
+        "Year": dates.year,
+        "Quarter": dates.quarter,
+        "Month": dates.month,
+        "Week": (day_of_year - 1 + first_day_offset) // 7 + 1,
+        "IsoWeek": dates.isocalendar().week.to_numpy(dtype="int64"),
+        "MonthName": dates.month_name(),
+        "DayOfMonth": dates.day,
+        "DayOfWeek": day_of_week,
+        "DayName": dates.day_name(),
+        "IsWeekend": np.isin(day_of_week, [1, 7]),
+    })
+
+# DateKeys already in DimDate, used to check computed keys without joining DimDate
+def read_date_keys(olap_engine):
+    if not inspect(olap_engine).has_table("DimDate"):
+        return np.array([], dtype="int64")
+    return pd.read_sql(text("SELECT DateKey FROM DimDate"), olap_engine)["DateKey"].to_numpy(dtype="int64")
+
+# Add the days from start_date to end_date that DimDate does not have yet, in place of the POPULATE DIMDATE section
+def load_date_dimension(olap_engine, start_date=calendar_start, end_date=calendar_end, load_method="executemany"):
+    df_dates = date_dimension(start_date, end_date)
+    df_dates = df_dates[~df_dates["DateKey"].isin(read_date_keys(olap_engine))]
+    if df_dates.empty:
+        print(f"DimDate already covers {start_date} to {end_date}")
+        return df_dates
+    if olap_engine.dialect.name != "mssql":
+        bulk_load(df_dates, "DimDate", olap_engine, method=load_method)
+        return df_dates
+
+    # DimDate.DateKey is an IDENTITY column, so the YYYYMMDD keys are copied in from a staging table with
+    # IDENTITY_INSERT on, which only lasts for the session that sets it
+    with olap_engine.begin() as connection:
+        connection.execute(text("DROP TABLE IF EXISTS DimDate_Stage"))
+    bulk_load(df_dates, "DimDate_Stage", olap_engine, method=load_method)
+    columns = ", ".join(df_dates.columns)
+    with olap_engine.begin() as connection:
+        connection.execute(text(
+            f"SET IDENTITY_INSERT DimDate ON; "
+            f"INSERT INTO DimDate ({columns}) SELECT {columns} FROM DimDate_Stage; "
+            f"SET IDENTITY_INSERT DimDate OFF; "
+            f"DROP TABLE DimDate_Stage;"
+        ))
+    print(f"Added {len(df_dates)} days to DimDate")
+    return df_dates
+
+# %% FACT JOB KEYS
+
+# Jobs whose own row, query or status history changed since a watermark. Only these jobs are loaded into FactJob.
+changed_jobs_query = """
+    SELECT JobId FROM Job WHERE ModifiedDate >= :since
+    UNION SELECT JobId FROM Query WHERE ModifiedDate >= :since
+    UNION SELECT JobId FROM StatusLog WHERE ModifiedDate >= :since
+    """
+
+status_log_query = "SELECT JobStatusId, JobId, StatusId, ChangedDate FROM StatusLog"
+job_dates_query = "SELECT JobId, DateJobLogged, DateMRIRequested, DateMRIPlanned, PTLTargetDate, PhysicsTargetDate FROM Job"
+query_dates_query = "SELECT QueryId, JobId, DateQueryReceived FROM Query"
+
+# FactJob date key column for each date column of Job and Query
+job_date_keys = {
+    "DateJobLogged": "DateJobLoggedKey",
+    "DateMRIRequested": "DateMRIRequestedKey",
+    "DateMRIPlanned": "DateMRIPlannedKey",
+    "PTLTargetDate": "PTLTargetDateKey",
+    "PhysicsTargetDate": "PhysicsTargetDateKey",
+}
+query_date_keys = {
+    "DateQueryReceived": "DateQueryReceivedKey",
+}
+
+# Read a query's rows for every job, or with since only for the jobs changed since then
+def read_jobs(oltp_engine, query, since, date_columns):
+    if since is not None:
+        query = query + f" WHERE JobId IN ({changed_jobs_query})"
+    return pd.read_sql(text(query), oltp_engine, params={"since": since}, parse_dates=date_columns)
+
+# Latest status of each job and the date it changed, from one sort of the status history.
+# Matches ORDER BY ChangedDate DESC, JobStatusId DESC: the latest change wins, ties go to the status logged last,
+# and a missing ChangedDate sorts before every date as it does in SQL Server.
+def latest_statuses(df_status):
+    ordered = df_status.dropna(subset=["JobId"]).sort_values(["JobId", "ChangedDate", "JobStatusId"], na_position="first", kind="stable")
+    latest = ordered.drop_duplicates(subset="JobId", keep="last")
+    return pd.DataFrame({
+        "JobId": latest["JobId"].astype("int64"),
+        "CurrentStatusKey": latest["StatusId"],
+        "DateCurrentStatus": pd.to_datetime(latest["ChangedDate"]).dt.normalize(),
+    }).reset_index(drop=True)
+
+# FactJob keys for each job (date keys and current status) and each query (date keys).
+# Returns (job keys, query keys).
+def fact_job_keys(df_jobs, df_queries, df_status, valid_keys=None):
+    df_current = latest_statuses(df_status)
+    # The date of the current status comes from the latest status whose ChangedDate is in DimDate, which can be an
+    # earlier status than the current one, as with the INNER JOIN to DimDate this replaced
+    df_dated = latest_statuses(df_status[date_keys(df_status["ChangedDate"], valid_keys).notna().to_numpy()])
+    df_job_keys = pd.DataFrame({"JobId": df_jobs["JobId"].astype("int64")})
+    for column, key in job_date_keys.items():
+        df_job_keys[key] = date_keys(df_jobs[column], valid_keys)
+    df_job_keys = df_job_keys.merge(df_current[["JobId", "CurrentStatusKey"]], on="JobId", how="left")
+    df_job_keys["DateCurrentStatusKey"] = df_job_keys["JobId"].map(
+        pd.Series(date_keys(df_dated["DateCurrentStatus"], valid_keys).to_numpy(), index=df_dated["JobId"])
+    ).astype("Int64")
+
+    df_query_keys = pd.DataFrame({"QueryId": df_queries["QueryId"].astype("int64")})
+    for column, key in query_date_keys.items():
+        df_query_keys[key] = date_keys(df_queries[column], valid_keys)
+    return df_job_keys, df_query_keys
+
+# Build JobKeys_Stage and QueryKeys_Stage in the OLAP database, in place of the STAGE FACT JOB KEYS section.
+# With since, only jobs changed since then are staged. The FactJob MERGE loads exactly the staged jobs.
+def stage_fact_job_keys(oltp_engine, olap_engine, load_method="executemany", since=None):
+    start = time.perf_counter()
+    df_jobs = read_jobs(oltp_engine, job_dates_query, since, list(job_date_keys))
+    df_queries = read_jobs(oltp_engine, query_dates_query, since, list(query_date_keys))
+    df_status = read_jobs(oltp_engine, status_log_query, since, ["ChangedDate"])
+    df_job_keys, df_query_keys = fact_job_keys(df_jobs, df_queries, df_status, read_date_keys(olap_engine))
+    print(f"Worked out the keys of {len(df_job_keys)} jobs and {len(df_query_keys)} queries in {time.perf_counter() - start:.2f}s")
+
+    for table_name, df in [("JobKeys_Stage", df_job_keys), ("QueryKeys_Stage", df_query_keys)]:
+        with olap_engine.begin() as connection:
+            connection.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
+        bulk_load(df, table_name, olap_engine, method=load_method)
+    return df_job_keys, df_query_keys
+
+# Stage the keys of the jobs changed since the FactJob watermark, merge those jobs into FactJob and update the
+# aggregate tables with them
+def load_fact_job(oltp_engine, olap_engine, load_method="executemany", sections=None):
+    sections = sections or read_sql_sections()
+    staged = stage_fact_job_keys(oltp_engine, olap_engine, load_method, since=get_watermark(olap_engine, "FactJob"))
+    run_section(olap_engine, sections, fact_section)
+    update_aggregates(olap_engine, load_method)
+    return staged
+
+# %% AGGREGATE TABLES
+
+# Summary tables the analysis queries read instead of scanning FactJob. Each is (grain columns, count columns).
+# A missing date is counted under Year 0, Quarter 0 and a missing MR safety category under MRSafetyKey 0, so the
+# totals still match a count over FactJob. Jobs without a site, implant, status or physics target date are left out,
+# as they are by the INNER JOINs in the analysis queries.
+aggregate_tables = {
+    "AggJobsBySiteQuarter": (["SiteKey", "Year", "Quarter"], ["JobsLogged", "JobsQueryReceived"]),
+    "AggImplantSafety": (["ImplantKey", "MRSafetyKey"], ["JobCount"]),
+    # The target-date bucket is the day, so overdue counts can be taken against any date
+    "AggStatusTargetDate": (["CurrentStatusKey", "PhysicsTargetDateKey"], ["JobCount"]),
+}
+
+# FactJob columns the aggregate tables are built from. AggJobState keeps these columns as they were when each job
+# was last counted, so a changed job can be taken out of the counts it used to be in.
+aggregate_columns = [
+    "JobId", "SiteKey", "DateJobLoggedKey", "DateQueryReceivedKey", "ImplantKey", "MRSafetyKey",
+    "CurrentStatusKey", "PhysicsTargetDateKey",
+]
+
+# Create the aggregate tables that do not exist yet
+def create_aggregate_tables(olap_engine):
+    existing = inspect(olap_engine)
+    with olap_engine.begin() as connection:
+        for table_name, (grain, counts) in aggregate_tables.items():
+            if existing.has_table(table_name):
+                continue
+            columns = ", ".join(f"{column} INT NOT NULL" for column in grain + counts)
+            connection.execute(text(f"CREATE TABLE {table_name} ({columns}, PRIMARY KEY ({', '.join(grain)}))"))
+        if not existing.has_table("AggJobState"):
+            columns = ", ".join(f"{column} INT" for column in aggregate_columns[1:])
+            connection.execute(text(f"CREATE TABLE AggJobState (JobId INT PRIMARY KEY, {columns})"))
+
+# True if FactJob has jobs but none has been counted yet, as when the aggregate tables are new or were created
+# empty by Create_Tables_MRSafetyDB_OLAP.sql. Counting only the staged jobs would then leave out every other job.
+def aggregates_not_built(olap_engine):
+    with olap_engine.connect() as connection:
+        return bool(connection.execute(text(
+            "SELECT CASE WHEN EXISTS (SELECT 1 FROM FactJob) AND NOT EXISTS (SELECT 1 FROM AggJobState) THEN 1 ELSE 0 END"
+        )).scalar())
+
+# Rows each job adds to each aggregate table, one row per job with a count of 1 (not yet grouped)
+def job_contributions(df_jobs):
+    def year_quarter(date_key):
+        return {
+            "Year": (date_key // 10000).fillna(0),
+            "Quarter": ((date_key // 100 % 100 - 1) // 3 + 1).fillna(0),
+        }
+
+    with_site = df_jobs[df_jobs["SiteKey"].notna()]
+    logged = pd.DataFrame({"SiteKey": with_site["SiteKey"], **year_quarter(with_site["DateJobLoggedKey"]), "JobsLogged": 1, "JobsQueryReceived": 0})
+    received = pd.DataFrame({"SiteKey": with_site["SiteKey"], **year_quarter(with_site["DateQueryReceivedKey"]), "JobsLogged": 0, "JobsQueryReceived": 1})
+
+    with_implant = df_jobs[df_jobs["ImplantKey"].notna()]
+    with_target = df_jobs[df_jobs["CurrentStatusKey"].notna() & df_jobs["PhysicsTargetDateKey"].notna()]
+    return {
+        "AggJobsBySiteQuarter": pd.concat([logged, received], ignore_index=True),
+        "AggImplantSafety": pd.DataFrame({"ImplantKey": with_implant["ImplantKey"], "MRSafetyKey": with_implant["MRSafetyKey"].fillna(0), "JobCount": 1}),
+        "AggStatusTargetDate": pd.DataFrame({
+            "CurrentStatusKey": with_target["CurrentStatusKey"], "PhysicsTargetDateKey": with_target["PhysicsTargetDateKey"], "JobCount": 1
+        }),
+    }
+
+# Change to each aggregate table when jobs go from their rows in df_before to their rows in df_after: the new rows
+# count +1, the old rows -1, and groups that net to zero are dropped
+def aggregate_delta(df_before, df_after):
+    before = job_contributions(df_before)
+    after = job_contributions(df_after)
+    deltas = {}
+    for table_name, (grain, counts) in aggregate_tables.items():
+        removed = before[table_name].copy()
+        removed[counts] = -removed[counts]
+        df = pd.concat([after[table_name], removed], ignore_index=True).astype("int64")
+        df = df.groupby(grain, as_index=False)[counts].sum()
+        deltas[table_name] = df[(df[counts] != 0).any(axis=1)].reset_index(drop=True)
+    return deltas
+
+# Jobs that are counted in the aggregate tables but no longer in FactJob
+deleted_jobs = "JobId NOT IN (SELECT JobId FROM FactJob)"
+
+# Read the aggregate columns of a table for the jobs matching where, or for every job
+def read_aggregate_columns(olap_engine, table_name, where=None):
+    query = f"SELECT {', '.join(aggregate_columns)} FROM {table_name}"
+    if where:
+        query += f" WHERE {where}"
+    return pd.read_sql(text(query), olap_engine).astype("Int64")
+
+# Bring the aggregate tables up to date with the jobs staged in JobKeys_Stage, after they are merged into FactJob.
+# Only the staged jobs are read: their old rows come from AggJobState and their new rows from FactJob, and the
+# difference is added to the counts. Jobs deleted from FactJob are taken out of the counts they were in.
+# With rebuild, or when no job has been counted yet, every count is rebuilt from FactJob.
+def update_aggregates(olap_engine, load_method="executemany", rebuild=False):
+    start = time.perf_counter()
+    create_aggregate_tables(olap_engine)
+    rebuild = rebuild or aggregates_not_built(olap_engine)
+    staged_jobs = "JobId IN (SELECT JobId FROM JobKeys_Stage)"
+    if rebuild:
+        df_after = read_aggregate_columns(olap_engine, "FactJob")
+        df_before = pd.DataFrame(columns=aggregate_columns, dtype="Int64")
+    else:
+        df_after = read_aggregate_columns(olap_engine, "FactJob", staged_jobs)
+        df_before = read_aggregate_columns(olap_engine, "AggJobState", f"{staged_jobs} OR {deleted_jobs}")
+    deltas = aggregate_delta(df_before, df_after)
+
+    staged = {f"{table_name}_Delta": df for table_name, df in deltas.items()}
+    staged["AggJobState_Stage"] = df_after
+    for table_name, df in staged.items():
+        with olap_engine.begin() as connection:
+            connection.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
+        if not df.empty:
+            bulk_load(df, table_name, olap_engine, method=load_method)
+
+    # Every count and AggJobState change together, so a failed run leaves them matching each other
+    with olap_engine.begin() as connection:
+        if rebuild:
+            for table_name in [*aggregate_tables, "AggJobState"]:
+                connection.execute(text(f"DELETE FROM {table_name}"))
+        for table_name, (grain, counts) in aggregate_tables.items():
+            if deltas[table_name].empty:
+                continue
+            delta = f"{table_name}_Delta"
+            match = " AND ".join(f"{table_name}.{column} = d.{column}" for column in grain)
+            columns = ", ".join(grain + counts)
+            connection.execute(text(
+                f"UPDATE {table_name} SET {', '.join(f'{column} = {table_name}.{column} + d.{column}' for column in counts)} "
+                f"FROM {delta} d WHERE {match}"
+            ))
+            connection.execute(text(
+                f"INSERT INTO {table_name} ({columns}) SELECT {columns} FROM {delta} d "
+                f"WHERE NOT EXISTS (SELECT 1 FROM {table_name} WHERE {match})"
+            ))
+            connection.execute(text(f"DELETE FROM {table_name} WHERE {' AND '.join(f'{column} = 0' for column in counts)}"))
+            connection.execute(text(f"DROP TABLE {delta}"))
+        if not rebuild:
+            connection.execute(text(f"DELETE FROM AggJobState WHERE {deleted_jobs}"))
+        if not df_after.empty:
+            columns = ", ".join(aggregate_columns)
+            connection.execute(text("DELETE FROM AggJobState WHERE JobId IN (SELECT JobId FROM AggJobState_Stage)"))
+            connection.execute(text(f"INSERT INTO AggJobState ({columns}) SELECT {columns} FROM AggJobState_Stage"))
+            connection.execute(text("DROP TABLE AggJobState_Stage"))
+
+    print(
+        f"{'Rebuilt' if rebuild else 'Updated'} the aggregate tables from {len(df_after)} jobs "
+        f"({len(df_before) - df_before['JobId'].isin(df_after['JobId']).sum()} removed) in {time.perf_counter() - start:.2f}s: "
+        + ", ".join(f"{len(df)} {table_name} rows changed" for table_name, df in deltas.items())
+    )
+    return deltas
+
+# %% RUN
+
+# Load a table and move its watermark on to the start of this run, or report the error and leave the watermark alone
+def load_table(olap_engine, table_name, load, run_started):
+    try:
+        load()
+    except Exception as e:
+        print(f"Error loading {table_name}: {e}")
+        return False
+    set_watermark(olap_engine, table_name, run_started)
+    return True
+
+# Load the dimensions in parallel, then FactJob and the staff bridge. Each table only reads OLTP rows modified
+# since its own watermark. FactJob is not loaded if any dimension failed, and the bridge not if FactJob failed.
+def run_etl(oltp_engine, olap_engine, load_method="executemany", max_workers=4, sections=None):
+    start = time.perf_counter()
+    sections = sections or read_sql_sections()
+    create_control_table(olap_engine)
+    # Bring the target dates stored on Job up to date first. Jobs whose target date changes get a new ModifiedDate,
+    # which is before run_started below, so this run loads them into FactJob.
+    update_target_dates(oltp_engine, load_method)
+    # Server time at the start of this run, saved as the new watermark. Rows changed while the ETL is running
+    # are picked up again on the next run.
+    with oltp_engine.connect() as connection:
+        run_started = pd.Timestamp(connection.execute(text("SELECT CURRENT_TIMESTAMP")).scalar()).to_pydatetime()
+
+    # Each dimension MERGE runs on its own connection from the engine's pool
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            table_name: executor.submit(
+                load_table, olap_engine, table_name, lambda section=section: run_section(olap_engine, sections, section), run_started
+            )
+            for table_name, section in dimension_sections.items()
+        }
+        # DimDate is built in Python rather than by its SQL section
+        futures["DimDate"] = executor.submit(
+            load_table, olap_engine, "DimDate", lambda: load_date_dimension(olap_engine, load_method=load_method), run_started
+        )
+        loaded = {table_name: future.result() for table_name, future in futures.items()}
+
+    if all(loaded.values()):
+        loaded["FactJob"] = load_table(
+            olap_engine, "FactJob", lambda: load_fact_job(oltp_engine, olap_engine, load_method, sections), run_started
+        )
+    else:
+        print("FactJob not loaded because a dimension failed to load.")
+    if loaded.get("FactJob"):
+        loaded["BridgeStaffAssigned"] = load_table(
+            olap_engine, "BridgeStaffAssigned", lambda: run_section(olap_engine, sections, bridge_section), run_started
+        )
+
+    print(f"Loaded {sum(loaded.values())} of {len(dimension_sections) + 3} tables in {time.perf_counter() - start:.2f}s")
+    return loaded
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the OLAP tables from the OLTP database.")
+    parser.add_argument("--server", default=server_name)
+    parser.add_argument("--oltp-database", default=oltp_database_name, help="OLTP database name, or the file path for --dialect sqlite")
+    parser.add_argument("--olap-database", default=olap_database_name, help="OLAP database name, or the file path for --dialect sqlite")
+    parser.add_argument("--dialect", default="mssql", choices=["mssql", "sqlite"])
+    parser.add_argument("--load-method", default="executemany", choices=["executemany", "multi", "bulk"])
+    parser.add_argument("--workers", type=int, default=4, help="number of dimension tables loaded at the same time")
+    parser.add_argument("--rebuild-aggregates", action="store_true", help="rebuild the aggregate tables from FactJob instead of running the ETL")
+    args = parser.parse_args()
+
+    olap_engine = connect_to_db(args.server, args.olap_database, dialect=args.dialect)
+    if args.rebuild_aggregates:
+        update_aggregates(olap_engine, args.load_method, rebuild=True)
+        return
+    oltp_engine = connect_to_db(args.server, args.oltp_database, dialect=args.dialect)
+    run_etl(oltp_engine, olap_engine, args.load_method, args.workers)
+
+if __name__ == "__main__":
+    main()
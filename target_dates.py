@@ -0,0 +1,253 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from db_connection import connect_to_db, bulk_load
+
+# PTL and Physics target-date rules. This is the only place the rules are written down: the NumPy calculator
+# below, the SQL generated by target_date_case_sql/target_date_update_sql/target_date_trigger_sql and the
+# target dates stored on Job all come from this table.
+# Each rule is (UrgencyCode, PatientTypeName, base date column, offset in days). Rules are checked in order and
+# the first match wins, like a SQL CASE. None matches any value; the last rule is the default.
+target_date_rules = {
+    "PTLTargetDate": [
+        (1, "Inpatient", "DateMRIRequested", 0),
+        (1, "Outpatient", "DateMRIRequested", 28),
+        (3, "Inpatient", "DateMRIRequested", 0),
+        (3, "Outpatient", "DateMRIRequested", 14),
+        (5, "Inpatient", "DateMRIRequested", 0),
+        (5, "Outpatient", "DateMRIRequested", 7),
+        (7, None, "DateMRIRequested", 2),
+        (9, None, "DateMRIPlanned", -28),
+        (15, None, "DateMRIRequested", 2),
+        (None, None, "DateMRIRequested", 14),
+    ],
+    "PhysicsTargetDate": [
+        (1, "Inpatient", "DateQueryReceived", 0),
+        (1, "Outpatient", "DateQueryReceived", 28),
+        (3, "Inpatient", "DateQueryReceived", 0),
+        (3, "Outpatient", "DateQueryReceived", 14),
+        (5, "Inpatient", "DateQueryReceived", 0),
+        (5, "Outpatient", "DateQueryReceived", 7),
+        (7, None, "DateQueryReceived", 2),
+        (9, None, "DateMRIPlanned", -28),
+        (15, None, "DateQueryReceived", 2),
+        (None, None, "DateQueryReceived", 14),
+    ],
+}
+
+# Table each target date is stored on and its key. Both are stored per job, so a job with no query still keeps a
+# Physics target where a rule gives one (e.g. urgency 9, from DateMRIPlanned). Physics targets are worked out
+# from the job's latest query: the one received last, then the highest QueryId.
+target_date_tables = {
+    "PTLTargetDate": ("Job", "JobId"),
+    "PhysicsTargetDate": ("Job", "JobId"),
+}
+
+# SQL expression for each column the rules use, matching the aliases in target_date_inputs_query
+sql_columns = {
+    "UrgencyCode": "u.UrgencyCode",
+    "PatientTypeName": "pt.PatientTypeName",
+    "DateMRIRequested": "j.DateMRIRequested",
+    "DateMRIPlanned": "j.DateMRIPlanned",
+    "DateQueryReceived": "q.DateQueryReceived",
+}
+
+# Every job and query with the columns the rules need and the target dates currently stored.
+# A job with several queries appears once per query; update_target_dates keeps its latest query.
+target_date_inputs_query = """
+    SELECT
+        j.JobId,
+        q.QueryId,
+        u.UrgencyCode,
+        pt.PatientTypeName,
+        j.DateMRIRequested,
+        j.DateMRIPlanned,
+        q.DateQueryReceived,
+        j.PTLTargetDate,
+        j.PhysicsTargetDate
+    FROM Job j
+    LEFT JOIN Urgency u ON j.UrgencyId = u.UrgencyId
+    LEFT JOIN PatientType pt ON j.PatientTypeId = pt.PatientTypeId
+    LEFT JOIN Query q ON j.JobId = q.JobId
+    """
+
+# Calculate every target date for a frame holding the columns in sql_columns, with one np.select per target.
+# Returns a frame with one datetime column per target, NaT where the base date is missing.
+def calculate_target_dates(df, rules=target_date_rules):
+    all_rules = [rule for target_rules in rules.values() for rule in target_rules]
+    # Each urgency code, patient type and base date column is compared or converted once, however many rules use it
+    urgency_code = pd.to_numeric(df["UrgencyCode"]).to_numpy()
+    patient_type = df["PatientTypeName"].to_numpy(dtype=object)
+    codes, type_names, base_columns, _ = (set(values) for values in zip(*all_rules))
+    is_urgency = {code: urgency_code == code for code in codes - {None}}
+    is_patient_type = {type_name: patient_type == type_name for type_name in type_names - {None}}
+    base_dates = {column: df[column].astype("datetime64[ns]").to_numpy() for column in base_columns}
+
+    target_dates = {}
+    for target, target_rules in rules.items():
+        conditions = []
+        choices = []
+        for code, type_name, base_column, offset_days in target_rules:
+            condition = np.ones(len(df), dtype=bool)
+            if code is not None:
+                condition &= is_urgency[code]
+            if type_name is not None:
+                condition &= is_patient_type[type_name]
+            conditions.append(condition)
+            choices.append(base_dates[base_column] + np.timedelta64(offset_days, "D"))
+        target_dates[target] = np.select(conditions, choices, default=np.datetime64("NaT", "ns"))
+    return pd.DataFrame(target_dates, index=df.index)
+
+# SQL CASE expression for one target, e.g. for a view or query that cannot read the stored target dates.
+# columns overrides the SQL expression used for any column in sql_columns.
+def target_date_case_sql(target, columns=None, rules=target_date_rules, indent="    "):
+    columns = {**sql_columns, **(columns or {})}
+    lines = ["CASE"]
+    for code, type_name, base_column, offset_days in rules[target]:
+        base = columns[base_column]
+        value = base if offset_days == 0 else f"DATEADD(DAY, {offset_days}, {base})"
+        conditions = []
+        if code is not None:
+            conditions.append(f"{columns['UrgencyCode']} = {code}")
+        if type_name is not None:
+            conditions.append(f"{columns['PatientTypeName']} = '{type_name}'")
+        if conditions:
+            lines.append(f"{indent}WHEN {' AND '.join(conditions)} THEN {value}")
+        else:
+            lines.append(f"{indent}ELSE {value}")
+    lines.append("END")
+    return "\n".join(lines)
+
+# Set-based T-SQL that brings the stored target dates up to date without Python, e.g. at the end of
+# Insert_Data_MRSafetyDB.sql. Only rows whose target date has changed are updated, so the ModifiedDate
+# triggers do not mark every job as changed. targets limits the statements to some of the targets, and
+# job_ids is an SQL query of the JobIds to update, e.g. the rows a trigger fired for.
+def target_date_update_sql(rules=target_date_rules, targets=None, job_ids=None):
+    joins = "FROM Job j\nLEFT JOIN Urgency u ON j.UrgencyId = u.UrgencyId\nLEFT JOIN PatientType pt ON j.PatientTypeId = pt.PatientTypeId"
+    # Targets that use a query column are worked out from the job's latest query, as in update_target_dates
+    latest_query_join = (
+        "\nLEFT JOIN Query q ON q.QueryId = ("
+        "SELECT TOP 1 QueryId FROM Query WHERE JobId = j.JobId ORDER BY DateQueryReceived DESC, QueryId DESC)"
+    )
+    statements = []
+    for target in targets or rules:
+        case = target_date_case_sql(target, rules=rules, indent="\t")
+        statements.append(
+            f"UPDATE j\n"
+            f"SET {target} = t.TargetDate\n"
+            f"{joins}{latest_query_join if uses_query(target, rules) else ''}\n"
+            f"CROSS APPLY (SELECT {case} AS TargetDate) t\n"
+            # EXCEPT compares NULLs as equal, so a NULL target date that is still NULL is left alone
+            f"WHERE EXISTS (SELECT j.{target} EXCEPT SELECT t.TargetDate)"
+            + (f"\n\tAND j.JobId IN ({job_ids})" if job_ids else "")
+            + ";"
+        )
+    return "\n\n".join(statements)
+
+# Whether any rule for target takes its base date from the job's query
+def uses_query(target, rules=target_date_rules):
+    return any(sql_columns[base_column].startswith("q.") for _, _, base_column, _ in rules[target])
+
+# Columns of Job and Query the target dates are worked out from, for the triggers below
+def target_date_trigger_columns(rules=target_date_rules):
+    base_columns = {base_column for target_rules in rules.values() for _, _, base_column, _ in target_rules}
+    return {
+        "Job": ["UrgencyId", "PatientTypeId", *sorted(column for column in base_columns if sql_columns[column].startswith("j."))],
+        "Query": ["JobId", *sorted(column for column in base_columns if sql_columns[column].startswith("q."))],
+    }
+
+# T-SQL triggers on Job and Query that keep the stored target dates current as jobs and queries are entered and
+# edited, so the worklist views never show a missing or stale target between ETL runs. Each trigger only updates
+# the jobs in the statement that fired it, and returns straight away when none of the columns in
+# target_date_trigger_columns changed: that stops the ModifiedDate triggers and these ones firing each other.
+# Pasted into Create_Triggers_MRSafetyDB.sql by "python target_dates.py --print-triggers".
+def target_date_trigger_sql(rules=target_date_rules):
+    triggers = []
+    for table, columns in target_date_trigger_columns(rules).items():
+        # A new, edited or deleted query can change which query is the job's latest
+        if table == "Query":
+            targets = [target for target in rules if uses_query(target, rules)]
+            events, job_ids = "INSERT, UPDATE, DELETE", "SELECT JobId FROM Inserted UNION SELECT JobId FROM Deleted"
+        else:
+            targets = list(rules)
+            events, job_ids = "INSERT, UPDATE", "SELECT JobId FROM Inserted"
+        update = "\n".join(f"    {line}" if line else line for line in target_date_update_sql(rules, targets, job_ids).split("\n"))
+        triggers.append(
+            f"-- Target dates for {table}\n"
+            f"CREATE TRIGGER trg_{table}_TargetDates\n"
+            f"ON {table}\n"
+            f"AFTER {events}\n"
+            f"AS\n"
+            f"BEGIN\n"
+            f"    SET NOCOUNT ON;\n"
+            f"    IF NOT EXISTS (SELECT 1 FROM Inserted) AND NOT EXISTS (SELECT 1 FROM Deleted)\n"
+            f"        RETURN;\n"
+            f"    IF EXISTS (SELECT 1 FROM Inserted) AND NOT ({' OR '.join(f'UPDATE({column})' for column in columns)})\n"
+            f"        RETURN;\n"
+            f"{update}\n"
+            f"END;\n"
+            f"GO"
+        )
+    return "\n".join(triggers)
+
+# Recalculate every target date in Python and write back only the ones that changed.
+# The changed rows are loaded into a staging table and applied with one UPDATE per target.
+def update_target_dates(engine, load_method="executemany", rules=target_date_rules):
+    start = time.perf_counter()
+    date_columns = ["DateMRIRequested", "DateMRIPlanned", "DateQueryReceived", *rules]
+    df = pd.read_sql(text(target_date_inputs_query), engine, parse_dates=date_columns)
+    # Keep each job's latest query (missing dates sort first, so a received query beats one with no date)
+    df = df.sort_values(["JobId", "DateQueryReceived", "QueryId"], na_position="first", kind="stable")
+    df = df.drop_duplicates(subset="JobId", keep="last").reset_index(drop=True)
+    calculated = calculate_target_dates(df, rules)
+
+    updated = {}
+    for target in rules:
+        table, key = target_date_tables[target]
+        both_missing = df[target].isna() & calculated[target].isna()
+        changed = df[key].notna() & df[target].ne(calculated[target]) & ~both_missing
+        df_changed = pd.DataFrame({key: df.loc[changed, key].astype("int64"), target: calculated.loc[changed, target]})
+        updated[target] = len(df_changed)
+        if df_changed.empty:
+            continue
+        staging_table = f"{target}_Temp"
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP TABLE IF EXISTS {staging_table}"))
+        bulk_load(df_changed, staging_table, engine, method=load_method)
+        with engine.begin() as connection:
+            connection.execute(text(
+                f"UPDATE {table} SET {target} = s.{target} FROM {staging_table} s WHERE {table}.{key} = s.{key}"
+            ))
+            connection.execute(text(f"DROP TABLE {staging_table}"))
+
+    print(
+        f"Checked target dates for {df['JobId'].nunique()} jobs in {time.perf_counter() - start:.2f}s: "
+        + ", ".join(f"{count} {target} updated" for target, count in updated.items())
+    )
+    return updated
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalculate the PTL and Physics target dates stored on Job.")
+    parser.add_argument("--server", default="[REDACTED]")
+    parser.add_argument("--database", default="CMI_MRSafetyDB", help="database name, or the file path for --dialect sqlite")
+    parser.add_argument("--dialect", default="mssql", choices=["mssql", "sqlite"])
+    parser.add_argument("--load-method", default="executemany", choices=["executemany", "multi", "bulk"])
+    parser.add_argument("--print-sql", action="store_true", help="print the generated UPDATE statements instead of running them")
+    parser.add_argument("--print-triggers", action="store_true", help="print the generated target date triggers instead of running the update")
+    args = parser.parse_args()
+
+    if args.print_sql:
+        print(target_date_update_sql())
+        return
+    if args.print_triggers:
+        print(target_date_trigger_sql())
+        return
+    engine = connect_to_db(args.server, args.database, dialect=args.dialect)
+    update_target_dates(engine, args.load_method)
+
+if __name__ == "__main__":
+    main()
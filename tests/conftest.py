@@ -0,0 +1,198 @@
+import csv
+import os
+import runpy
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+import mongomock
+import numpy as np
+import pymongo
+import pytest
+from sqlalchemy import create_engine
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import db_connection
+
+# OLTP tables read by mongodb_etl.py, cut down to the columns it uses. ModifiedDate defaults to a day ago so a
+# row can be marked as changed by setting it to now. Dates are declared TIMESTAMP so they are read back as
+# datetimes, as they are from SQL Server.
+oltp_schema = """
+CREATE TABLE Patient (PatientId INTEGER PRIMARY KEY, HospitalNumber TEXT, NHSNumber TEXT, Initials TEXT, PatientCode TEXT, ModifiedDate TIMESTAMP DEFAULT (datetime('now', '-1 day')));
+CREATE TABLE Staff (StaffId INTEGER PRIMARY KEY, FirstName TEXT, LastName TEXT, Initials TEXT, ModifiedDate TIMESTAMP DEFAULT (datetime('now', '-1 day')));
+CREATE TABLE Urgency (UrgencyId INTEGER PRIMARY KEY, UrgencyCode INT, UrgencyType TEXT);
+CREATE TABLE PatientType (PatientTypeId INTEGER PRIMARY KEY, PatientTypeName TEXT);
+CREATE TABLE Site (SiteId INTEGER PRIMARY KEY, SiteShortName TEXT);
+CREATE TABLE ImplantCategory (ImplantId INTEGER PRIMARY KEY, ImplantName TEXT);
+CREATE TABLE MRSafetyCategory (MRSafetyId INTEGER PRIMARY KEY, MRSafetyName TEXT);
+CREATE TABLE ContactMethod (ContactMethodId INTEGER PRIMARY KEY, ContactMethodName TEXT);
+CREATE TABLE JobStatus (StatusId INTEGER PRIMARY KEY, StatusName TEXT);
+CREATE TABLE Job (
+    JobId INTEGER PRIMARY KEY, JobCode INT, DateJobLogged TIMESTAMP, PatientId INT, SiteId INT, PatientTypeId INT,
+    UrgencyId INT, DateMRIRequested TIMESTAMP, DateMRIPlanned TIMESTAMP, ImplantId INT, MRSafetyId INT,
+    PTLTargetDate TIMESTAMP, PhysicsTargetDate TIMESTAMP, ModifiedDate TIMESTAMP DEFAULT (datetime('now', '-1 day'))
+);
+CREATE TABLE Query (
+    QueryId INTEGER PRIMARY KEY, JobId INT, DateQueryReceived TIMESTAMP, QueryText TEXT, ContactMethodId INT,
+    ModifiedDate TIMESTAMP DEFAULT (datetime('now', '-1 day'))
+);
+CREATE TABLE CRISComment (CommentId INTEGER PRIMARY KEY, JobId INT, Comment TEXT, WrittenBy TEXT, ModifiedDate TIMESTAMP DEFAULT (datetime('now', '-1 day')));
+CREATE TABLE StatusLog (JobStatusId INTEGER PRIMARY KEY, JobId INT, StatusId INT, ChangedDate TIMESTAMP, ModifiedDate TIMESTAMP DEFAULT (datetime('now', '-1 day')));
+CREATE TABLE ActionLog (ActionId INTEGER PRIMARY KEY, JobId INT, ActionDescription TEXT, PerformedBy INT, PerformedDate TIMESTAMP, ModifiedDate TIMESTAMP DEFAULT (datetime('now', '-1 day')));
+CREATE TABLE JobStaff (JobStaffId INTEGER PRIMARY KEY, JobId INT, StaffId INT, ModifiedDate TIMESTAMP DEFAULT (datetime('now', '-1 day')));
+CREATE TABLE XRayCheck (XRayCheckId INTEGER PRIMARY KEY, JobId INT, StaffId INT, ModifiedDate TIMESTAMP DEFAULT (datetime('now', '-1 day')));
+"""
+
+lookup_rows = {
+    "Urgency": [(1, 1, "2WW"), (2, 3, "Urgent"), (3, 5, "Soon"), (4, 7, "Inpatient"), (5, 9, "Planned"), (6, 15, "Other"), (7, 20, "Routine")],
+    "PatientType": [(1, "Inpatient"), (2, "Outpatient")],
+    "Site": [(1, "TRURO"), (2, "INHEALTH"), (3, "WCH")],
+    "ImplantCategory": [(1, "PACEMAKER"), (2, "STENT"), (3, "CLIP")],
+    "MRSafetyCategory": [(1, "MR CONDITIONAL"), (2, "MR SAFE"), (3, "MR UNSAFE")],
+    "ContactMethod": [(1, "Email"), (2, "Cris"), (3, "Microsoft Teams")],
+    "JobStatus": [(1, "Waiting"), (2, "Planned"), (3, "Physics Done"), (4, "Complete")],
+}
+
+# Fill an OLTP database with job_count jobs. Every fifth job has no child rows at all (no query, CRIS comment,
+# statuses, actions, staff or x-ray checks), and the others have a varying number of each.
+def populate_oltp(engine, job_count=40):
+    start = datetime(2024, 1, 1, 9, 30)
+    with engine.begin() as connection:
+        raw = connection.connection.driver_connection
+        raw.executescript(oltp_schema)
+        for table_name, rows in lookup_rows.items():
+            raw.executemany(f"INSERT INTO {table_name} VALUES ({', '.join('?' * len(rows[0]))})", rows)
+        raw.executemany(
+            "INSERT INTO Patient (PatientId, HospitalNumber, NHSNumber, Initials, PatientCode) VALUES (?, ?, ?, ?, ?)",
+            [(p, f"A{p:06d}", None if p % 4 == 0 else f"{9434765900 + p}", "AB", f"P{p}") for p in range(1, 16)]
+        )
+        raw.executemany(
+            "INSERT INTO Staff (StaffId, FirstName, LastName, Initials) VALUES (?, ?, ?, ?)",
+            [(s, f"First{s}", f"Last{s}", f"S{s}") for s in range(1, 8)]
+        )
+        for job_id in range(1, job_count + 1):
+            logged = start + timedelta(days=job_id)
+            raw.execute(
+                "INSERT INTO Job (JobId, JobCode, DateJobLogged, PatientId, SiteId, PatientTypeId, UrgencyId, DateMRIRequested, DateMRIPlanned, ImplantId, MRSafetyId) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job_id, 1000 + job_id, logged, None if job_id % 7 == 0 else job_id % 15 + 1, job_id % 3 + 1 if job_id % 6 else None,
+                    job_id % 2 + 1 if job_id % 9 else None, job_id % 7 + 1, None if job_id % 8 == 0 else logged + timedelta(days=3),
+                    None if job_id % 3 == 0 else logged + timedelta(days=40), job_id % 3 + 1 if job_id % 4 else None, job_id % 3 + 1,
+                )
+            )
+            if job_id % 5 == 0:
+                continue
+            raw.execute(
+                "INSERT INTO Query (JobId, DateQueryReceived, QueryText, ContactMethodId) VALUES (?, ?, ?, ?)",
+                (job_id, None if job_id % 11 == 0 else logged - timedelta(days=1), f"Query {job_id}", job_id % 3 + 1 if job_id % 4 else None)
+            )
+            if job_id % 2:
+                raw.execute("INSERT INTO CRISComment (JobId, Comment, WrittenBy) VALUES (?, ?, ?)", (job_id, f"Comment {job_id}", "JR (MRSE)"))
+            for k in range(job_id % 4):
+                raw.execute(
+                    "INSERT INTO StatusLog (JobId, StatusId, ChangedDate) VALUES (?, ?, ?)",
+                    (job_id, k % 4 + 1, None if (job_id + k) % 10 == 0 else logged + timedelta(days=k, hours=k))
+                )
+            for k in range(job_id % 3):
+                raw.execute(
+                    "INSERT INTO ActionLog (JobId, ActionDescription, PerformedBy, PerformedDate) VALUES (?, ?, ?, ?)",
+                    (job_id, f"Action {k}", None if k == 1 else (job_id + k) % 7 + 1, logged + timedelta(days=k))
+                )
+            for k in range(job_id % 3):
+                raw.execute("INSERT INTO JobStaff (JobId, StaffId) VALUES (?, ?)", (job_id, (job_id + k) % 7 + 1))
+            if job_id % 3 == 1:
+                raw.execute("INSERT INTO XRayCheck (JobId, StaffId) VALUES (?, ?)", (job_id, job_id % 7 + 1))
+    return engine
+
+@pytest.fixture
+def oltp_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'oltp.sqlite'}", connect_args={"detect_types": sqlite3.PARSE_DECLTYPES})
+    yield populate_oltp(engine)
+    engine.dispose()
+
+@pytest.fixture
+def mongo_client():
+    return mongomock.MongoClient()
+
+# Run mongodb_etl.py as a script against the SQLite OLTP database and a mongomock client.
+# Returns the script's globals, so a test can call sync_jobs again with other settings.
+@pytest.fixture
+def run_mongodb_etl(monkeypatch, oltp_engine, mongo_client):
+    def run():
+        monkeypatch.setattr(db_connection, "connect_to_db", lambda *args, **kwargs: oltp_engine)
+        monkeypatch.setattr(pymongo, "MongoClient", lambda *args, **kwargs: mongo_client)
+        return runpy.run_path(os.path.join(repo_dir, "mongodb_etl.py"), run_name="mongodb_etl")
+    return run
+
+# Spreadsheet columns of the MR safety export as they are written in its header row, before rename_columns.
+# The header has two "Status" columns (mid status, then status), which read_csv reads as Status and Status.1.
+export_columns = [
+    "JobID", "Date Job Logged", "Site", "Pt Id", "Pt Id (NHS Number)", "Pt Id (RK9, NHS)", "Pt Initials", "Patient Type",
+    "Urgency", "Request Date", "Date Query Raised", "Query Type", "Query", "Implant Category", "Mr Cond",
+    "Planned/App Date", "PTL Target Date", "Physics Target Date", "PTL Over Due", "Over Due/Days Left",
+    "Intitals (Worked On)", "Xray Check", "Physics Done", "Status", "Responded On", "Next Action", "Cris Comment",
+    "Status", "Ready To Book Or Cancelled", "Complex?", "Comment",
+]
+
+# Patients as written in the export: (hospital number, NHS number), with spacing, prefixes and missing halves.
+# Some hospital numbers and NHS numbers are invalid, so their rows are quarantined.
+export_patients = [
+    ("A123456", "943 476 5919"), ("rk9 b234567", ""), ("", "4010232137"), ("012345", "401 023 2137"),
+    ("C345678", "9434765918"), ("9434765919", ""), ("12345", ""), ("D456789", "123"), ("E567890", ""), ("", ""),
+]
+export_text_values = {
+    "Site": ["Truro", " truro ", "RCHT Truro", "InHealth", "inhealth bodmin", "WCH", ""],
+    "Patient Type": ["Inpatient", " inpatient", "OUTPATIENT", ""],
+    "Urgency": ["1", "3 - urgent", "5", "7", "9", "15", "20", ""],
+    "Query Type": ["Email", "MS Teams", "CRIS", "Phone call", ""],
+    "Implant Category": ["Pacemaker", " pacemaker ", "STENT", "Clip", ""],
+    "Mr Cond": ["MR Conditional", "mr cond", "RA", "MR Safe", ""],
+    "Intitals (Worked On)": ["JR", " jr ", "JR, AB", "jr&ab", ""],
+    "Xray Check": ["AB", "ab,cd", ""],
+    "Status": ["Waiting Others", "With Physics", ""],
+    "Status.1": ["Planned", "Waiting", "Complete", "Cancelled", "Physics Done"],
+}
+
+# Write a synthetic MR safety export of rows job rows to path, in the layout of the real spreadsheet.
+# JobIds start at first_job. Every tenth row repeats the row before it (a duplicate job) and every 25th row has no
+# status (a blank job). The free-text columns are only filled on three rows in ten, so small chunks of the file
+# can have them all blank.
+def write_export(path, rows=200, first_job=1, seed=0):
+    rng = np.random.default_rng(seed)
+
+    def date(days, missing=0.2):
+        if rng.random() < missing:
+            return ""
+        return (datetime(2024, 1, 1) + timedelta(days=int(days))).strftime("%d/%m/%Y")
+
+    records = []
+    for i in range(rows):
+        if i % 10 == 9:
+            records.append(list(records[-1]))
+            continue
+        logged = int(rng.integers(0, 300))
+        hospital_number, nhs_number = export_patients[rng.integers(0, len(export_patients))]
+        free_text = i % 10 < 3
+        values = {column: choices[rng.integers(0, len(choices))] for column, choices in export_text_values.items()}
+        if i % 25 == 24:
+            values["Status.1"] = ""
+        records.append([
+            first_job + i, date(logged, missing=0.1), values["Site"], hospital_number, nhs_number, "RK9 junk",
+            ["ab", "A.B.", "abcdefg", ""][i % 4], values["Patient Type"], values["Urgency"], date(logged + 2),
+            date(logged - 1), values["Query Type"], f"  Query about job {first_job + i}  " if free_text else "",
+            values["Implant Category"], values["Mr Cond"], date(logged + 30), date(logged + 28), date(logged + 14), "Y",
+            "3", values["Intitals (Worked On)"], values["Xray Check"], date(logged + 5, missing=0.5), values["Status"],
+            # A date that does not exist, which read_csv leaves as text for convert_dates to coerce
+            "31/02/2024" if i == 7 else date(logged + 3, missing=0.6),
+            f"UPDATE JR 0{i % 9 + 1}/03: Called the ward UPDATE AB 1{i % 9}/03/2024: Chased" if free_text else "",
+            [" JR (MRSE) reviewed ", "Safe to scan", "   "][i % 3] if free_text else "",
+            values["Status.1"], date(logged + 40, missing=0.3), "N", "",
+        ])
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(export_columns)
+        writer.writerows(records)
+    return path
@@ -0,0 +1,175 @@
+import os
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from intermediate_store import IntermediateStore
+from mrsafetydb_data_cleaning import CleaningPipeline, MultiFileCleaningPipeline, check_jobid, concat_frames, stream_clean_and_load
+from tests.conftest import write_export
+
+# Staging tables the cleaning script loads
+staging_tables = ["Status_Temp", "Actions_Temp", "Patient", "Job_Temp", "CRIS_Temp", "Quarantine_Temp"]
+
+# A new SQLite staging database in tmp_path for each name asked for
+@pytest.fixture
+def staging_engine(tmp_path):
+    engines = []
+    def create(name):
+        engines.append(create_engine(f"sqlite:///{tmp_path / name}.sqlite"))
+        return engines[-1]
+    yield create
+    for engine in engines:
+        engine.dispose()
+
+# Every staging table, in the order its rows were loaded
+def staging_rows(engine):
+    with engine.connect() as connection:
+        return {table_name: pd.read_sql(text(f"SELECT * FROM {table_name} ORDER BY rowid"), connection) for table_name in staging_tables}
+
+def assert_same_staging_rows(engine, expected_engine):
+    expected = staging_rows(expected_engine)
+    assert all(len(df) for df in expected.values())
+    for table_name, df in staging_rows(engine).items():
+        pd.testing.assert_frame_equal(df, expected[table_name], obj=table_name)
+
+@pytest.fixture
+def export(tmp_path, monkeypatch):
+    # The stages also write inspection CSVs to the working directory
+    monkeypatch.chdir(tmp_path)
+    return str(write_export(tmp_path / "export.csv"))
+
+@pytest.mark.parametrize("chunk_size", [3, 64])
+def test_streaming_loads_the_same_rows_as_the_pipeline(export, staging_engine, chunk_size):
+    pipeline_engine = staging_engine("pipeline")
+    CleaningPipeline(export, pipeline_engine, trace_memory=False).run()
+    # Chunks of 3 rows include chunks where the query, CRIS comment and next action are all blank
+    stream_engine = staging_engine("stream")
+    assert stream_clean_and_load(export, chunk_size, stream_engine) == len(staging_rows(pipeline_engine)["Job_Temp"])
+    assert_same_staging_rows(stream_engine, pipeline_engine)
+
+@pytest.mark.parametrize("options", [{"skip": ["clean_sites"]}, {"resume_from": "load"}, {"stop_after": "Extract"}])
+def test_unknown_stage_names_are_rejected(export, staging_engine, options):
+    pipeline = CleaningPipeline(export, staging_engine("staging"), trace_memory=False)
+    with pytest.raises(ValueError, match="Unknown stage"):
+        pipeline.run(**options)
+    assert pipeline.stats == []
+
+def test_stop_after_records_stats_for_each_stage(export, staging_engine):
+    engine = staging_engine("staging")
+    pipeline = CleaningPipeline(export, engine)
+    df = pipeline.run(stop_after="validate_identifiers")
+
+    names = pipeline.stage_names()
+    stats = pipeline.report()
+    assert stats["Stage"].tolist() == names[:names.index("validate_identifiers") + 1]
+    assert list(stats.columns) == ["Stage", "Seconds", "RowsIn", "RowsOut", "PeakMB"]
+    assert (stats["Seconds"] >= 0).all() and (stats["PeakMB"] > 0).all()
+    # Each stage starts with the rows the one before it returned
+    assert stats["RowsIn"].tolist() == [0] + stats["RowsOut"].tolist()[:-1]
+    assert stats.set_index("Stage").loc[["extract", "dedupe", "validate_identifiers"], "RowsOut"].tolist() == [200, 176, len(df)]
+    assert len(df) + len(pipeline.quarantine) == 176
+    # Nothing was loaded
+    assert inspect(engine).get_table_names() == []
+
+def test_skipped_stages_do_not_run(export, staging_engine, capsys):
+    engine = staging_engine("staging")
+    pipeline = CleaningPipeline(export, engine, trace_memory=False)
+    df = pipeline.run(skip=["clean_site", "load_patient", "load_quarantine"])
+
+    assert "clean_site" not in pipeline.report()["Stage"].tolist()
+    assert pipeline.report()["PeakMB"].isna().all()
+    assert "Skipping stage clean_site." in capsys.readouterr().out
+    # Site is left as written in the export, and the skipped tables are not created
+    assert " truro " in set(df["Site"])
+    assert "Patient" not in inspect(engine).get_table_names()
+    assert "Job_Temp" in inspect(engine).get_table_names()
+
+def test_resume_from_a_checkpoint(export, staging_engine, tmp_path):
+    full_engine = staging_engine("full")
+    CleaningPipeline(export, full_engine, trace_memory=False).run()
+
+    # The first run stops part way through cleaning, saving the frame after each stage and the quarantined rows
+    checkpoint_dir = str(tmp_path / "checkpoints")
+    engine = staging_engine("resumed")
+    CleaningPipeline(export, engine, trace_memory=False, checkpoint_dir=checkpoint_dir).run(stop_after="clean_urgency")
+    assert "00_extract.pkl" in os.listdir(checkpoint_dir) and "23_load_quarantine.pkl" in os.listdir(checkpoint_dir)
+
+    # A new run resumes from the frame saved after clean_urgency, and loads the quarantine saved by the first run
+    os.remove(os.path.join(checkpoint_dir, "09_clean_urgency.pkl"))
+    with pytest.raises(FileNotFoundError):
+        CleaningPipeline(export, engine, trace_memory=False, checkpoint_dir=str(tmp_path / "empty")).run(resume_from="clean_site")
+    resumed = CleaningPipeline(export, engine, trace_memory=False, checkpoint_dir=checkpoint_dir)
+    resumed.run(resume_from="clean_urgency")
+    assert resumed.report()["Stage"].tolist() == resumed.stage_names()[resumed.stage_names().index("clean_urgency"):]
+    assert resumed.quarantine is not None
+    assert_same_staging_rows(engine, full_engine)
+
+    # resume_from needs somewhere to find the checkpoints
+    with pytest.raises(ValueError, match="checkpoint_dir"):
+        CleaningPipeline(export, engine, trace_memory=False).run(resume_from="clean_site")
+
+def test_runs_that_skip_a_cleaning_stage_are_not_cached(export, staging_engine, tmp_path, capsys):
+    full_engine = staging_engine("full")
+    CleaningPipeline(export, full_engine, trace_memory=False).run()
+    store = IntermediateStore(str(tmp_path / "cache"))
+
+    # The half-cleaned frame is not saved under the key of a full run
+    df = CleaningPipeline(export, staging_engine("skipped"), trace_memory=False, store=store).run(skip=["clean_site"])
+    assert " truro " in set(df["Site"])
+    assert not os.path.exists(store.cache_dir)
+
+    # So the next full run cleans from the CSV, and the run after it reads the cleaned frame it saved
+    for name in ["first", "cached"]:
+        engine = staging_engine(name)
+        CleaningPipeline(export, engine, trace_memory=False, store=store).run()
+        assert ("Using the cached cleaned frame" in capsys.readouterr().out) == (name == "cached")
+        assert_same_staging_rows(engine, full_engine)
+
+def test_a_split_export_loads_the_same_rows_as_one_file(export, staging_engine, tmp_path):
+    single_engine = staging_engine("single")
+    CleaningPipeline(export, single_engine, trace_memory=False).run()
+
+    # Row 110 repeats row 109, so the duplicate job is split across the two files
+    with open(export) as f:
+        header, *lines = f.readlines()
+    (tmp_path / "exports").mkdir()
+    for name, part in [("export_2.csv", lines[109:]), ("export_1.csv", lines[:109])]:
+        (tmp_path / "exports" / name).write_text(header + "".join(part))
+
+    engine = staging_engine("multi")
+    pipeline = MultiFileCleaningPipeline(str(tmp_path / "exports"), engine, max_workers=2, trace_memory=False)
+    pipeline.run()
+    assert pipeline.report().set_index("Stage").loc[["extract", "dedupe"], "RowsOut"].tolist() == [200, 176]
+    assert_same_staging_rows(engine, single_engine)
+
+def test_concat_frames_keeps_categories_that_differ_between_files():
+    first = pd.DataFrame({
+        "JobId": [1, 2, 3],
+        "Site": pd.Categorical(["Truro", "WCH", "Truro"]),
+        "Urgency": pd.Categorical(["1", "3", None]),
+        "Comment": pd.Categorical(["a", "b", "c"]),
+        "Status": pd.Categorical(["Planned", "Waiting", "Planned"]),
+    })
+    second = pd.DataFrame({
+        "JobId": [3, 4],
+        "Site": pd.Categorical(["InHealth", "Truro"]),
+        "Urgency": pd.Categorical([None, "9"]),
+        # Only category in the first file, so the combined column is not
+        "Comment": ["d", "e"],
+        "Status": pd.Categorical(["Complete", "Planned"]),
+    })
+    df = concat_frames([first, second])
+
+    assert df["JobId"].tolist() == [1, 2, 3, 3, 4]
+    assert isinstance(df["Site"].dtype, pd.CategoricalDtype) and isinstance(df["Urgency"].dtype, pd.CategoricalDtype)
+    assert df["Site"].tolist() == ["Truro", "WCH", "Truro", "InHealth", "Truro"]
+    assert set(df["Site"].cat.categories) == {"Truro", "WCH", "InHealth"}
+    assert df["Urgency"].astype(object).where(df["Urgency"].notna(), None).tolist() == ["1", "3", None, None, "9"]
+    assert df["Comment"].dtype == object and df["Comment"].tolist() == ["a", "b", "c", "d", "e"]
+    # The inputs are not changed
+    assert first["Site"].cat.categories.tolist() == ["Truro", "WCH"]
+
+    # Rows keep file order, so the dedupe keeps a duplicate job's row from the earlier file
+    deduped = check_jobid(df, key_columns=["JobId"])
+    assert deduped.loc[deduped["JobId"] == 3, "Site"].tolist() == ["Truro"]
@@ -0,0 +1,505 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from db_connection import connect_to_db
+from mrsafetydb_data_cleaning import (
+    category_columns, clean_contact_method, clean_dates, clean_hospital_number, clean_implant_category,
+    clean_mr_safety_category, clean_patient, clean_patient_type, clean_site, clean_staff, database_column_name,
+    date_columns, derive_status_events, extract_cris_comments, extract_data, hospital_number_errors, load_quarantine,
+    load_status, memory_report, nhs_number_errors, parse_next_actions, rename_columns, status_columns, status_rules,
+    string_columns, validate_identifiers
+)
+from tests.conftest import write_export
+
+# The row-wise versions the vectorised cleaning replaced, kept as references it must match
+def baseline_clean_hospital_number(df):
+    valid_pattern = r"^[A-Za-z]{1}\d{6}$|^\d{6}$"
+    df["HospitalNumber"] = df["HospitalNumber"].str.replace(r"[^A-Za-z0-9]", "", regex=True)
+    df["HospitalNumber"] = df["HospitalNumber"].replace("", np.nan)
+    df["HospitalNumber"] = df["HospitalNumber"].str.upper()
+    df["HospitalNumber"] = df["HospitalNumber"].str.removeprefix("RK9")
+    for index, row in df.iterrows():
+        if isinstance(row["HospitalNumber"], str) and row["HospitalNumber"].isdigit() and len(row["HospitalNumber"]) == 10:
+            df.at[index, "NHSNumber"] = row["HospitalNumber"]
+            df.at[index, "HospitalNumber"] = np.nan
+    df["HospitalNumber_valid"] = df["HospitalNumber"].str.match(valid_pattern, na=True)
+    return df
+
+def baseline_clean_site(df):
+    df["Site"] = df["Site"].str.strip().str.upper().fillna("NOT SPECIFIED")
+    df["Site"] = df["Site"].apply(lambda x: "TRURO" if "TRURO" in x else x)
+    df["Site"] = df["Site"].apply(lambda x: "INHEALTH" if "INHEALTH" in x else x)
+    return df
+
+def baseline_clean_contact_method(df):
+    df["ContactMethod"] = df["ContactMethod"].str.strip().str.lower().fillna("not specified")
+    df["ContactMethod"] = df["ContactMethod"].apply(lambda x: "microsoft teams" if "team" in x else x)
+    df["ContactMethod"] = df["ContactMethod"].apply(lambda x: "cris" if "cris" in x else x)
+    df["ContactMethod"] = df["ContactMethod"].str.title()
+    return df
+
+def baseline_clean_patient_type(df):
+    df["PatientType"] = df["PatientType"].str.strip().fillna("ns").str.upper()
+    return df
+
+def baseline_clean_implant_category(df):
+    df["ImplantCategory"] = df["ImplantCategory"].str.strip().fillna("Not Stated").str.upper()
+    return df
+
+def baseline_clean_staff(df, staff_columns):
+    for col in staff_columns:
+        df[col] = df[col].str.strip().str.upper().str.replace(r"[,& \\]", "/", regex=True)
+    return df
+
+def baseline_clean_mr_safety_category(df):
+    df["MRSafetyName"] = df["MRSafetyName"].str.strip().str.upper()
+    df["MRSafetyName"] = df["MRSafetyName"].apply(lambda x: 'MR CONDITIONAL' if x == 'MR COND' else x)
+    df["MRSafetyName"] = df["MRSafetyName"].apply(lambda x: 'RISK ASSESSMENT' if x == 'RA' else x)
+    return df
+
+def baseline_clean_patient(df):
+    patient_mapping = df.dropna(subset=['HospitalNumber', 'NHSNumber']).set_index('HospitalNumber')['NHSNumber'].to_dict()
+    patient_mapping_reverse = df.dropna(subset=['HospitalNumber', 'NHSNumber']).set_index('NHSNumber')['HospitalNumber'].to_dict()
+    patient_mapping.update(patient_mapping_reverse)
+    for idx, row in df.iterrows():
+        if pd.isna(row['HospitalNumber']) and pd.notna(row['NHSNumber']):
+            if row['NHSNumber'] in patient_mapping:
+                df.at[idx, 'HospitalNumber'] = patient_mapping[row['NHSNumber']]
+        elif pd.isna(row['NHSNumber']) and pd.notna(row['HospitalNumber']):
+            if row['HospitalNumber'] in patient_mapping:
+                df.at[idx, 'NHSNumber'] = patient_mapping[row['HospitalNumber']]
+    return df
+
+hospital_number_edge_cases = [
+    "A123456", "a123456", "123456", "000123", "000000", "A000001", "RK9A123456", "rk9 123456", "RK9",
+    "12345", "1234567", "AB123456", "A1234567", "A12345", "0123456789", "943 476 5919", "94347659190",
+    "123456789", " A-123/456 ", "", "   ", "--", None, np.nan, "Ä123456", "RK9RK9123456", "9434765919RK9",
+]
+nhs_number_edge_cases = ["9434765919", "0000000000", "943 476 5919", "123", "", None, np.nan]
+
+# Hospital and NHS numbers made up of random prefixes, digit runs (with leading zeros) and separators
+def random_patient_numbers(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    prefixes = np.array(["", "", "A", "z", "RK9", "rk9", "RK9B", "AB"], dtype=object)
+    separators = np.array(["", "", "", " ", "-", "/"], dtype=object)
+    lengths = rng.integers(0, 13, rows)
+    digits = rng.integers(0, 10, (rows, 12)).astype(str)
+    # One in four digit runs starts with zeros
+    digits[rng.random(rows) < 0.25, :3] = "0"
+    numbers = np.array(["".join(row[:n]) for row, n in zip(digits, lengths)], dtype=object)
+    hospital_numbers = prefixes[rng.integers(0, len(prefixes), rows)] + separators[rng.integers(0, len(separators), rows)] + numbers
+    hospital_numbers[rng.random(rows) < 0.1] = None
+    # NHS numbers come from a pool a quarter the size of the frame, so a patient appears on several rows
+    nhs_numbers = np.array([f"{9400000000 + n:010d}" for n in rng.integers(0, rows // 4 + 1, rows)], dtype=object)
+    nhs_numbers[rng.random(rows) < 0.4] = None
+    return pd.DataFrame({"HospitalNumber": hospital_numbers, "NHSNumber": nhs_numbers, "Initials": "AB"})
+
+def patient_number_frames():
+    edge_cases = pd.DataFrame({
+        "HospitalNumber": hospital_number_edge_cases * len(nhs_number_edge_cases),
+        "NHSNumber": [n for n in nhs_number_edge_cases for _ in hospital_number_edge_cases],
+        "Initials": "AB",
+    })
+    # Known patients, so the edge cases can be filled in from the mapping
+    known = pd.DataFrame({"HospitalNumber": ["A123456", "123456", "000123"], "NHSNumber": ["9434765919", "0000000000", "1111111111"], "Initials": "AB"})
+    return [pd.concat([known, edge_cases], ignore_index=True), random_patient_numbers(5000)]
+
+@pytest.mark.parametrize("frame", patient_number_frames())
+def test_clean_hospital_number_matches_row_wise(frame):
+    expected = baseline_clean_hospital_number(frame.copy())
+    result = clean_hospital_number(frame.copy())
+    pd.testing.assert_frame_equal(result, expected)
+
+@pytest.mark.parametrize("frame", patient_number_frames())
+def test_clean_patient_matches_row_wise(frame):
+    frame = clean_hospital_number(frame)
+    expected = baseline_clean_patient(frame.copy())
+    result = clean_patient(frame.copy())
+    pd.testing.assert_frame_equal(result, expected)
+    assert result["HospitalNumber"].notna().sum() > frame["HospitalNumber"].notna().sum()
+
+# The hospital number check clean_hospital_number made before validation moved to validate_identifiers
+def baseline_hospital_number_valid(values):
+    return values.str.match(r"^[A-Za-z]{1}\d{6}$|^\d{6}$", na=True)
+
+# The NHS number modulus 11 check written out one number at a time
+def baseline_nhs_number_error(value):
+    if pd.isna(value):
+        return None
+    if len(value) != 10 or not all(c in "0123456789" for c in value):
+        return "NHS_NUMBER_FORMAT"
+    check_digit = 11 - sum(int(c) * weight for c, weight in zip(value[:9], range(10, 1, -1))) % 11
+    if check_digit == 11:
+        check_digit = 0
+    return None if check_digit == int(value[9]) else "NHS_NUMBER_CHECK_DIGIT"
+
+@pytest.mark.parametrize("frame", patient_number_frames())
+def test_hospital_number_errors_match_the_old_pattern(frame):
+    # Both on the numbers as written and as clean_hospital_number leaves them for validation
+    for values in [frame["HospitalNumber"], clean_hospital_number(frame.copy())["HospitalNumber"]]:
+        errors = hospital_number_errors(values)
+        assert (pd.isna(errors) == baseline_hospital_number_valid(values).to_numpy(dtype=bool)).all()
+        assert set(errors[pd.notna(errors)]) <= {"HOSPITAL_NUMBER_FORMAT"}
+
+@pytest.mark.parametrize("value, expected", [
+    # Known valid numbers
+    ("9434765919", None), ("4010232137", None), ("4505577104", None),
+    # Remainder 0 of the weighted sum gives check digit 11, which is written as 0
+    ("1000000060", None), ("1000000061", "NHS_NUMBER_CHECK_DIGIT"),
+    ("9434765918", "NHS_NUMBER_CHECK_DIGIT"), ("4010232138", "NHS_NUMBER_CHECK_DIGIT"),
+    # Remainder 1 gives check digit 10, so no number with these first nine digits is valid
+    *[(f"100000001{d}", "NHS_NUMBER_CHECK_DIGIT") for d in range(10)],
+    ("94347659190", "NHS_NUMBER_FORMAT"), ("943476591", "NHS_NUMBER_FORMAT"), ("943 476 5919", "NHS_NUMBER_FORMAT"),
+    ("943476591X", "NHS_NUMBER_FORMAT"), ("A434765919", "NHS_NUMBER_FORMAT"), ("", "NHS_NUMBER_FORMAT"),
+    (None, None), (np.nan, None),
+])
+def test_nhs_number_check_digit(value, expected):
+    assert nhs_number_errors(pd.Series([value], dtype=object))[0] == expected
+    assert baseline_nhs_number_error(value) == expected
+
+def test_nhs_number_errors_match_the_written_out_check():
+    values = pd.concat([random_patient_numbers(5000)["NHSNumber"], pd.Series(nhs_number_edge_cases + hospital_number_edge_cases)], ignore_index=True)
+    errors = nhs_number_errors(values)
+    assert list(errors) == [baseline_nhs_number_error(value) for value in values]
+    assert set(errors) == {None, "NHS_NUMBER_FORMAT", "NHS_NUMBER_CHECK_DIGIT"}
+
+def test_invalid_identifiers_are_quarantined_with_reason_codes(tmp_path, monkeypatch):
+    df = pd.DataFrame.from_records([
+        (1, "A123456", "9434765919"),
+        (2, "12345", "9434765919"),
+        (3, "A123456", "9434765918"),
+        (4, "12345", "9434765918"),
+        (5, None, "123"),
+        (6, None, None),
+        (7, "AB12345", "94347659190"),
+        (8, "012345", None),
+    ], columns=["JobId", "HospitalNumber", "NHSNumber"]).assign(Initials="AB", Site="Truro")
+    valid, quarantine = validate_identifiers(df)
+
+    assert valid["JobId"].tolist() == [1, 6, 8]
+    pd.testing.assert_frame_equal(valid, df.loc[[0, 5, 7]])
+    assert list(quarantine.columns) == ["JobId", "HospitalNumber", "NHSNumber", "Initials", "ReasonCode"]
+    assert dict(zip(quarantine["JobId"], quarantine["ReasonCode"])) == {
+        2: "HOSPITAL_NUMBER_FORMAT",
+        3: "NHS_NUMBER_CHECK_DIGIT",
+        4: "HOSPITAL_NUMBER_FORMAT,NHS_NUMBER_CHECK_DIGIT",
+        5: "NHS_NUMBER_FORMAT",
+        7: "HOSPITAL_NUMBER_FORMAT,NHS_NUMBER_FORMAT",
+    }
+
+    monkeypatch.chdir(tmp_path)
+    engine = connect_to_db(None, str(tmp_path / "staging.sqlite"), dialect="sqlite")
+    try:
+        load_quarantine(quarantine, engine)
+        with engine.connect() as connection:
+            loaded = pd.read_sql(text("SELECT * FROM Quarantine_Temp ORDER BY rowid"), connection)
+        expected = quarantine.reset_index(drop=True)
+        pd.testing.assert_frame_equal(loaded, expected.astype(object).where(expected.notna(), None), check_dtype=False)
+        assert pd.read_csv(tmp_path / "quarantine.csv")["ReasonCode"].tolist() == quarantine["ReasonCode"].tolist()
+    finally:
+        engine.dispose()
+
+# Raw spellings seen in each text column, including spacing/case variants and missing values (NaN, as read_csv gives)
+raw_text_values = {
+    "Site": ["Truro", " truro ", "RCHT Truro", "TRURO (RCHT)", "InHealth", "inhealth bodmin", "WCH", " wch", "Penzance", "", "  ", np.nan],
+    "ContactMethod": ["Email", " email ", "Teams", "MS Teams", "microsoft team", "CRIS", "cris request", "Phone call", "", np.nan],
+    "PatientType": ["Inpatient", " inpatient", "OUTPATIENT", "outpatient ", "ip", "", np.nan],
+    "ImplantCategory": ["Pacemaker", " pacemaker ", "STENT", "Clip", "not stated", "", np.nan],
+    "StaffAssigned": ["JR", " jr ", "JR, AB", "jr&ab", "JR AB", "JR\\AB", "JR/AB", "", np.nan],
+    "XRayCheckStaff": ["AB", "ab,cd", " AB ", np.nan],
+    "MRSafetyName": ["MR Conditional", "mr cond", " MR COND ", "RA", "ra", "MR Safe", "MR UNSAFE", "", np.nan],
+}
+
+def raw_text_frame(rows, seed=0, as_category=False):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        col: pd.Series(values, dtype=object).iloc[rng.integers(0, len(values), rows)].to_numpy()
+        for col, values in raw_text_values.items()
+    })
+    # read_options reads these columns as category, but the cleaners also accept plain object columns
+    return df.astype("category") if as_category else df
+
+text_cleaners = [
+    (clean_site, baseline_clean_site, ["Site"]),
+    (clean_contact_method, baseline_clean_contact_method, ["ContactMethod"]),
+    (clean_patient_type, baseline_clean_patient_type, ["PatientType"]),
+    (clean_implant_category, baseline_clean_implant_category, ["ImplantCategory"]),
+    (lambda df: clean_staff(df, ["StaffAssigned", "XRayCheckStaff"]), lambda df: baseline_clean_staff(df, ["StaffAssigned", "XRayCheckStaff"]), ["StaffAssigned", "XRayCheckStaff"]),
+    (clean_mr_safety_category, baseline_clean_mr_safety_category, ["MRSafetyName"]),
+]
+
+@pytest.mark.parametrize("as_category", [False, True])
+@pytest.mark.parametrize("clean, baseline_clean, columns", text_cleaners)
+def test_normalized_columns_match_string_chains(clean, baseline_clean, columns, as_category):
+    raw = raw_text_frame(2000)
+    expected = baseline_clean(raw.copy())
+    result = clean(raw_text_frame(2000, as_category=as_category))
+    for col in columns:
+        assert isinstance(result[col].dtype, pd.CategoricalDtype)
+        # Each canonical value is one category, with no unused categories left over from the raw spellings
+        assert set(result[col].cat.categories) == set(expected[col].dropna())
+        pd.testing.assert_series_equal(result[col].astype(object), expected[col].astype(object))
+
+def test_memory_report(capsys):
+    raw = raw_text_frame(5000)
+    df = clean_staff(clean_site(raw.copy()), ["StaffAssigned", "XRayCheckStaff"])
+    df["Urgency"] = np.arange(len(df), dtype=np.int64) % 20
+    df["Urgency"] = pd.to_numeric(df["Urgency"], downcast="integer")
+    report = memory_report(df)
+
+    assert list(report.index) == list(df.columns) + ["Total"]
+    assert report.loc["Site", "Dtype"] == "category" and report.loc["Urgency", "Dtype"] == "int8"
+    after = df.memory_usage(deep=True, index=False)
+    before = df.astype({"Site": object, "StaffAssigned": object, "XRayCheckStaff": object, "Urgency": "int64"}).memory_usage(deep=True, index=False)
+    assert report["BytesAfter"].drop("Total").astype(int).to_dict() == after.to_dict()
+    assert report["BytesBefore"].drop("Total").astype(int).to_dict() == before.to_dict()
+    assert (report.loc["Total", "BytesBefore"], report.loc["Total", "BytesAfter"]) == (before.sum(), after.sum())
+    # Columns left as object are unchanged; the category and downcast columns shrink
+    assert report.loc["ContactMethod", "BytesBefore"] == report.loc["ContactMethod", "BytesAfter"]
+    assert report.loc["Urgency", "BytesAfter"] * 8 == report.loc["Urgency", "BytesBefore"]
+    assert report.loc["Site", "BytesAfter"] < report.loc["Site", "BytesBefore"] / 4
+    assert "Total" in capsys.readouterr().out
+
+# The if/elif chain status_rules replaced: status events for each job row, in row order
+def baseline_status_events(df_status):
+    job_status_data = []
+    for idx, row in df_status.iterrows():
+        job_id = row['JobId']
+        mid_status = row['MidStatus']
+        status = row['Status']
+        if pd.notna(row['PhysicsDone']):
+            job_status_data.append({'JobId': job_id, 'Status': "Physics Done", 'DateStatusChanged': row['PhysicsDone']})
+        if status == "Planned":
+            job_status_data.append({'JobId': job_id, 'Status': "Planned", 'DateStatusChanged': row['DateQueryReceived']})
+        if status == "Waiting":
+            job_status_data.append({'JobId': job_id, 'Status': "Waiting", 'DateStatusChanged': row['DateQueryReceived']})
+        else:
+            job_status_data.append({'JobId': job_id, 'Status': status, 'DateStatusChanged': row['DateJobCompleted']})
+        if mid_status == "Waiting Others":
+            job_status_data.append({'JobId': job_id, 'Status': mid_status, 'DateStatusChanged': row['DateMidStatusChanged']})
+    return pd.DataFrame(job_status_data)
+
+# Job rows with every combination of status, mid status and missing dates, in random order
+def status_frame(rows, seed=0, as_category=False):
+    rng = np.random.default_rng(seed)
+    statuses = np.array(["Planned", "Waiting", "Complete", "Physics Done", "Cancelled", np.nan], dtype=object)
+    mid_statuses = np.array(["Waiting Others", "With Physics", np.nan], dtype=object)
+
+    def dates():
+        values = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 400, rows), unit="D")
+        return pd.Series(values).where(rng.random(rows) > 0.3)
+
+    df = pd.DataFrame({
+        'JobId': rng.permutation(rows) + 1,
+        'MidStatus': mid_statuses[rng.integers(0, len(mid_statuses), rows)],
+        'DateMidStatusChanged': dates(),
+        'PhysicsDone': dates(),
+        'Status': statuses[rng.integers(0, len(statuses), rows)],
+        'DateJobCompleted': dates(),
+        'DateQueryReceived': dates(),
+    })[status_columns]
+    # read_options reads Status and MidStatus as category columns
+    return df.astype({'Status': 'category', 'MidStatus': 'category'}) if as_category else df
+
+@pytest.mark.parametrize("as_category", [False, True])
+def test_status_events_match_if_elif_chain(as_category):
+    df_status = status_frame(3000, as_category=as_category)
+    expected = baseline_status_events(df_status)
+    result = derive_status_events(df_status, status_rules)
+    pd.testing.assert_frame_equal(result, expected)
+    # load_status keeps the first event for each JobId and Status
+    pd.testing.assert_frame_equal(
+        result.drop_duplicates(subset=['JobId', 'Status']), expected.drop_duplicates(subset=['JobId', 'Status'])
+    )
+
+def test_load_status(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    engine = connect_to_db(None, str(tmp_path / "staging.sqlite"), dialect="sqlite")
+    try:
+        df = status_frame(500, as_category=True)
+        df["Initials"] = "AB"
+        loaded = load_status(df, engine)
+        expected = baseline_status_events(df[status_columns]).drop_duplicates(subset=['JobId', 'Status'])
+        pd.testing.assert_frame_equal(loaded, expected)
+        assert f"{len(expected)}\n" in capsys.readouterr().out
+        with engine.connect() as connection:
+            assert connection.execute(text("SELECT COUNT(*) FROM Status_Temp")).scalar() == len(expected)
+        assert len(pd.read_csv(tmp_path / "jobstatushistorytable.csv")) == len(expected)
+    finally:
+        engine.dispose()
+
+# The per-row NextAction loop parse_next_actions replaced
+def baseline_parse_next_actions(df):
+    df_comments = df[['JobId', 'NextAction']].copy()
+    df_comments['NextAction'] = df_comments['NextAction'].apply(
+        lambda x: f"UPDATE: {x}" if pd.notna(x) and not re.search(r'\bupdate\b', x, re.IGNORECASE) else x
+    )
+    action_table_data = []
+    for idx, row in df_comments.iterrows():
+        job_id = row['JobId']
+        actions = row['NextAction']
+        if pd.isna(actions):
+            continue
+        for action in re.split(r'(?=UPDATE\b)', actions):
+            action = action.strip()
+            if not action:
+                continue
+            action_match = re.match(r'UPDATE\s*([A-Z]{2,3})?\s*(\d{2}/\d{2}(?:/\d{4})?)?\s*:\s*(.*)', action)
+            if action_match:
+                staff_initials = action_match.group(1)
+                action_date = action_match.group(2)
+                action_description = action_match.group(3).strip()
+                if action_date:
+                    if re.match(r'^\d{2}/\d{2}$', action_date):
+                        action_date = f"{action_date}/2024"
+                    action_date = pd.to_datetime(action_date, format='%d/%m/%Y', errors='coerce')
+                action_table_data.append({'JobId': job_id, 'StaffInitials': staff_initials, 'ActionDate': action_date, 'ActionDescription': action_description})
+            else:
+                action_table_data.append({'JobId': job_id, 'StaffInitials': None, 'ActionDate': None, 'ActionDescription': action})
+    return pd.DataFrame(action_table_data)
+
+next_action_cases = [
+    # Several updates in one NextAction, with and without a year
+    "UPDATE JR 12/03/2024: Called the ward UPDATE AB 14/03: Sent the form",
+    "UPDATE JR 05/06: Emailed the radiographer UPDATE ABC 07/06/2023: Three initials UPDATE: No initials or date",
+    # Lowercase "update" is not prepended with UPDATE, and does not match the case-sensitive pattern
+    "update: waiting on the cardiology letter",
+    "Updated the record UPDATE JR 01/02: Chased",
+    # No UPDATE at all
+    "Chase the implant card",
+    # Malformed updates keep the whole action as the description
+    "UPDATE JR 12/03 sent without a colon",
+    "Called first. UPDATE AB: Booked",
+    # A date that does not exist
+    "UPDATE JR 31/02: Impossible date",
+    "UPDATEJR01/02:tight spacing",
+    "UPDATE: UPDATE: ",
+    "   ",
+    np.nan,
+]
+
+# NextAction values made of one or two of the cases above, joined by a space
+def next_action_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    cases = np.array(next_action_cases, dtype=object)
+    first = cases[rng.integers(0, len(cases), rows)]
+    second = cases[rng.integers(0, len(cases), rows)]
+    joined = np.where(
+        (rng.random(rows) < 0.3) & pd.notna(first) & pd.notna(second),
+        first.astype(str) + " " + second.astype(str),
+        first
+    )
+    return pd.DataFrame({'JobId': rng.permutation(rows) + 1, 'NextAction': joined})
+
+def test_next_actions_match_row_loop():
+    cases = pd.DataFrame({'JobId': np.arange(len(next_action_cases)) + 1, 'NextAction': next_action_cases})
+    for df in [cases, next_action_frame(3000)]:
+        pd.testing.assert_frame_equal(parse_next_actions(df), baseline_parse_next_actions(df))
+
+    parsed = parse_next_actions(cases).groupby('JobId')
+    # Several updates in one NextAction become one action each, dated in 2024 when the year is left out
+    first = parsed.get_group(1)
+    assert first['StaffInitials'].tolist() == ["JR", "AB"]
+    assert first['ActionDate'].tolist() == [pd.Timestamp("2024-03-12"), pd.Timestamp("2024-03-14")]
+    assert first['ActionDescription'].tolist() == ["Called the ward", "Sent the form"]
+    # Text with no UPDATE is the description of one undated action
+    assert parsed.get_group(5)[['StaffInitials', 'ActionDescription']].values.tolist() == [[None, "Chase the implant card"]]
+    # Lowercase "update" and malformed entries keep the whole action as the description
+    assert parsed.get_group(3)['ActionDescription'].tolist() == ["update: waiting on the cardiology letter"]
+    assert parsed.get_group(6)['ActionDescription'].tolist() == ["UPDATE JR 12/03 sent without a colon"]
+    assert parsed.get_group(6)['ActionDate'].isna().all()
+    # Rows with no NextAction give no actions
+    assert len(next_action_cases) not in parsed.groups
+
+# The iterrows loop extract_cris_comments replaced
+def baseline_cris_comments(df_cris):
+    cris_table_data = []
+    for idx, row in df_cris.iterrows():
+        cris_comment = row['CRISComment']
+        if pd.isna(cris_comment):
+            continue
+        cris_comment = cris_comment.strip()
+        if cris_comment == "":
+            continue
+        if pd.notna(cris_comment) and "JR (MRSE)" in cris_comment:
+            cris_staff = "JR"
+        else:
+            cris_staff = row['StaffAssigned']
+        cris_table_data.append({
+            'JobId': row['JobId'],
+            'CRISComment': cris_comment,
+            'CRISStaff': cris_staff,
+            'DateCRIS': row['DateJobCompleted']
+        })
+    return pd.DataFrame(cris_table_data)
+
+cris_comment_cases = [
+    "Reviewed, safe to scan", "  Padded comment \n", "JR (MRSE) reviewed the implant card", "Checked by JR (MRSE)\n",
+    # Only the exact "JR (MRSE)" attributes the comment to JR
+    "JR MRSE reviewed", "jr (mrse) reviewed", "", "   ", "\n\t", np.nan,
+]
+
+# CRIS comments with staff assigned and completion dates, some of each missing
+def cris_frame(rows, seed=0, as_category=False):
+    rng = np.random.default_rng(seed)
+    staff = np.array(["JR", "AB", "JR/AB", np.nan], dtype=object)
+    completed = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 400, rows), unit="D")
+    df = pd.DataFrame({
+        'JobId': rng.permutation(rows) + 1,
+        'CRISComment': np.array(cris_comment_cases, dtype=object)[rng.integers(0, len(cris_comment_cases), rows)],
+        'StaffAssigned': staff[rng.integers(0, len(staff), rows)],
+        'DateJobCompleted': pd.Series(completed).where(rng.random(rows) > 0.3),
+    })
+    # clean_staff leaves StaffAssigned as a category column
+    return df.astype({'StaffAssigned': 'category'}) if as_category else df
+
+@pytest.mark.parametrize("as_category", [False, True])
+def test_cris_comments_match_iterrows_loop(as_category):
+    df_cris = cris_frame(2000, as_category=as_category)
+    result = extract_cris_comments(df_cris)
+    pd.testing.assert_frame_equal(result, baseline_cris_comments(df_cris))
+
+    # Missing and blank comments are skipped, and the rest are stripped
+    assert len(result) == (df_cris['CRISComment'].str.strip().fillna("") != "").sum()
+    assert set(result['CRISComment']) == {
+        "Reviewed, safe to scan", "Padded comment", "JR (MRSE) reviewed the implant card", "Checked by JR (MRSE)",
+        "JR MRSE reviewed", "jr (mrse) reviewed",
+    }
+    # "JR (MRSE)" comments are JR's, the others take StaffAssigned, and all are dated by DateJobCompleted
+    source = df_cris.set_index('JobId').loc[result['JobId']].reset_index()
+    by_jr = result['CRISComment'].str.contains("JR (MRSE)", regex=False)
+    assert (result.loc[by_jr, 'CRISStaff'] == "JR").all()
+    pd.testing.assert_series_equal(result.loc[~by_jr, 'CRISStaff'], source.loc[~by_jr, 'StaffAssigned'].astype(object), check_names=False)
+    pd.testing.assert_series_equal(result['DateCRIS'], source['DateJobCompleted'], check_names=False)
+
+def test_export_is_read_with_the_declared_dtypes(tmp_path):
+    df = extract_data(str(write_export(tmp_path / "export.csv")))
+    names = {col: database_column_name(col) for col in df.columns}
+    # Spaced and oddly cased headers, and the second "Status" column, map to the database column names
+    assert (names["Pt Id"], names["Pt Id (NHS Number)"], names["JobID"]) == ("HospitalNumber", "NHSNumber", "JobId")
+    assert (names["Status"], names["Status.1"]) == ("MidStatus", "Status")
+
+    for col, name in names.items():
+        if name in category_columns:
+            assert isinstance(df[col].dtype, pd.CategoricalDtype), col
+        elif name in string_columns:
+            assert df[col].dtype == object and df[col].dropna().map(type).eq(str).all(), col
+        elif name == "DateMidStatusChanged":
+            # Holds a date that does not exist, so it is left as text for clean_dates
+            assert df[col].dtype == object, col
+        elif name in date_columns:
+            assert df[col].dtype == "datetime64[ns]", col
+    assert sorted(name for name in names.values() if name in category_columns + string_columns + date_columns) == sorted(
+        category_columns + string_columns + date_columns
+    )
+    # Identifiers keep their leading zeros, and JobId is downcast
+    assert "012345" in set(df["Pt Id"])
+    assert df["JobID"].dtype == np.int16
+
+    df = clean_dates(rename_columns(df))
+    assert df["DateMidStatusChanged"].dtype == "datetime64[ns]"
+    assert df["Status"].cat.categories.isin(["Planned", "Waiting", "Complete", "Cancelled", "Physics Done"]).all()
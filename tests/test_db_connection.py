@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import event, text
+
+import db_connection
+from db_connection import bulk_load, connect_to_db, read_sql_concurrently
+
+@pytest.fixture
+def sqlite_engine(tmp_path):
+    engine = connect_to_db(None, str(tmp_path / "staging.sqlite"), dialect="sqlite")
+    yield engine
+    engine.dispose()
+    db_connection._engines.clear()
+
+# A staging frame with the column types the cleaning script loads: ints, text, categories, dates and missing values
+def staging_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 400, rows), unit="D")
+    return pd.DataFrame({
+        "JobId": np.arange(1, rows + 1, dtype=np.int32),
+        "HospitalNumber": pd.Series([f"A{n:06d}" for n in rng.integers(0, 10**6, rows)]).where(rng.random(rows) > 0.1),
+        "Site": pd.Categorical(rng.choice(["TRURO", "INHEALTH", "WCH"], rows)),
+        "Urgency": rng.integers(0, 21, rows).astype(np.int8),
+        "DateJobLogged": pd.Series(dates).where(rng.random(rows) > 0.2),
+        "QueryFreeText": pd.Series([f"Query {n} with 'quotes'" for n in range(rows)]).where(rng.random(rows) > 0.3),
+    })
+
+# Parameters bound by each statement run on the engine
+def record_parameter_counts(engine):
+    counts = []
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("INSERT"):
+            counts.append(len(parameters[0]) if executemany else len(parameters))
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    return counts
+
+def test_concurrent_reads_match_sequential_reads(oltp_engine):
+    queries = {
+        "StatusLog": ("SELECT JobId, StatusId, ChangedDate FROM StatusLog WHERE JobId > :first_job ORDER BY JobStatusId", {"first_job": 10}),
+        "ActionLog": ("SELECT JobId, ActionDescription, PerformedBy, PerformedDate FROM ActionLog ORDER BY ActionId", {}),
+        "JobStaff": ("SELECT JobId, StaffId FROM JobStaff WHERE JobId BETWEEN :first_job AND :last_job ORDER BY JobStaffId", {"first_job": 3, "last_job": 17}),
+        "XRayCheck": ("SELECT JobId, StaffId FROM XRayCheck WHERE JobId > 1000", {}),
+        "Job": ("SELECT * FROM Job ORDER BY JobId", {}),
+    }
+    for max_workers in (1, 2, 4):
+        frames = read_sql_concurrently(oltp_engine, queries, max_workers=max_workers)
+        # Results come back under the same names, in the order the queries were given
+        assert list(frames) == list(queries)
+        for name, (sql, params) in queries.items():
+            pd.testing.assert_frame_equal(frames[name], pd.read_sql(text(sql), oltp_engine, params=params))
+    assert frames["XRayCheck"].empty
+
+def test_concurrent_read_errors_are_raised(oltp_engine):
+    queries = {
+        "Job": ("SELECT JobId FROM Job", {}),
+        "Missing": ("SELECT JobId FROM MissingTable", {}),
+    }
+    with pytest.raises(Exception, match="MissingTable"):
+        read_sql_concurrently(oltp_engine, queries)
+
+def test_engines_are_reused_only_with_the_same_options(tmp_path):
+    db_connection._engines.clear()
+    database = str(tmp_path / "test.sqlite")
+    engine = connect_to_db(None, database, dialect="sqlite")
+    try:
+        assert connect_to_db(None, database, dialect="sqlite") is engine
+        small_pool = connect_to_db(None, database, dialect="sqlite", pool_size=1, max_overflow=0)
+        assert small_pool is not engine
+        assert (small_pool.pool.size(), small_pool.pool._max_overflow) == (1, 0)
+        assert connect_to_db(None, database, dialect="sqlite", pool_pre_ping=False) is not engine
+        assert connect_to_db(None, database, dialect="sqlite", pool_size=1, max_overflow=0) is small_pool
+    finally:
+        for cached in db_connection._engines.values():
+            cached.dispose()
+        db_connection._engines.clear()
+
+def test_bulk_load_methods_load_the_same_rows(sqlite_engine):
+    df = staging_frame(2500)
+    for method in ("executemany", "multi"):
+        bulk_load(df, f"Job_{method}", sqlite_engine, method=method, chunksize=1000)
+    # Loading appends, so a second load of the same frame doubles the table
+    bulk_load(df, "Job_multi", sqlite_engine, method="multi", chunksize=1000)
+
+    loaded = {
+        method: pd.read_sql(text(f"SELECT * FROM Job_{method} ORDER BY rowid"), sqlite_engine, parse_dates=["DateJobLogged"])
+        for method in ("executemany", "multi")
+    }
+    assert len(loaded["executemany"]) == len(df)
+    pd.testing.assert_frame_equal(loaded["multi"].iloc[:len(df)], loaded["executemany"])
+    pd.testing.assert_frame_equal(loaded["multi"].iloc[len(df):].reset_index(drop=True), loaded["executemany"])
+    expected = df.astype({"Site": object, "JobId": "int64", "Urgency": "int64"})
+    # Missing text comes back from SQLite as None
+    for col in ["HospitalNumber", "QueryFreeText"]:
+        expected[col] = expected[col].where(expected[col].notna(), None)
+    pd.testing.assert_frame_equal(loaded["executemany"], expected)
+
+def test_multi_load_keeps_statements_under_the_parameter_limit(sqlite_engine):
+    # 150 columns: 999 parameters leave room for 6 rows per INSERT
+    df = pd.DataFrame(np.arange(100 * 150).reshape(100, 150), columns=[f"Column{i}" for i in range(150)])
+    counts = record_parameter_counts(sqlite_engine)
+    bulk_load(df, "Wide_Temp", sqlite_engine, method="multi")
+    assert max(counts) <= db_connection._max_parameters["sqlite"]
+    assert counts == [6 * 150] * 16 + [4 * 150]
+    with sqlite_engine.connect() as connection:
+        assert connection.execute(text("SELECT COUNT(*), SUM(Column149) FROM Wide_Temp")).one() == (100, df["Column149"].sum())
+
+def test_bulk_load_rejects_unknown_methods(sqlite_engine):
+    df = staging_frame(10)
+    with pytest.raises(ValueError, match="Unknown load method 'copy'"):
+        bulk_load(df, "Job_Temp", sqlite_engine, method="copy")
+    # BULK INSERT only exists on SQL Server
+    with pytest.raises(ValueError, match="needs SQL Server"):
+        bulk_load(df, "Job_Temp", sqlite_engine, method="bulk")
@@ -0,0 +1,86 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from intermediate_store import IntermediateStore
+
+pytest.importorskip("pyarrow")
+
+@pytest.fixture
+def store(tmp_path):
+    return IntermediateStore(str(tmp_path / "cache"), max_age_days=7, max_size_mb=1)
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "export.csv"
+    path.write_text("JobID,Site\n1,Truro\n2,WCH\n")
+    return str(path)
+
+def cleaned_frame(rows):
+    return pd.DataFrame({
+        "JobId": range(rows),
+        "Site": pd.Categorical(["Truro", "WCH"] * (rows // 2)),
+        "DateJobLogged": pd.date_range("2024-01-01", periods=rows, freq="h"),
+        "Comment": [f"comment {i}" for i in range(rows)],
+    })
+
+# Set when an entry was last used, as evict() sees it
+def last_used(store, key, days_ago):
+    when = time.time() - days_ago * 86400
+    os.utime(os.path.join(store.cache_dir, key), (when, when))
+
+def test_a_saved_frame_is_read_back(store, source):
+    key = store.key(source, {"date_format": "%d/%m/%Y"})
+    assert not store.has(key, "cleaned") and store.load(key, "cleaned") is None
+
+    df = cleaned_frame(100)
+    store.save(key, "cleaned", df)
+    assert store.has(key, "cleaned")
+    assert not os.path.exists(store.path(key, "cleaned") + ".tmp")
+    pd.testing.assert_frame_equal(store.load(key, "cleaned"), df)
+
+def test_the_key_changes_with_the_source_file_and_the_config(store, source, tmp_path):
+    config = {"date_format": "%d/%m/%Y", "string_columns": ["HospitalNumber"]}
+    key = store.key(source, config)
+    # The same contents and settings, given in another order, give the same key
+    assert store.key([source], dict(reversed(config.items()))) == key
+
+    assert store.key(source, {**config, "date_format": "%m/%d/%Y"}) != key
+    with open(source, "a") as f:
+        f.write("3,Truro\n")
+    assert store.key(source, config) != key
+
+    other = tmp_path / "other.csv"
+    other.write_text("JobID,Site\n4,WCH\n")
+    assert store.key([source, str(other)], config) != store.key(source, config)
+
+def test_entries_not_used_for_max_age_days_are_evicted(store, source):
+    keys = [store.key(source, {"run": i}) for i in range(3)]
+    for key in keys:
+        store.save(key, "cleaned", cleaned_frame(10))
+    last_used(store, keys[0], days_ago=8)
+    last_used(store, keys[1], days_ago=6)
+    last_used(store, keys[2], days_ago=30)
+
+    store.evict(keep=keys[2])
+    assert [store.has(key, "cleaned") for key in keys] == [False, True, True]
+
+    # Loading an entry counts as using it
+    last_used(store, keys[1], days_ago=8)
+    store.load(keys[1], "cleaned")
+    store.evict()
+    assert [store.has(key, "cleaned") for key in keys] == [False, True, False]
+
+def test_least_recently_used_entries_are_evicted_over_max_size_mb(store, source):
+    keys = [store.key(source, {"run": i}) for i in range(4)]
+    for days_ago, key in zip([4, 1, 3, 2], keys):
+        store.save(key, "cleaned", cleaned_frame(20000))
+        last_used(store, key, days_ago)
+    entry_size = os.path.getsize(store.path(keys[0], "cleaned"))
+    assert 3 * entry_size > 1024 * 1024 > 2 * entry_size
+
+    # The least recently used entries go first until the rest fit in 1MB, but the kept entry is never removed
+    store.evict(keep=keys[0])
+    assert [store.has(key, "cleaned") for key in keys] == [True, True, False, False]
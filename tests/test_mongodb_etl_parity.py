@@ -0,0 +1,134 @@
+import bson
+import pandas as pd
+
+# The job document builder as it was before the batched sync: iterrows over the jobs, groupby/apply for the
+# child rows and a find_one per patient and staff member. Kept as the reference the batched builder must match.
+def baseline_job_sync(etl, collection):
+    engine = etl["engine"]
+    patient_collection = etl["patient_collection"]
+    staff_collection = etl["staff_collection"]
+
+    job_df = pd.read_sql(etl["job_query"], engine)
+    job_df = job_df.where(pd.notnull(job_df), None)
+
+    status_df = pd.read_sql(etl["status_query"], engine)
+    status_df["ChangedDate"] = status_df["ChangedDate"].where(pd.notnull(status_df["ChangedDate"]), None)
+    status_data = status_df.groupby("JobId").apply(
+        lambda x: [
+            {
+                "StatusName": row["StatusName"],
+                "ChangedDate": row["ChangedDate"].to_pydatetime() if pd.notnull(row["ChangedDate"]) else None
+            }
+            for _, row in x.iterrows()
+        ]
+    ).to_dict()
+
+    action_df = pd.read_sql(etl["action_query"], engine)
+    action_df = action_df.where(pd.notnull(action_df), None)
+    action_df["PerformedBy"] = action_df["PerformedBy"].astype("Int64")
+    action_data = action_df.groupby("JobId").apply(
+        lambda x: [
+            {
+                "comment": row["ActionDescription"],
+                "staffMember": row["PerformedBy"],
+                "date": row["PerformedDate"].to_pydatetime() if pd.notnull(row["PerformedDate"]) else None
+            }
+            for _, row in x.iterrows()
+        ]
+    ).to_dict()
+
+    job_staff_df = pd.read_sql(etl["job_staff_query"], engine)
+    job_staff_df = job_staff_df.where(pd.notnull(job_staff_df), None)
+    job_staff_data = job_staff_df.groupby("JobId")["StaffId"].apply(list).to_dict()
+
+    xray_check_df = pd.read_sql(etl["xray_check_query"], engine)
+    xray_check_df = xray_check_df.where(pd.notnull(xray_check_df), None)
+    xray_check_data = xray_check_df.groupby("JobId")["StaffId"].apply(list).to_dict()
+
+    def get_patient_object_id(patient_id):
+        patient = patient_collection.find_one({"patientKey": patient_id})
+        return patient["_id"] if patient else None
+
+    def get_staff_object_ids(ids, field_name, collection):
+        staff_object_ids = []
+        for id_ in ids:
+            doc = collection.find_one({field_name: id_}, {"_id": 1})
+            if doc:
+                staff_object_ids.append(doc["_id"])
+        return staff_object_ids
+
+    for _, job in job_df.iterrows():
+        update_data = {
+            "$set": {
+                "jobKey": job["JobId"],
+                "jobCode": job["JobCode"],
+                "patientDetails": {
+                    "patientId": get_patient_object_id(job["PatientId"]) if pd.notnull(job["PatientId"]) else None,
+                    "patientType": job["PatientTypeName"] if job["PatientTypeName"] else None,
+                },
+                "scanDetails": {
+                    **({"dateMRIRequested": job["DateMRIRequested"]} if pd.notnull(job["DateMRIRequested"]) else {}),
+                    **({"dateMRIScheduled": job["DateMRIPlanned"]} if pd.notnull(job["DateMRIPlanned"]) else {}),
+                    "urgency": {
+                        "urgencyCode": job["UrgencyCode"] if job["UrgencyCode"] else None,
+                        "urgencyType": job["UrgencyType"] if job["UrgencyType"] else None,
+                    },
+                    "site": job["SiteShortName"] if job["SiteShortName"] else None,
+                },
+                "queryDetails": {
+                    "dateReceived": job["DateQueryReceived"].to_pydatetime() if pd.notnull(job["DateQueryReceived"]) else [],
+                    "receivedBy": job.get("ContactMethodName"),
+                    "message": job.get("QueryText")
+                },
+                "safetyInvestigation": {
+                    "dateJobLogged": job.get("DateJobLogged"),
+                    "staffAssigned": get_staff_object_ids(job_staff_data.get(job["JobId"], []), "staffKey", staff_collection),
+                    "implantCategory": job.get("ImplantName"),
+                    "mrSafety": job.get("MRSafetyName"),
+                    **({"xrayCheckedBy": get_staff_object_ids(xray_check_data.get(job["JobId"], []), "staffKey", staff_collection)} if xray_check_data.get(job["JobId"]) else {}),
+                    **({"actionLog": [
+                        {
+                            **action,
+                            "staffMember": (
+                                get_staff_object_ids([int(action["staffMember"])], "staffKey", staff_collection)[0]
+                                if pd.notnull(action["staffMember"]) and action["staffMember"] is not None
+                                else None
+                            )
+                        }
+                        for action in action_data.get(job["JobId"], [])
+                    ]} if action_data.get(job["JobId"]) else {}),
+                    **({"CRIS": {
+                        "comment": job.get("CRISComment"),
+                        "writtenBy": job.get("CRISCommentWrittenBy")
+                    }} if job.get("CRISComment") else {})
+                },
+                "statusLog": status_data.get(job["JobId"], []),
+                "kpiPerformance": {
+                    "ptlTargetDate": job["PTLTargetDate"].to_pydatetime() if pd.notnull(job["PTLTargetDate"]) else None,
+                    "physicsTargetDate": job["PhysicsTargetDate"].to_pydatetime() if pd.notnull(job["PhysicsTargetDate"]) else None,
+                }
+            }
+        }
+        collection.update_one({"jobKey": job["JobId"]}, update_data, upsert=True)
+
+# BSON encoding of every document in a collection without its own _id, in jobKey order
+def encoded_documents(collection):
+    return [bson.encode(document) for document in collection.find({}, {"_id": 0}).sort("jobKey", 1)]
+
+def test_job_documents_match_baseline(run_mongodb_etl, mongo_client):
+    etl = run_mongodb_etl()
+    baseline_collection = mongo_client["MRSafetyDB"]["jobBaseline"]
+    baseline_job_sync(etl, baseline_collection)
+
+    documents = encoded_documents(etl["job_collection"])
+    assert len(documents) == 40
+    assert documents == encoded_documents(baseline_collection)
+
+def test_chunked_job_documents_match_baseline(run_mongodb_etl, mongo_client):
+    etl = run_mongodb_etl()
+    baseline_collection = mongo_client["MRSafetyDB"]["jobBaseline"]
+    baseline_job_sync(etl, baseline_collection)
+
+    etl["job_collection"].delete_many({})
+    etl["sync_jobs"](None, 7)
+    assert encoded_documents(etl["job_collection"]) == encoded_documents(baseline_collection)
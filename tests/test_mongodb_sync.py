@@ -0,0 +1,128 @@
+import mongomock
+import pandas as pd
+from pymongo.errors import AutoReconnect
+from sqlalchemy import text
+
+from mongodb_sync import ObjectIdResolver, bulk_upsert, group_records, group_values
+
+# Passes bulk writes through to a mongomock collection, recording the size of each batch.
+# fail_batches are batch numbers (from 1) that fail as a whole, as with a lost connection.
+class RecordingCollection:
+    def __init__(self, collection, fail_batches=()):
+        self.collection = collection
+        self.fail_batches = set(fail_batches)
+        self.batch_sizes = []
+
+    def bulk_write(self, operations, ordered=True):
+        self.batch_sizes.append(len(operations))
+        if len(self.batch_sizes) in self.fail_batches:
+            raise AutoReconnect("connection lost")
+        return self.collection.bulk_write(operations, ordered=ordered)
+
+def job_updates(keys, name="job"):
+    return ((key, {"$set": {"jobKey": key, "name": f"{name} {key}"}}) for key in keys)
+
+# Every job document in the collection, in jobKey order
+def job_documents(mongo_client):
+    return list(mongo_client["MRSafetyDB"]["job"].find({}, {"_id": 0}).sort("jobKey", 1))
+
+def test_bulk_upsert_batches():
+    collection = RecordingCollection(mongomock.MongoClient()["MRSafetyDB"]["job"])
+    summary = bulk_upsert(collection, job_updates(range(1, 8)), "jobKey", batch_size=3)
+    assert collection.batch_sizes == [3, 3, 1]
+    assert (summary["upserted"], summary["matched"], summary["modified"], summary["errors"]) == (7, 0, 0, 0)
+    stored_ids = {d["jobKey"]: d["_id"] for d in collection.collection.find()}
+    assert summary["upserted_ids"] == stored_ids
+
+    # A batch that fills up exactly is not followed by an empty one. Unchanged documents match without modifying.
+    collection.batch_sizes.clear()
+    summary = bulk_upsert(collection, job_updates([1, 2, 3, 4, 5, 6], "renamed"), "jobKey", batch_size=3)
+    assert collection.batch_sizes == [3, 3]
+    assert (summary["upserted"], summary["matched"], summary["modified"], summary["errors"]) == (0, 6, 6, 0)
+    summary = bulk_upsert(collection, job_updates([1, 2, 3], "renamed"), "jobKey", batch_size=3)
+    assert (summary["matched"], summary["modified"]) == (3, 0)
+
+def test_bulk_upsert_with_no_updates():
+    collection = RecordingCollection(mongomock.MongoClient()["MRSafetyDB"]["job"])
+    summary = bulk_upsert(collection, [], "jobKey", batch_size=3)
+    assert collection.batch_sizes == []
+    assert summary == {"upserted": 0, "modified": 0, "matched": 0, "errors": 0, "upserted_ids": {}}
+
+def test_bulk_upsert_reports_failed_records(capsys):
+    collection = mongomock.MongoClient()["MRSafetyDB"]["job"]
+    collection.create_index("jobCode", unique=True, sparse=True)
+    collection.insert_one({"jobKey": 99, "jobCode": 1003})
+    # Job 3 takes a jobCode that is already used, so only its write fails
+    updates = [(key, {"$set": {"jobKey": key, "jobCode": 1000 + key}}) for key in range(1, 6)]
+    summary = bulk_upsert(collection, updates, "jobKey", batch_size=3)
+    assert (summary["upserted"], summary["errors"]) == (4, 1)
+    assert set(summary["upserted_ids"]) == {1, 2, 4, 5}
+    assert "Error processing record jobKey=3" in capsys.readouterr().out
+    assert sorted(d["jobKey"] for d in collection.find()) == [1, 2, 4, 5, 99]
+
+def test_bulk_upsert_counts_a_failed_batch(capsys):
+    collection = RecordingCollection(mongomock.MongoClient()["MRSafetyDB"]["job"], fail_batches=[2])
+    summary = bulk_upsert(collection, job_updates(range(1, 8)), "jobKey", batch_size=3)
+    assert collection.batch_sizes == [3, 3, 1]
+    assert (summary["upserted"], summary["errors"]) == (4, 3)
+    assert set(summary["upserted_ids"]) == {1, 2, 3, 7}
+    assert "Error processing batch 2 (3 records)" in capsys.readouterr().out
+
+def test_resolver_counts_unique_keys(capsys):
+    collection = mongomock.MongoClient()["MRSafetyDB"]["staff"]
+    staff_ids = {key: collection.insert_one({"staffKey": key}).inserted_id for key in (1, 2, 3)}
+    resolver = ObjectIdResolver(collection, "staffKey")
+
+    # 1 and 2 are queried once each and 9 is not found. The repeats of 1 are not counted again.
+    assert resolver.resolve_many([1, 1, 2, 9, 1]) == [staff_ids[1], staff_ids[1], staff_ids[2], staff_ids[1]]
+    assert (resolver.hits, resolver.misses, resolver.not_found_lookups) == (0, 3, 1)
+
+    # Cached keys are hits; 9 is already known not to exist, so it is neither queried nor a hit
+    assert resolver.resolve_many([2, 2, 9, 9, 3]) == [staff_ids[2], staff_ids[2], staff_ids[3]]
+    assert (resolver.hits, resolver.misses, resolver.not_found_lookups) == (1, 4, 2)
+
+    assert resolver.resolve(1) == staff_ids[1]
+    assert resolver.resolve(9) is None
+    assert resolver.resolve(8) is None
+    assert (resolver.hits, resolver.misses, resolver.not_found_lookups) == (2, 5, 4)
+
+    resolver.report()
+    assert "staffKey lookups: 2 from cache, 5 queried, 4 not found (2 distinct keys)" in capsys.readouterr().out
+
+def test_grouping_an_empty_frame():
+    df = pd.DataFrame({"JobId": pd.Series([], dtype="Int64"), "StaffId": pd.Series([], dtype="Int64")})
+    assert group_values(df, "JobId", "StaffId") == {}
+    assert group_records(df, "JobId", {"staff": "StaffId"}) == {}
+
+def test_grouping_rows_without_keys():
+    df = pd.DataFrame({"JobId": pd.Series([None, None], dtype="Int64"), "StaffId": [1, 2]})
+    assert group_values(df, "JobId", "StaffId") == {}
+
+def test_jobs_without_children_are_synced(run_mongodb_etl, mongo_client):
+    run_mongodb_etl()
+    documents = job_documents(mongo_client)
+    assert [d["jobKey"] for d in documents] == list(range(1, 41))
+    # Every fifth job has no query, CRIS comment, statuses, actions, staff or x-ray checks
+    for document in documents[4::5]:
+        assert document["statusLog"] == []
+        assert document["safetyInvestigation"]["staffAssigned"] == []
+        assert "xrayCheckedBy" not in document["safetyInvestigation"]
+        assert "actionLog" not in document["safetyInvestigation"]
+
+def test_chunked_sync_matches_full_sync(run_mongodb_etl, mongo_client):
+    etl = run_mongodb_etl()
+    full_documents = job_documents(mongo_client)
+    mongo_client["MRSafetyDB"]["job"].delete_many({})
+    # Chunks of 3 jobs include chunks where no job has x-ray checks or staff assigned
+    assert etl["sync_jobs"](None, 3) == (40, 0)
+    assert job_documents(mongo_client) == full_documents
+
+def test_incremental_sync_of_a_job_without_children(run_mongodb_etl, mongo_client, oltp_engine):
+    etl = run_mongodb_etl()
+    full_documents = job_documents(mongo_client)
+    # Job 3 has statuses but no actions, staff or x-ray checks
+    with oltp_engine.begin() as connection:
+        connection.execute(text("UPDATE StatusLog SET ModifiedDate = datetime('now', '+1 minute') WHERE JobId = 3"))
+    for chunk_size in (None, 3):
+        assert etl["sync_jobs"](etl["run_started"], chunk_size) == (1, 0)
+    assert job_documents(mongo_client) == full_documents
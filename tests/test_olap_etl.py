@@ -0,0 +1,271 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+
+from olap_etl import (
+    aggregate_columns, aggregate_delta, aggregate_tables, bridge_section, create_aggregate_tables, create_control_table,
+    date_dimension, date_keys, dimension_sections, fact_job_keys, fact_section, get_watermark, run_etl, set_watermark, update_aggregates
+)
+
+@pytest.fixture
+def olap_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'olap.sqlite'}")
+    yield engine
+    engine.dispose()
+
+# FactJob's aggregate columns for each job, with some of every key missing
+def fact_jobs(job_ids, seed):
+    rng = np.random.default_rng(seed)
+    choices = {
+        "SiteKey": [1, 2, None],
+        "DateJobLoggedKey": [20240105, 20240520, None],
+        "DateQueryReceivedKey": [20240110, 20241001, None],
+        "ImplantKey": [1, 2, 3, None],
+        "MRSafetyKey": [1, 2, None],
+        "CurrentStatusKey": [1, 2, None],
+        "PhysicsTargetDateKey": [20240201, 20240301, None],
+    }
+    df = pd.DataFrame({"JobId": list(job_ids)}, dtype="Int64")
+    for column, values in choices.items():
+        df[column] = pd.array([values[i] for i in rng.integers(len(values), size=len(df))], dtype="Int64")
+    return df[aggregate_columns]
+
+# Replace FactJob with df_fact and stage the given jobs in JobKeys_Stage, as load_fact_job leaves them
+def merge_fact_job(olap_engine, df_fact, staged_jobs):
+    df_fact.to_sql("FactJob", olap_engine, if_exists="replace", index=False)
+    pd.DataFrame({"JobId": staged_jobs}, dtype="int64").to_sql("JobKeys_Stage", olap_engine, if_exists="replace", index=False)
+
+# Every aggregate table, in grain order
+def aggregate_counts(olap_engine):
+    return {
+        table_name: pd.read_sql(text(f"SELECT * FROM {table_name} ORDER BY {', '.join(grain)}"), olap_engine)[grain + counts].astype("int64")
+        for table_name, (grain, counts) in aggregate_tables.items()
+    }
+
+# The aggregate tables counted from scratch over the whole of df_fact
+def expected_counts(df_fact):
+    deltas = aggregate_delta(pd.DataFrame(columns=aggregate_columns, dtype="Int64"), df_fact)
+    return {
+        table_name: deltas[table_name].sort_values(grain, ignore_index=True)
+        for table_name, (grain, counts) in aggregate_tables.items()
+    }
+
+def assert_counts_match(olap_engine, df_fact):
+    counts = aggregate_counts(olap_engine)
+    for table_name, expected in expected_counts(df_fact).items():
+        pd.testing.assert_frame_equal(counts[table_name], expected, check_dtype=False)
+    counted = pd.read_sql(text(f"SELECT {', '.join(aggregate_columns)} FROM AggJobState ORDER BY JobId"), olap_engine).astype("Int64")
+    pd.testing.assert_frame_equal(counted, df_fact.sort_values("JobId", ignore_index=True))
+
+# The two TOP 1 subqueries the FactJob MERGE used before the keys were staged: the current status from every
+# status of the job, and its date key from the latest status whose ChangedDate is in DimDate
+def baseline_current_status(df_status, job_id, valid_keys):
+    def top_1(rows):
+        rows = sorted(rows, key=lambda row: (row.ChangedDate is not None, row.ChangedDate or datetime.min, row.JobStatusId))
+        return rows[-1] if rows else None
+
+    rows = [row for row in df_status.itertuples() if row.JobId == job_id]
+    current = top_1(rows)
+    dated = top_1([row for row in rows if row.ChangedDate is not None and int(row.ChangedDate.strftime("%Y%m%d")) in valid_keys])
+    return (
+        current.StatusId if current else None,
+        int(dated.ChangedDate.strftime("%Y%m%d")) if dated else None,
+    )
+
+# DATEPART(WEEK/ISO_WEEK/WEEKDAY/QUARTER, day) as SQL Server gives them with its default DATEFIRST 7, counted out
+# one day at a time: weekdays run 1 = Sunday to 7 = Saturday, week 1 holds 1 January and each Sunday starts a new week
+def baseline_datepart(day):
+    day_of_week = (day.weekday() + 1) % 7 + 1
+    sundays_since_new_year = sum(
+        1 for n in range(1, day.timetuple().tm_yday) if (date(day.year, 1, 1) + timedelta(days=n)).weekday() == 6
+    )
+    return {
+        "Week": 1 + sundays_since_new_year,
+        "IsoWeek": day.isocalendar()[1],
+        "DayOfWeek": day_of_week,
+        "Quarter": (day.month - 1) // 3 + 1,
+    }
+
+@pytest.mark.parametrize("day, expected", [
+    # 1 January on a Sunday is in week 1 but ISO week 52 of the year before
+    (date(2023, 1, 1), {"Week": 1, "IsoWeek": 52, "DayOfWeek": 1, "Quarter": 1}),
+    (date(2023, 1, 7), {"Week": 1, "IsoWeek": 1, "DayOfWeek": 7, "Quarter": 1}),
+    (date(2023, 1, 8), {"Week": 2, "IsoWeek": 1, "DayOfWeek": 1, "Quarter": 1}),
+    # 1 January on a Saturday is a week on its own
+    (date(2022, 1, 1), {"Week": 1, "IsoWeek": 52, "DayOfWeek": 7, "Quarter": 1}),
+    (date(2022, 1, 2), {"Week": 2, "IsoWeek": 52, "DayOfWeek": 1, "Quarter": 1}),
+    # 31 December in ISO week 1 of the next year, and in week 53
+    (date(2024, 12, 31), {"Week": 53, "IsoWeek": 1, "DayOfWeek": 3, "Quarter": 4}),
+    (date(2020, 12, 31), {"Week": 53, "IsoWeek": 53, "DayOfWeek": 5, "Quarter": 4}),
+    (date(2021, 1, 3), {"Week": 2, "IsoWeek": 53, "DayOfWeek": 1, "Quarter": 1}),
+    # Leap day
+    (date(2024, 2, 29), {"Week": 9, "IsoWeek": 9, "DayOfWeek": 5, "Quarter": 1}),
+    (date(2024, 3, 31), {"Week": 14, "IsoWeek": 13, "DayOfWeek": 1, "Quarter": 1}),
+    (date(2024, 4, 1), {"Week": 14, "IsoWeek": 14, "DayOfWeek": 2, "Quarter": 2}),
+])
+def test_date_dimension_matches_datepart_on_edge_dates(day, expected):
+    assert baseline_datepart(day) == expected
+    row = date_dimension(day, day).iloc[0]
+    assert {column: row[column] for column in expected} == expected
+    assert row["DateKey"] == int(day.strftime("%Y%m%d"))
+    assert row["IsWeekend"] == (expected["DayOfWeek"] in (1, 7))
+
+def test_date_dimension_matches_datepart_on_every_day():
+    df = date_dimension()
+    assert df["FullDate"].iloc[[0, -1]].tolist() == [pd.Timestamp("2020-01-01"), pd.Timestamp("2030-12-31")]
+    expected = pd.DataFrame([baseline_datepart(day.date()) for day in df["FullDate"]])
+    pd.testing.assert_frame_equal(df[expected.columns], expected, check_dtype=False)
+    assert df["DateKey"].is_unique and df["DateKey"].is_monotonic_increasing
+
+def test_date_keys_are_yyyymmdd_with_missing_dates_null():
+    values = pd.Series([datetime(2024, 2, 29, 23, 59), None, datetime(1969, 12, 31), datetime(2031, 1, 1)], index=[5, 6, 7, 8])
+    keys = date_keys(values)
+    assert keys.dtype == "Int64" and keys.index.tolist() == [5, 6, 7, 8]
+    assert keys.tolist() == [20240229, pd.NA, 19691231, 20310101]
+
+    # Keys that are not in DimDate are null too, as from a LEFT JOIN to it
+    valid_keys = date_dimension()["DateKey"].to_numpy()
+    assert date_keys(values, valid_keys).tolist() == [20240229, pd.NA, pd.NA, pd.NA]
+    assert date_keys(pd.DatetimeIndex(["2020-01-01", None])).tolist() == [20200101, pd.NA]
+
+def test_current_status_date_skips_statuses_not_in_dim_date():
+    valid_keys = date_dimension("2024-01-01", "2024-12-31")["DateKey"].to_numpy(dtype="int64")
+    df_status = pd.DataFrame.from_records([
+        # Job 1: the status logged last has no ChangedDate, so it is neither current nor dated
+        (1, 1, 1, datetime(2024, 1, 5, 10)),
+        (2, 1, 2, None),
+        # Job 2: the current status changed after the end of DimDate, so the date is the previous status's
+        (3, 2, 1, datetime(2024, 2, 1, 9)),
+        (4, 2, 3, datetime(2031, 1, 1, 9)),
+        # Job 3: no status has a date
+        (5, 3, 4, None),
+        # Job 4: two statuses changed at the same time, and the one logged last wins both
+        (6, 4, 2, datetime(2024, 3, 1, 12)),
+        (7, 4, 5, datetime(2024, 3, 1, 12)),
+    ], columns=["JobStatusId", "JobId", "StatusId", "ChangedDate"])
+    df_status["ChangedDate"] = pd.to_datetime(df_status["ChangedDate"])
+    df_jobs = pd.DataFrame({"JobId": [1, 2, 3, 4, 5]})
+    for column in ["DateJobLogged", "DateMRIRequested", "DateMRIPlanned", "PTLTargetDate", "PhysicsTargetDate"]:
+        df_jobs[column] = pd.NaT
+    df_queries = pd.DataFrame({"QueryId": [], "JobId": [], "DateQueryReceived": pd.to_datetime([])})
+
+    df_job_keys, _ = fact_job_keys(df_jobs, df_queries, df_status, valid_keys)
+    keys = {
+        row.JobId: (None if pd.isna(row.CurrentStatusKey) else row.CurrentStatusKey, None if pd.isna(row.DateCurrentStatusKey) else row.DateCurrentStatusKey)
+        for row in df_job_keys.itertuples()
+    }
+    reference = df_status.astype(object).where(df_status.notna(), None)
+    assert keys == {job_id: baseline_current_status(reference, job_id, set(valid_keys)) for job_id in range(1, 6)}
+    assert keys[2] == (3, 20240201)
+    assert keys[3] == (4, None)
+    assert np.isin(df_job_keys["DateCurrentStatusKey"].dropna(), valid_keys).all()
+
+def test_aggregates_are_built_when_the_tables_were_created_empty(olap_engine):
+    df_fact = fact_jobs(range(1, 31), seed=1)
+    merge_fact_job(olap_engine, df_fact, staged_jobs=[1, 2])
+    # As Create_Tables_MRSafetyDB_OLAP.sql leaves them: the tables exist, but no job has been counted
+    create_aggregate_tables(olap_engine)
+    update_aggregates(olap_engine)
+    assert_counts_match(olap_engine, df_fact)
+
+    # Now that every job is counted, a later load only reads the staged jobs
+    df_fact.loc[df_fact["JobId"] == 2, "ImplantKey"] = 3
+    merge_fact_job(olap_engine, df_fact, staged_jobs=[2])
+    deltas = update_aggregates(olap_engine)
+    assert deltas["AggJobsBySiteQuarter"].empty
+    assert_counts_match(olap_engine, df_fact)
+
+def test_deleted_jobs_are_taken_out_of_the_aggregates(olap_engine):
+    df_fact = fact_jobs(range(1, 31), seed=2)
+    merge_fact_job(olap_engine, df_fact, staged_jobs=list(range(1, 31)))
+    update_aggregates(olap_engine)
+    assert_counts_match(olap_engine, df_fact)
+
+    # Jobs 3 and 4 are deleted from FactJob while job 5 changes and is staged
+    df_fact = df_fact[~df_fact["JobId"].isin([3, 4])].copy()
+    df_fact.loc[df_fact["JobId"] == 5, aggregate_columns[1:]] = fact_jobs([5], seed=3)[aggregate_columns[1:]].to_numpy()
+    merge_fact_job(olap_engine, df_fact, staged_jobs=[5])
+    update_aggregates(olap_engine)
+    assert_counts_match(olap_engine, df_fact)
+
+    # A deletion is taken out even when no job was staged
+    df_fact = df_fact[df_fact["JobId"] != 10]
+    merge_fact_job(olap_engine, df_fact, staged_jobs=[])
+    update_aggregates(olap_engine)
+    assert_counts_match(olap_engine, df_fact)
+
+# Stand-in for ETL_MRSafetyDB_OLAP.sql, whose T-SQL does not run on SQLite: the dimension and bridge sections do
+# nothing, and the FactJob section copies the staged keys into FactJob. failing names the sections that raise.
+def etl_sections(failing=()):
+    sections = {section: "SELECT 1" for section in [*dimension_sections.values(), bridge_section]}
+    sections[fact_section] = (
+        f"INSERT OR REPLACE INTO FactJob ({', '.join(aggregate_columns)}) "
+        f"SELECT JobId, NULL, DateJobLoggedKey, NULL, NULL, NULL, CurrentStatusKey, PhysicsTargetDateKey FROM JobKeys_Stage"
+    )
+    for section in failing:
+        sections[section] = "SELECT * FROM NoSuchTable"
+    return sections
+
+@pytest.fixture
+def fact_job(olap_engine):
+    with olap_engine.begin() as connection:
+        connection.execute(text(f"CREATE TABLE FactJob (JobId INTEGER PRIMARY KEY, {', '.join(f'{column} INT' for column in aggregate_columns[1:])})"))
+    return olap_engine
+
+def watermarks(olap_engine):
+    return {table_name: get_watermark(olap_engine, table_name) for table_name in [*dimension_sections, "DimDate", "FactJob", "BridgeStaffAssigned"]}
+
+def test_watermarks_only_move_forward_for_tables_that_loaded(oltp_engine, fact_job):
+    olap_engine = fact_job
+    create_control_table(olap_engine)
+    last_run = datetime(2024, 6, 1, 8, 0)
+    for table_name in ["DimSite", "DimStaff", "FactJob"]:
+        set_watermark(olap_engine, table_name, last_run)
+
+    # DimSite fails, so FactJob and the bridge are not loaded either, and their watermarks stay where they were
+    loaded = run_etl(oltp_engine, olap_engine, sections=etl_sections(failing=[dimension_sections["DimSite"]]))
+    assert not loaded["DimSite"] and "FactJob" not in loaded
+    after_failure = watermarks(olap_engine)
+    assert after_failure["DimSite"] == after_failure["FactJob"] == last_run
+    assert after_failure["BridgeStaffAssigned"] is None
+    run_started = after_failure["DimStaff"]
+    assert run_started > last_run
+    assert all(after_failure[table_name] == run_started for table_name in loaded if table_name != "DimSite")
+    assert pd.read_sql(text("SELECT COUNT(*) AS n FROM FactJob"), olap_engine)["n"][0] == 0
+
+    # A failed FactJob load leaves its watermark alone and skips the bridge
+    loaded = run_etl(oltp_engine, olap_engine, sections=etl_sections(failing=[fact_section]))
+    assert all(loaded[table_name] for table_name in [*dimension_sections, "DimDate"])
+    assert not loaded["FactJob"] and "BridgeStaffAssigned" not in loaded
+    after_fact_failure = watermarks(olap_engine)
+    assert after_fact_failure["DimSite"] >= run_started
+    assert after_fact_failure["FactJob"] == last_run and after_fact_failure["BridgeStaffAssigned"] is None
+
+    # Once everything loads, every watermark moves on to the start of that run
+    loaded = run_etl(oltp_engine, olap_engine, sections=etl_sections())
+    assert all(loaded.values()) and len(loaded) == len(dimension_sections) + 3
+    after_success = watermarks(olap_engine)
+    assert len(set(after_success.values())) == 1
+    assert after_success["FactJob"] >= after_fact_failure["DimSite"] > last_run
+
+def test_a_second_run_stages_only_jobs_changed_since_the_watermark(oltp_engine, fact_job):
+    olap_engine = fact_job
+    run_etl(oltp_engine, olap_engine, sections=etl_sections())
+    job_ids = pd.read_sql(text("SELECT JobId FROM Job ORDER BY JobId"), oltp_engine)["JobId"].tolist()
+    staged = pd.read_sql(text("SELECT JobId FROM JobKeys_Stage ORDER BY JobId"), olap_engine)["JobId"].tolist()
+    assert staged == job_ids
+
+    # Job 3 is edited, job 7 gets a new query and job 12 a new status; nothing else changes
+    with oltp_engine.begin() as connection:
+        connection.execute(text("UPDATE Job SET ModifiedDate = datetime('now') WHERE JobId = 3"))
+        connection.execute(text("INSERT INTO Query (JobId, DateQueryReceived, ModifiedDate) VALUES (7, '2024-05-01 10:00:00', datetime('now'))"))
+        connection.execute(text("INSERT INTO StatusLog (JobId, StatusId, ChangedDate, ModifiedDate) VALUES (12, 2, '2024-05-02 10:00:00', datetime('now'))"))
+    run_etl(oltp_engine, olap_engine, sections=etl_sections())
+    staged = pd.read_sql(text("SELECT JobId FROM JobKeys_Stage ORDER BY JobId"), olap_engine)["JobId"].tolist()
+    assert staged == [3, 7, 12]
+    assert pd.read_sql(text("SELECT DateQueryReceivedKey FROM QueryKeys_Stage"), olap_engine)["DateQueryReceivedKey"].max() == 20240501
+    # The jobs not staged keep the rows the first run loaded
+    assert pd.read_sql(text("SELECT JobId FROM FactJob ORDER BY JobId"), olap_engine)["JobId"].tolist() == job_ids
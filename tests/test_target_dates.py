@@ -0,0 +1,95 @@
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+from sqlalchemy import text
+
+from target_dates import target_date_trigger_sql, target_date_update_sql, update_target_dates
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The CASE expressions the job query used before the target dates were stored, one row at a time
+def baseline_target_dates(urgency_code, patient_type, requested, planned, received):
+    def case(base):
+        if urgency_code in (1, 3, 5) and patient_type == "Inpatient":
+            return base
+        offsets = {(1, "Outpatient"): 28, (3, "Outpatient"): 14, (5, "Outpatient"): 7}
+        if (urgency_code, patient_type) in offsets:
+            return base + timedelta(days=offsets[urgency_code, patient_type]) if base else None
+        if urgency_code == 9:
+            return planned - timedelta(days=28) if planned else None
+        if urgency_code in (7, 15):
+            return base + timedelta(days=2) if base else None
+        return base + timedelta(days=14) if base else None
+    return case(requested), case(received)
+
+# Stored target dates and the baseline ones for every job, worked out from the job's latest query
+def stored_and_expected(engine):
+    df = pd.read_sql(text("""
+        SELECT j.JobId, u.UrgencyCode, pt.PatientTypeName, j.DateMRIRequested, j.DateMRIPlanned, j.PTLTargetDate,
+            j.PhysicsTargetDate, q.QueryId, q.DateQueryReceived
+        FROM Job j
+        LEFT JOIN Urgency u ON j.UrgencyId = u.UrgencyId
+        LEFT JOIN PatientType pt ON j.PatientTypeId = pt.PatientTypeId
+        LEFT JOIN Query q ON q.JobId = j.JobId
+        """), engine)
+    df = df.sort_values(["JobId", "DateQueryReceived", "QueryId"], na_position="first").drop_duplicates("JobId", keep="last")
+    df = df.astype(object).where(df.notna(), None)
+    stored = {row.JobId: (row.PTLTargetDate, row.PhysicsTargetDate) for row in df.itertuples()}
+    expected = {
+        row.JobId: baseline_target_dates(row.UrgencyCode, row.PatientTypeName, row.DateMRIRequested, row.DateMRIPlanned, row.DateQueryReceived)
+        for row in df.itertuples()
+    }
+    return stored, expected
+
+def test_target_dates_are_stored_per_job(oltp_engine):
+    # Job 2 gets a second, later query and job 6 an undated one, which does not replace its dated query
+    with oltp_engine.begin() as connection:
+        connection.execute(text("INSERT INTO Query (JobId, DateQueryReceived) VALUES (2, :received)"), {"received": datetime(2024, 3, 1)})
+        connection.execute(text("INSERT INTO Query (JobId, DateQueryReceived) VALUES (6, NULL)"))
+
+    updated = update_target_dates(oltp_engine)
+    stored, expected = stored_and_expected(oltp_engine)
+    assert stored == expected
+    assert updated["PTLTargetDate"] > 0 and updated["PhysicsTargetDate"] > 0
+    # Job 25 has no query, but its urgency (code 9) takes the Physics target from the MRI planned date
+    assert stored[25][1] == datetime(2024, 1, 26, 9, 30) + timedelta(days=40 - 28)
+    # Job 2 (urgency 5, inpatient) is due the day its latest query was received
+    assert stored[2][1] == datetime(2024, 3, 1)
+
+    # Nothing has changed, so nothing is written the second time
+    assert update_target_dates(oltp_engine) == {"PTLTargetDate": 0, "PhysicsTargetDate": 0}
+
+def test_target_date_update_sql_reads_the_latest_query():
+    ptl_update, physics_update = target_date_update_sql().split("\n\n")
+    assert ptl_update.startswith("UPDATE j\nSET PTLTargetDate") and "Query" not in ptl_update
+    assert physics_update.startswith("UPDATE j\nSET PhysicsTargetDate")
+    assert "ORDER BY DateQueryReceived DESC, QueryId DESC" in physics_update
+
+# An SQL script from the repo, with Windows line endings turned into "\n"
+def read_sql_script(file_name):
+    with open(os.path.join(repo_dir, file_name), newline="") as f:
+        return f.read().replace("\r\n", "\n")
+
+def test_insert_data_script_has_the_generated_update():
+    script = read_sql_script("Insert_Data_MRSafetyDB.sql")
+    block = script.split("/****CALCULATE TARGET DATES****/\n")[1].split("\n\n/****")[0]
+    comment, update = block.split("\n\n", 1)
+    assert '"python target_dates.py --print-sql"' in comment
+    assert update == target_date_update_sql()
+
+def test_triggers_script_has_the_generated_target_date_triggers():
+    assert target_date_trigger_sql() in read_sql_script("Create_Triggers_MRSafetyDB.sql")
+
+def test_target_date_triggers_only_update_the_jobs_they_fired_for():
+    job_trigger, query_trigger = target_date_trigger_sql().split("GO\n")[:2]
+    # Job changes can move either target; query changes only the Physics target, including when a query is deleted
+    assert "SET PTLTargetDate" in job_trigger and "SET PhysicsTargetDate" in job_trigger
+    assert "SET PTLTargetDate" not in query_trigger and "AFTER INSERT, UPDATE, DELETE" in query_trigger
+    assert job_trigger.count("AND j.JobId IN (SELECT JobId FROM Inserted);") == 2
+    assert query_trigger.count("AND j.JobId IN (SELECT JobId FROM Inserted UNION SELECT JobId FROM Deleted);") == 1
+    # Updates that only touch ModifiedDate or the stored targets return before recalculating, so the triggers
+    # do not keep firing each other
+    assert "NOT (UPDATE(UrgencyId) OR UPDATE(PatientTypeId) OR UPDATE(DateMRIPlanned) OR UPDATE(DateMRIRequested))" in job_trigger
+    assert "NOT (UPDATE(JobId) OR UPDATE(DateQueryReceived))" in query_trigger
+    assert "ModifiedDate" not in job_trigger + query_trigger and "UPDATE(PTLTargetDate)" not in job_trigger